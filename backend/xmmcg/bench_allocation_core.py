@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+竞标分配核心算法基准测试（不访问数据库）
+
+直接在合成的 (user_id, target_id, amount) 数组上运行 songs.allocation.greedy_allocate，
+比较 python / numpy 两种计算后端的耗时，并校验分配结果满足约束：
+每个用户至多中标一次、每个目标至多一个中标者、中标者是该目标剩余出价中的最高者。
+
+使用方法：
+    python bench_allocation_core.py
+    python bench_allocation_core.py --sizes 10000 1000000 --repeat 3
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from songs import allocation
+
+
+def make_bids(num_bids, seed, bids_per_user=5):
+    """生成合成竞标：用户数 = 竞标数 / bids_per_user，目标数约为用户数的一半"""
+    rng = random.Random(seed)
+    num_users = max(1, num_bids // bids_per_user)
+    num_targets = max(1, num_users // 2)
+    user_ids = [i // bids_per_user for i in range(num_bids)]
+    target_ids = [rng.randrange(num_targets) for _ in range(num_bids)]
+    amounts = [rng.randint(1, 50) * 10 for _ in range(num_bids)]
+    return user_ids, target_ids, amounts
+
+
+def check_outcome(user_ids, target_ids, amounts, winners):
+    """校验贪心分配的不变量"""
+    won_users = set()
+    won_targets = {}
+    for idx in winners:
+        assert user_ids[idx] not in won_users, '用户重复中标'
+        assert target_ids[idx] not in won_targets, '目标重复分配'
+        won_users.add(user_ids[idx])
+        won_targets[target_ids[idx]] = amounts[idx]
+    # 任何落选竞标：要么用户已中标，要么目标被不低于其出价的竞标拿走
+    for idx in range(len(amounts)):
+        if user_ids[idx] in won_users:
+            continue
+        assert target_ids[idx] in won_targets, '存在未被分配但有人竞标的目标'
+        assert won_targets[target_ids[idx]] >= amounts[idx], '中标价低于落选价'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='竞标分配核心算法基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=20240601)
+    parser.add_argument('--no-check', action='store_true', help='跳过结果校验')
+    args = parser.parse_args()
+
+    backends = ['python'] + (['numpy'] if allocation.np is not None else [])
+    if allocation.np is None:
+        print('未安装 NumPy，仅测试 python 后端')
+
+    print('=' * 60)
+    print(f"{'bids':>9} | {'backend':>7} | {'best (s)':>9} | {'winners':>8}")
+    print('-' * 60)
+    for size in args.sizes:
+        user_ids, target_ids, amounts = make_bids(size, args.seed)
+        if allocation.np is not None:
+            # numpy 后端接受数组输入，省去列表转换的开销
+            arrays = tuple(allocation.np.asarray(x, dtype=allocation.np.int64)
+                           for x in (user_ids, target_ids, amounts))
+        for backend in backends:
+            inputs = arrays if backend == 'numpy' else (user_ids, target_ids, amounts)
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                outcome = allocation.greedy_allocate(*inputs, seed=args.seed, backend=backend)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            if not args.no_check:
+                check_outcome(user_ids, target_ids, amounts, outcome['winners'])
+            print(f"{size:>9} | {backend:>7} | {best:>9.3f} | {len(outcome['winners']):>8}")
+    print('=' * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+分配公平性模拟基准测试（不访问数据库）
+
+在合成的紧凑快照上运行 songs.allocation_simulation.run_simulation，
+比较单进程与进程池的耗时，并校验两者的统计结果完全相同。
+
+使用方法：
+    python bench_allocation_simulation.py
+    python bench_allocation_simulation.py --users 100 300 --runs 2000 --workers 8
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from array import array
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from songs import allocation_simulation
+
+
+def make_snapshot(num_users, seed, bids_per_user=5):
+    """生成合成的谱面竞标快照：目标数约为用户数的 70%，每个目标随机指定一个拥有者"""
+    rng = random.Random(seed)
+    num_targets = max(1, num_users * 7 // 10)
+    user_ids = [user for user in range(num_users) for _ in range(bids_per_user)]
+    return {
+        'bidding_type': 'chart',
+        'user_keys': list(range(num_users)),
+        'target_keys': list(range(num_targets)),
+        'user_ids': array('q', user_ids),
+        'target_ids': array('q', (rng.randrange(num_targets) for _ in user_ids)),
+        'amounts': array('q', (rng.randint(1, 20) * 10 for _ in user_ids)),
+        'targets': array('q', range(num_targets)),
+        'owners': array('q', (rng.randrange(num_users) for _ in range(num_targets))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分配公平性模拟基准测试')
+    parser.add_argument('--users', type=int, nargs='+', default=[50, 100, 300])
+    parser.add_argument('--runs', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--variants', nargs='+', default=allocation_simulation.default_variants('chart'))
+    parser.add_argument('--seed', type=int, default=20240601)
+    args = parser.parse_args()
+
+    print('=' * 72)
+    print(f"{'users':>6} | {'bids':>6} | {'variant':>13} | {'serial (s)':>10} | {'pool (s)':>9} | {'fallback':>8}")
+    print('-' * 72)
+    for num_users in args.users:
+        snapshot = make_snapshot(num_users, args.seed)
+        for variant in args.variants:
+            start = time.perf_counter()
+            serial = allocation_simulation.run_simulation(snapshot, [variant], args.runs, workers=1)
+            serial_time = time.perf_counter() - start
+            start = time.perf_counter()
+            pooled = allocation_simulation.run_simulation(snapshot, [variant], args.runs, workers=args.workers)
+            pool_time = time.perf_counter() - start
+            assert serial['variants'] == pooled['variants'], '进程池结果与单进程不一致'
+            print(f"{num_users:>6} | {len(snapshot['amounts']):>6} | {variant:>13} | {serial_time:>10.2f} | "
+                  f"{pool_time:>9.2f} | {serial['variants'][0]['fallback_rate']:>8.1%}")
+    print('=' * 72)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+竞标分配策略对比脚本（greedy 价高者得 vs optimal 最优匹配，不访问数据库）
+
+在合成竞标数据上分别运行 songs.allocation.greedy_allocate 与 optimal_allocate，
+比较耗时、中标人数、未中标（需要保底）人数以及中标出价总和；
+并在小规模随机数据上用穷举校验 optimal 的结果确为最优。
+
+使用方法：
+    python bench_allocation_strategy.py
+    python bench_allocation_strategy.py --sizes 10000 50000 --skew 3
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import itertools
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from songs import allocation
+from bench_allocation_core import make_bids
+
+
+def skew_targets(target_ids, skew, seed):
+    """把目标分布变得更集中（skew > 1 时热门目标被更多人竞标）"""
+    if skew <= 1:
+        return target_ids
+    rng = random.Random(seed)
+    num_targets = max(target_ids) + 1
+    return [int(num_targets * rng.random() ** skew) for _ in target_ids]
+
+
+def brute_force_best(user_ids, target_ids, amounts):
+    """穷举每个用户的选择（某条竞标或不中标），返回最大中标总额"""
+    options = {}
+    for user_id, target_id, amount in zip(user_ids, target_ids, amounts):
+        options.setdefault(user_id, [(None, 0)]).append((target_id, amount))
+    best = 0
+    for combo in itertools.product(*options.values()):
+        targets = [target for target, _ in combo if target is not None]
+        if len(targets) == len(set(targets)):
+            best = max(best, sum(amount for _, amount in combo))
+    return best
+
+
+def verify_small(trials, seed):
+    """小规模随机数据上与穷举结果对比"""
+    rng = random.Random(seed)
+    for trial in range(trials):
+        num_bids = rng.randint(0, 12)
+        user_ids = [rng.randrange(5) for _ in range(num_bids)]
+        target_ids = [rng.randrange(5) for _ in range(num_bids)]
+        amounts = [rng.randint(1, 6) for _ in range(num_bids)]
+        winners = allocation.optimal_allocate(user_ids, target_ids, amounts, seed=trial)['winners']
+        assert len({user_ids[i] for i in winners}) == len(winners), '用户重复中标'
+        assert len({target_ids[i] for i in winners}) == len(winners), '目标重复分配'
+        assert sum(amounts[i] for i in winners) == brute_force_best(user_ids, target_ids, amounts), \
+            f'非最优解: {user_ids} {target_ids} {amounts}'
+
+
+def summarize(user_ids, amounts, winners):
+    """中标人数、未中标（需要保底）人数、中标出价总和"""
+    losers = len(set(user_ids)) - len(winners)
+    return len(winners), losers, sum(amounts[i] for i in winners)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='竞标分配策略对比')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--skew', type=float, default=3.0,
+                        help='目标热度偏斜程度（1 为均匀分布）')
+    parser.add_argument('--seed', type=int, default=20240601)
+    parser.add_argument('--verify-trials', type=int, default=300,
+                        help='小规模穷举校验的次数（0 表示跳过）')
+    args = parser.parse_args()
+
+    if args.verify_trials:
+        verify_small(args.verify_trials, args.seed)
+        print(f'穷举校验通过（{args.verify_trials} 组小规模数据）')
+
+    print('=' * 72)
+    print(f"{'bids':>8} | {'strategy':>8} | {'seconds':>8} | {'winners':>8} | {'losers':>8} | {'total bid':>10}")
+    print('-' * 72)
+    for size in args.sizes:
+        user_ids, target_ids, amounts = make_bids(size, args.seed)
+        target_ids = skew_targets(target_ids, args.skew, args.seed)
+        for strategy in ('greedy', 'optimal'):
+            start = time.perf_counter()
+            if strategy == 'greedy':
+                outcome = allocation.greedy_allocate(user_ids, target_ids, amounts,
+                                                     seed=args.seed, backend='python')
+            else:
+                outcome = allocation.optimal_allocate(user_ids, target_ids, amounts, seed=args.seed)
+            elapsed = time.perf_counter() - start
+            winners, losers, total = summarize(user_ids, amounts, outcome['winners'])
+            print(f'{size:>8} | {strategy:>8} | {elapsed:>8.3f} | {winners:>8} | {losers:>8} | {total:>10}')
+    print('=' * 72)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+竞标分配性能对比脚本（legacy 逐条写入 vs bulk 批量写入）
+
+在临时测试数据库中生成合成竞标数据，分别用两种引擎执行
+BiddingService.allocate_bids，统计 SQL 查询数与耗时，并在相同随机种子下
+校验两种引擎的分配结果是否一致。
+
+两种引擎的随机数消耗顺序相同（保底阶段都使用 TargetPool），
+因此"一致"指：中标结果、保留的竞标、保底结果均相同，且保底目标互不重复、
+均不与中标目标冲突。
+
+使用方法：
+    python bench_bidding_allocation.py
+    python bench_bidding_allocation.py --sizes 1000 10000 100000 --legacy-limit 100000
+
+说明：
+    - 脚本使用 Django 测试数据库（SQLite 下为内存库），不会改动 db.sqlite3
+    - 每个用户出价 MAX_BIDS_PER_USER 次，目标数约为用户数的一半，保证有保底分配
+    - 竞标数超过 --legacy-limit 时跳过 legacy 引擎（其耗时随竞标数线性增长）
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import django
+
+sys.path.insert(0, os.path.abspath('.'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'xmmcg.settings')
+django.setup()
+
+from django.conf import settings
+from django.db import connection
+from django.contrib.auth.models import User
+from songs.models import Song, BiddingRound, Bid, BidResult, MAX_BIDS_PER_USER
+from songs.bidding_service import BiddingService
+from users.models import UserProfile
+
+# 与 legacy 对比结果时固定使用 python 计算后端（numpy 后端的同价排序使用不同的随机键）
+settings.BIDDING_ALLOCATION_BACKEND = 'python'
+
+
+def build_dataset(num_bids, seed):
+    """生成 num_bids 条歌曲竞标，返回竞标轮次"""
+    rng = random.Random(seed)
+    num_users = max(2, num_bids // MAX_BIDS_PER_USER)
+    num_songs = max(1, num_users // 2)
+
+    User.objects.bulk_create(
+        [User(username=f'bench_{i}') for i in range(num_users)],
+        batch_size=500
+    )
+    user_ids = list(User.objects.filter(username__startswith='bench_').values_list('id', flat=True))
+    UserProfile.objects.bulk_create(
+        [UserProfile(user_id=uid, token=10 ** 6) for uid in user_ids],
+        batch_size=500
+    )
+    Song.objects.bulk_create(
+        [Song(user_id=user_ids[i % len(user_ids)], title=f'bench song {i}',
+              audio_file=f'songs/bench_{i}.mp3', audio_hash='0' * 64, file_size=1)
+         for i in range(num_songs)],
+        batch_size=500
+    )
+    song_ids = list(Song.objects.values_list('id', flat=True))
+
+    bidding_round = BiddingRound.objects.create(name='bench', bidding_type='song', status='active')
+    bids = []
+    for uid in user_ids:
+        for song_id in rng.sample(song_ids, min(MAX_BIDS_PER_USER, len(song_ids))):
+            # 金额离散度低，制造大量同价竞标
+            bids.append(Bid(bidding_round=bidding_round, user_id=uid, bid_type='song',
+                            song_id=song_id, amount=rng.randint(1, 50) * 10))
+            if len(bids) >= num_bids:
+                break
+        if len(bids) >= num_bids:
+            break
+    Bid.objects.bulk_create(bids, batch_size=500)
+    return bidding_round
+
+
+def reset_round(bidding_round):
+    """恢复到分配前的状态，便于同一份数据重复分配"""
+    BidResult.objects.filter(bidding_round=bidding_round).delete()
+    Bid.objects.filter(bidding_round=bidding_round).update(is_dropped=False)
+    BiddingRound.objects.filter(id=bidding_round.id).update(status='active', completed_at=None)
+    UserProfile.objects.update(token=10 ** 6)
+
+
+def snapshot_results(bidding_round):
+    """
+    分配结果快照：(中标结果集合, 未 drop 的竞标集合, 保底结果集合)
+
+    同时校验保底目标合法（不重复、不与中标目标冲突），不合法时返回 None
+    """
+    rows = list(BidResult.objects.filter(bidding_round=bidding_round).values_list(
+        'user_id', 'song_id', 'bid_amount', 'allocation_type'
+    ))
+    wins = set(row for row in rows if row[3] == 'win')
+    random_rows = [row for row in rows if row[3] == 'random']
+    song_ids = [row[1] for row in rows]
+    if len(song_ids) != len(set(song_ids)):
+        return None
+    kept = set(Bid.objects.filter(bidding_round=bidding_round, is_dropped=False).values_list('id', flat=True))
+    return wins, kept, set(random_rows)
+
+
+class QueryCounter:
+    """统计执行的 SQL 条数（不受 DEBUG 查询日志 9000 条上限影响）"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_engine(bidding_round, engine, seed):
+    reset_round(bidding_round)
+    random.seed(seed)
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        start = time.perf_counter()
+        BiddingService.allocate_bids(bidding_round.id, engine=engine)
+        elapsed = time.perf_counter() - start
+    return elapsed, counter.count, snapshot_results(bidding_round)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='竞标分配引擎性能对比')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-limit', type=int, default=10000,
+                        help='竞标数超过该值时跳过 legacy 引擎')
+    parser.add_argument('--seed', type=int, default=20240601)
+    args = parser.parse_args()
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print('=' * 78)
+        print(f"{'bids':>8} | {'engine':>7} | {'queries':>8} | {'seconds':>8} | 结果一致")
+        print('-' * 78)
+        for size in args.sizes:
+            # 每个规模使用独立数据集
+            BiddingRound.objects.all().delete()
+            Song.objects.all().delete()
+            User.objects.filter(username__startswith='bench_').delete()
+            bidding_round = build_dataset(size, args.seed)
+
+            bulk = run_engine(bidding_round, 'bulk', args.seed)
+            legacy = None
+            if size <= args.legacy_limit:
+                legacy = run_engine(bidding_round, 'legacy', args.seed)
+
+            same = '-' if legacy is None else ('是' if bulk[2] is not None and legacy[2] == bulk[2] else '否')
+            if legacy is not None:
+                print(f'{size:>8} | {"legacy":>7} | {legacy[1]:>8} | {legacy[0]:>8.3f} |')
+            print(f'{size:>8} | {"bulk":>7} | {bulk[1]:>8} | {bulk[0]:>8.3f} | {same}')
+        print('=' * 78)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+互评任务分配基准测试（不访问数据库）
+
+在合成的谱面/评分者数据上比较：
+- scan：原 allocate_peer_reviews 的逐轮全量扫描贪心（每分配一个任务都重新计算所有谱面的合法评分者）
+- heap：songs.review_allocation.greedy_assign（合法评分者计数增量维护 + 优先队列）
+- flow：songs.review_allocation.flow_assign（最大流 + 二分最大任务数）
+
+scan 与 heap 的选择规则相同，scan 运行时会校验 heap 的分配结果与之完全一致；
+flow 的分配总数不少于 heap，总数相同时最大任务数不多于 heap。
+所有方法都校验分配满足约束：不评自己参与的谱面、不重复分配、不超过每人上限。
+
+使用方法：
+    python bench_peer_review_allocation.py
+    python bench_peer_review_allocation.py --sizes 100 1000 5000 --scan-limit 300
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from songs import review_allocation
+
+
+def make_charts(num_charts, seed, part_two_ratio=0.5):
+    """生成合成谱面：每个用户提交一张终稿，约一半谱面还有另一位一部分原作者"""
+    rng = random.Random(seed)
+    chart_ids = list(range(num_charts))
+    reviewer_ids = list(range(num_charts))
+    contributors = {}
+    for chart_id in chart_ids:
+        authors = {chart_id}
+        if num_charts > 1 and rng.random() < part_two_ratio:
+            other = rng.randrange(num_charts - 1)
+            authors.add(other + 1 if other >= chart_id else other)
+        contributors[chart_id] = authors
+    return chart_ids, reviewer_ids, contributors
+
+
+def scan_assign(chart_ids, reviewer_ids, contributors, min_reviews, capacity):
+    """原实现：每轮重建待分配谱面及其合法评分者列表，排序后只分配一个任务"""
+    chart_counts = {chart_id: 0 for chart_id in chart_ids}
+    loads = {reviewer_id: 0 for reviewer_id in reviewer_ids}
+    assigned_pairs = set()
+    stuck = []
+    stuck_set = set()
+    pairs = []
+    while True:
+        needed = [c for c in chart_ids if c not in stuck_set and chart_counts[c] < min_reviews]
+        if not needed:
+            break
+        with_eligible = []
+        for c in needed:
+            eligible = [
+                r for r in reviewer_ids
+                if loads[r] < capacity[r] and r not in contributors[c] and (r, c) not in assigned_pairs
+            ]
+            if not eligible:
+                stuck_set.add(c)
+                stuck.append(c)
+            else:
+                with_eligible.append((c, eligible))
+        if not with_eligible:
+            break
+        with_eligible.sort(key=lambda x: (len(x[1]), chart_counts[x[0]]))
+        chart_id, eligible = with_eligible[0]
+        reviewer_id = min(eligible, key=lambda r: loads[r])
+        pairs.append((reviewer_id, chart_id))
+        assigned_pairs.add((reviewer_id, chart_id))
+        chart_counts[chart_id] += 1
+        loads[reviewer_id] += 1
+    return {'pairs': pairs, 'chart_counts': chart_counts, 'reviewer_loads': loads, 'stuck': stuck}
+
+
+def check_outcome(contributors, capacity, outcome):
+    """校验分配约束"""
+    pairs = outcome['pairs']
+    assert len(set(pairs)) == len(pairs), '重复分配'
+    loads = {}
+    for reviewer_id, chart_id in pairs:
+        assert reviewer_id not in contributors[chart_id], '评分者评了自己参与的谱面'
+        loads[reviewer_id] = loads.get(reviewer_id, 0) + 1
+    for reviewer_id, load in loads.items():
+        assert load <= capacity[reviewer_id], '超过评分者上限'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='互评任务分配基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--min-reviews', type=int, default=8)
+    parser.add_argument('--scan-limit', type=int, default=300,
+                        help='谱面数超过该值时跳过 scan（原实现为 O(谱面数² × 评分者数)）')
+    parser.add_argument('--seed', type=int, default=20240601)
+    args = parser.parse_args()
+
+    print('=' * 76)
+    print(f"{'charts':>8} | {'method':>6} | {'seconds':>8} | {'pairs':>7} | {'reviews/chart':>13} | {'tasks/user':>10} | 结果一致")
+    print('-' * 76)
+    for size in args.sizes:
+        chart_ids, reviewer_ids, contributors = make_charts(size, args.seed)
+        capacity = review_allocation.natural_capacity(chart_ids, reviewer_ids, contributors)
+        methods = [('heap', review_allocation.greedy_assign), ('flow', review_allocation.flow_assign)]
+        if size <= args.scan_limit:
+            methods.insert(0, ('scan', scan_assign))
+        baseline = None
+        heap = None
+        for name, assign in methods:
+            start = time.perf_counter()
+            outcome = assign(chart_ids, reviewer_ids, contributors, args.min_reviews, capacity=capacity)
+            elapsed = time.perf_counter() - start
+            check_outcome(contributors, capacity, outcome)
+            same = ''
+            if name == 'scan':
+                baseline = outcome
+            elif name == 'heap':
+                heap = outcome
+                if baseline is not None:
+                    same = '是' if outcome == baseline else '否'
+            else:
+                assert len(outcome['pairs']) >= len(heap['pairs']), 'flow 分配总数少于 heap'
+                if len(outcome['pairs']) == len(heap['pairs']):
+                    assert max(outcome['reviewer_loads'].values()) <= max(heap['reviewer_loads'].values()), \
+                        'flow 最大任务数多于 heap'
+            counts = outcome['chart_counts'].values()
+            loads = outcome['reviewer_loads'].values()
+            print(f"{size:>8} | {name:>6} | {elapsed:>8.3f} | {len(outcome['pairs']):>7} | "
+                  f"{min(counts):>6}~{max(counts):<6} | {min(loads):>4}~{max(loads):<5} | {same}")
+    print('=' * 76)
+
+
+if __name__ == '__main__':
+    main()
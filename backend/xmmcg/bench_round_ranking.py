@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+轮次排名计分基准测试（不访问数据库）
+
+在合成评分数据上比较 songs.ranking 的 NumPy 与纯 Python 计分实现，
+校验两者的得分和名次一致，并输出每种规模下计算全部计分方式（含排序）的耗时。
+
+使用方法：
+    python bench_round_ranking.py
+    python bench_round_ranking.py --sizes 10000 100000 --repeat 5
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.abspath('.'))
+
+from songs import ranking
+
+
+def make_reviews(num_reviews, seed, reviews_per_chart=8):
+    """生成合成评分：每张谱面约 reviews_per_chart 条评分，评分者有各自的打分偏置"""
+    rng = random.Random(seed)
+    num_charts = max(1, num_reviews // reviews_per_chart)
+    bias = [rng.gauss(0, 8) for _ in range(num_charts)]
+    reviewer_ids, chart_ids, scores, favorites = [], [], [], []
+    for _ in range(num_reviews):
+        reviewer = rng.randrange(num_charts)
+        chart = rng.randrange(num_charts)
+        reviewer_ids.append(reviewer)
+        chart_ids.append(chart)
+        scores.append(min(50, max(0, int(rng.gauss(30, 8) + bias[reviewer]))))
+        favorites.append(rng.random() < 0.1)
+    return reviewer_ids, chart_ids, scores, favorites
+
+
+def run(score, reviews):
+    scored = score(*reviews, ranking.TRIM_RATIO)
+    return scored, {method: ranking.rank_order(scored, method) for method in ranking.RANKING_METHODS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='轮次排名计分基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=20240601)
+    args = parser.parse_args()
+
+    backends = [('python', ranking._score_reviews_python)]
+    if ranking.np is not None:
+        backends.append(('numpy', ranking._score_reviews_numpy))
+    else:
+        print('未安装 NumPy，只测试纯 Python 实现')
+
+    print('=' * 60)
+    print(f"{'reviews':>8} | {'backend':>7} | {'ms':>8} | {'charts':>7} | 名次一致")
+    print('-' * 60)
+    for size in args.sizes:
+        reviews = make_reviews(size, args.seed)
+        baseline = None
+        for name, score in backends:
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                scored, orders = run(score, reviews)
+                elapsed = (time.perf_counter() - start) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            same = ''
+            if baseline is None:
+                baseline = orders
+            else:
+                same = '是' if orders == baseline else '否'
+                assert orders == baseline, 'NumPy 与纯 Python 的名次不一致'
+            print(f"{size:>8} | {name:>7} | {best:>8.1f} | {len(scored['chart_ids']):>7} | {same}")
+    print('=' * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,8 @@
 from django.contrib import admin
 from .models import (
     Song, Banner, Announcement, CompetitionPhase, 
-    BiddingRound, Bid, BidResult,
-    Chart, PeerReviewAllocation, PeerReview,
+    BiddingRound, Bid, BidEscrow, TargetMarketStats, BidResult, AllocationLog,
+    Chart, PeerReviewAllocation, PeerReview, RoundRanking, MediaBlob,
 )
 
 
@@ -124,7 +124,12 @@ class BiddingRoundAdmin(admin.ModelAdmin):
     list_filter = ('bidding_type', 'status', 'created_at', 'competition_phase', 'bidding_type')
     ordering = ('-created_at',)
     search_fields = ('name',)
-    actions = ['allocate_bids_action', 'auto_create_chart_round_action', 'allocate_peer_reviews_action']
+    actions = ['allocate_bids_action', 'allocate_bids_optimal_action', 'preview_allocation_action',
+               'replay_allocation_action', 'auto_create_chart_round_action', 'allocate_peer_reviews_action',
+               'allocate_peer_reviews_flow_action', 'allocate_peer_reviews_incremental_action',
+               'allocate_peer_reviews_incremental_flow_action',
+               'compute_rankings_action', 'review_analysis_action', 'simulate_allocation_action',
+               'review_progress_action']
     
     def available_targets_count(self, obj):
         """显示该轮次的可用目标数量"""
@@ -140,8 +145,20 @@ class BiddingRoundAdmin(admin.ModelAdmin):
     @admin.action(description='分配选中的竞标轮次')
     def allocate_bids_action(self, request, queryset):
         """
-        自定义管理员操作：批量分配选中的竞标轮次
+        自定义管理员操作：批量分配选中的竞标轮次（价高者得）
         """
+        self._allocate_selected_rounds(request, queryset, strategy='greedy')
+    
+    @admin.action(description='按最优匹配分配选中的竞标轮次（中标总额最大）')
+    def allocate_bids_optimal_action(self, request, queryset):
+        """
+        自定义管理员操作：以 optimal 策略批量分配选中的竞标轮次
+        在每人至多中标一个目标的约束下使中标出价总和最大，通常可减少保底分配
+        """
+        self._allocate_selected_rounds(request, queryset, strategy='optimal')
+    
+    def _allocate_selected_rounds(self, request, queryset, strategy):
+        """按指定策略逐个分配选中的竞标轮次，并汇总提示信息"""
         from .bidding_service import BiddingService
         from django.contrib import messages
         
@@ -156,7 +173,7 @@ class BiddingRoundAdmin(admin.ModelAdmin):
                     continue
                 
                 # 执行分配
-                BiddingService.allocate_bids(bidding_round.id)
+                BiddingService.allocate_bids(bidding_round.id, strategy=strategy)
                 success_count += 1
                 
             except Exception as e:
@@ -177,6 +194,64 @@ class BiddingRoundAdmin(admin.ModelAdmin):
                 level=messages.WARNING
             )
     
+    @admin.action(description='预览分配结果（不写入数据库）')
+    def preview_allocation_action(self, request, queryset):
+        """
+        自定义管理员操作：只读地计算选中轮次的分配结果
+        提示信息中给出随机种子，使用同一种子正式分配可得到与预览相同的结果
+        """
+        from .bidding_service import BiddingService
+        from django.contrib import messages
+        
+        for bidding_round in queryset:
+            try:
+                preview = BiddingService.dry_run_allocation(bidding_round.id)
+            except Exception as e:
+                self.message_user(request, f'{bidding_round.name} 预览失败: {str(e)}', level=messages.WARNING)
+                continue
+            
+            fallback_count = sum(1 for row in preview['projected_results'] if row['allocation_type'] == 'random')
+            self.message_user(
+                request,
+                f'{bidding_round.name} 预览（seed={preview["seed"]}）：'
+                f'{preview["winners"]} 人中标，{fallback_count} 人保底，'
+                f'{preview["unallocated_targets"]} 个目标未分配，'
+                f'{len(preview["insufficient_users"])} 人余额不足',
+                level=messages.INFO
+            )
+    
+    @admin.action(description='重放并核对分配日志')
+    def replay_allocation_action(self, request, queryset):
+        """
+        自定义管理员操作：依据分配日志在内存中重放选中轮次的分配，并与当前结果核对
+        """
+        from .bidding_service import BiddingService
+        from django.contrib import messages
+        
+        for bidding_round in queryset:
+            try:
+                report = BiddingService.replay_allocation(bidding_round.id)
+            except Exception as e:
+                self.message_user(request, f'{bidding_round.name} 重放失败: {str(e)}', level=messages.WARNING)
+                continue
+            
+            if report['consistent']:
+                self.message_user(
+                    request,
+                    f'✓ {bidding_round.name} 重放一致（seed={report["seed"]}，'
+                    f'{report["winners"]} 人中标，{report["fallbacks"]} 人保底）',
+                    level=messages.SUCCESS
+                )
+            else:
+                self.message_user(
+                    request,
+                    f'✗ {bidding_round.name} 重放不一致：'
+                    f'中标{"一致" if report["winners_match"] else "不一致"}，'
+                    f'保底{"一致" if report["fallbacks_match"] else "不一致"}，'
+                    f'与当前结果{"一致" if report["results_match"] else "不一致"}',
+                    level=messages.ERROR
+                )
+    
     @admin.action(
         description='快速创建谱面竞标轮次（自动筛选半成品谱面）',
         permissions=['add']
@@ -235,6 +310,34 @@ class BiddingRoundAdmin(admin.ModelAdmin):
         自定义管理员操作：批量分配选中竞标轮次的互评任务
         注：只有已完成竞标分配且状态为'completed'的轮次才能分配互评任务
         """
+        self._allocate_selected_peer_reviews(request, queryset, method='greedy')
+    
+    @admin.action(description='按最大流分配选中轮次的互评任务（保证达标、负担最均衡）')
+    def allocate_peer_reviews_flow_action(self, request, queryset):
+        """
+        自定义管理员操作：以 flow 方式批量分配互评任务
+        只要存在可行分配，每张谱面都能达到目标评分数，且评分者的最大任务数最小
+        """
+        self._allocate_selected_peer_reviews(request, queryset, method='flow')
+    
+    @admin.action(description='增量补充选中轮次的互评任务（保留已有任务）')
+    def allocate_peer_reviews_incremental_action(self, request, queryset):
+        """
+        自定义管理员操作：增量分配互评任务（greedy 方式）
+        保留已完成和仍有效的待评分任务，只为迟交或评分不足的谱面补充分配
+        """
+        self._allocate_selected_peer_reviews(request, queryset, method='greedy', incremental=True)
+    
+    @admin.action(description='按最大流增量补充选中轮次的互评任务（保留已有任务，保证达标）')
+    def allocate_peer_reviews_incremental_flow_action(self, request, queryset):
+        """
+        自定义管理员操作：以 flow 方式增量分配互评任务
+        补充分配时候选评分者更少，greedy 可能让部分谱面仍未达标；只要存在可行的补充方案，flow 都能找到
+        """
+        self._allocate_selected_peer_reviews(request, queryset, method='flow', incremental=True)
+    
+    def _allocate_selected_peer_reviews(self, request, queryset, method, incremental=False):
+        """按指定方式逐个分配选中轮次的互评任务，并汇总提示信息"""
         from .bidding_service import PeerReviewService
         from django.contrib import messages
         
@@ -263,7 +366,9 @@ class BiddingRoundAdmin(admin.ModelAdmin):
                 # 执行互评分配（默认每张谱面至少8个评分）
                 stats = PeerReviewService.allocate_peer_reviews(
                     bidding_round.id,
-                    min_reviews_per_chart=8
+                    min_reviews_per_chart=8,
+                    method=method,
+                    incremental=incremental
                 )
 
                 success_count += 1
@@ -276,6 +381,12 @@ class BiddingRoundAdmin(admin.ModelAdmin):
                 tpr_max = stats.get('tasks_per_reviewer_max', '?')
                 tpr_desc = str(tpr_min) if tpr_min == tpr_max else f'{tpr_min}~{tpr_max}'
                 warn = ' ⚠️ 部分谱面未达目标评分数' if not stats.get('reached_target', True) else ''
+                if incremental:
+                    warn = (
+                        f'（保留 {stats.get("kept_allocations", 0)} 个，'
+                        f'新增 {stats.get("created_allocations", 0)} 个，'
+                        f'撤销 {stats.get("removed_allocations", 0)} 个）' + warn
+                    )
                 self.message_user(
                     request,
                     f'✓ {bidding_round.name} 互评任务分配成功：'
@@ -305,6 +416,192 @@ class BiddingRoundAdmin(admin.ModelAdmin):
                 level=messages.WARNING
             )
     
+    @admin.action(description='生成选中轮次的排名快照（互评结束后执行）')
+    def compute_rankings_action(self, request, queryset):
+        """
+        自定义管理员操作：根据互评记录重新生成排名快照（所有计分方式）并清除排名缓存
+        """
+        from .ranking import compute_round_rankings
+        from django.contrib import messages
+        
+        for bidding_round in queryset:
+            try:
+                snapshots = compute_round_rankings(bidding_round)
+                any_snapshot = next(iter(snapshots.values()))
+                self.message_user(
+                    request,
+                    f'✓ {bidding_round.name} 排名已生成：{len(any_snapshot.entries)} 张谱面，'
+                    f'{any_snapshot.review_count} 条评分',
+                    level=messages.SUCCESS
+                )
+            except Exception as e:
+                self.message_user(request, f'✗ {bidding_round.name} 排名生成失败: {str(e)}', level=messages.ERROR)
+    
+    @admin.action(description='查看选中轮次的评分者偏差分析')
+    def review_analysis_action(self, request, queryset):
+        """
+        自定义管理员操作：跳转到第一个选中轮次的评分者分析页面
+        """
+        from django.shortcuts import redirect
+        from django.urls import reverse
+        
+        bidding_round = queryset.order_by('id').first()
+        return redirect(reverse('admin:songs_biddinground_review_analysis', args=[bidding_round.id]))
+    
+    @admin.action(description='模拟选中轮次的分配公平性（蒙特卡洛）')
+    def simulate_allocation_action(self, request, queryset):
+        """
+        自定义管理员操作：跳转到第一个选中轮次的分配模拟页面
+        """
+        from django.shortcuts import redirect
+        from django.urls import reverse
+        
+        bidding_round = queryset.order_by('id').first()
+        return redirect(reverse('admin:songs_biddinground_allocation_simulation', args=[bidding_round.id]))
+    
+    @admin.action(description='查看选中轮次的互评进度')
+    def review_progress_action(self, request, queryset):
+        """
+        自定义管理员操作：跳转到第一个选中轮次的互评进度页面
+        """
+        from django.shortcuts import redirect
+        from django.urls import reverse
+        
+        bidding_round = queryset.order_by('id').first()
+        return redirect(reverse('admin:songs_biddinground_review_progress', args=[bidding_round.id]))
+    
+    def get_urls(self):
+        from django.urls import path
+        
+        custom_urls = [
+            path(
+                '<int:round_id>/review-analysis/',
+                self.admin_site.admin_view(self.review_analysis_view),
+                name='songs_biddinground_review_analysis',
+            ),
+            path(
+                '<int:round_id>/allocation-simulation/',
+                self.admin_site.admin_view(self.allocation_simulation_view),
+                name='songs_biddinground_allocation_simulation',
+            ),
+            path(
+                '<int:round_id>/review-progress/',
+                self.admin_site.admin_view(self.review_progress_view),
+                name='songs_biddinground_review_progress',
+            ),
+        ]
+        return custom_urls + super().get_urls()
+    
+    def review_analysis_view(self, request, round_id):
+        """
+        评分者偏差分析页面：每个评分者的平均分、标准差、极端分比例、与共识的相关系数和偏差，
+        异常者排在前面（结果按轮次缓存，?refresh=1 强制重算，?flagged=1 只看异常者）
+        """
+        from django.shortcuts import get_object_or_404
+        from django.template.response import TemplateResponse
+        from .review_analysis import get_round_analysis, FLAG_LABELS
+        
+        bidding_round = get_object_or_404(BiddingRound, id=round_id)
+        report = get_round_analysis(bidding_round, refresh=request.GET.get('refresh') == '1')
+        flagged_only = request.GET.get('flagged') == '1'
+        reviewers = [
+            dict(row, flag_labels=[FLAG_LABELS[flag] for flag in row['flags']])
+            for row in report['reviewers']
+            if row['flags'] or not flagged_only
+        ]
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'{bidding_round.name} - 评分者偏差分析',
+            'opts': self.model._meta,
+            'bidding_round': bidding_round,
+            'report': report,
+            'flag_counts': [(FLAG_LABELS[flag], flag, count) for flag, count in report['flag_counts'].items()],
+            'reviewers': reviewers,
+            'flagged_only': flagged_only,
+        }
+        return TemplateResponse(request, 'admin/songs/biddinground/review_analysis.html', context)
+    
+    def allocation_simulation_view(self, request, round_id):
+        """
+        分配公平性模拟页面：表单提交（GET ?runs=...）后对所选规则各运行 runs 次分配（最多 ADMIN_MAX_SIMULATION_RUNS 次），
+        显示保底率、花费分布，以及各用户在每种规则下的中标概率（最不确定的用户在前）；
+        不带参数打开时显示该轮保存的最新结果（包括 simulate_allocation 命令的结果），不重新计算
+        """
+        from django.shortcuts import get_object_or_404
+        from django.template.response import TemplateResponse
+        from .allocation_simulation import (
+            simulate_round, default_variants, store_result, latest_result, ADMIN_MAX_SIMULATION_RUNS
+        )
+        
+        bidding_round = get_object_or_404(BiddingRound, id=round_id)
+        all_variants = default_variants(bidding_round.bidding_type)
+        selected = [v for v in request.GET.getlist('variant') if v in all_variants] or all_variants
+        
+        result = None
+        user_rows = []
+        error = None
+        if 'runs' in request.GET:
+            try:
+                runs = int(request.GET['runs'])
+                seed = int(request.GET.get('seed') or 0)
+                if runs > ADMIN_MAX_SIMULATION_RUNS:
+                    raise ValueError(
+                        f'页面每种规则最多模拟 {ADMIN_MAX_SIMULATION_RUNS} 次；更多次数请运行 '
+                        f'python manage.py simulate_allocation {bidding_round.id} --runs {runs}，结果会显示在本页'
+                    )
+                result = store_result(simulate_round(bidding_round, runs=runs, variants=selected, seed=seed))
+            except ValueError as e:
+                error = str(e)
+        else:
+            result = latest_result(bidding_round.id)
+            if result:
+                selected = [summary['variant'] for summary in result['variants']]
+        
+        if result:
+            per_user = list(zip(*(summary['users'] for summary in result['variants'])))
+            per_user.sort(key=lambda rows: (
+                -max(row['win_probability'] * (1 - row['win_probability']) for row in rows),
+                rows[0]['user_id'],
+            ))
+            user_rows = [{'username': rows[0]['username'], 'bids': rows[0]['bids'], 'cells': rows}
+                         for rows in per_user]
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'{bidding_round.name} - 分配公平性模拟',
+            'opts': self.model._meta,
+            'bidding_round': bidding_round,
+            'all_variants': all_variants,
+            'selected': selected,
+            'runs': request.GET.get('runs') or (result['runs'] if result else 1000),
+            'seed': request.GET.get('seed') or (result['seed'] if result else 0),
+            'max_runs': ADMIN_MAX_SIMULATION_RUNS,
+            'result': result,
+            'user_rows': user_rows,
+            'error': error,
+        }
+        return TemplateResponse(request, 'admin/songs/biddinground/allocation_simulation.html', context)
+    
+    def review_progress_view(self, request, round_id):
+        """
+        互评进度页面：总体完成率、进度最慢的评分者、收到评分最少的谱面和超期任务
+        （聚合结果短时缓存，?refresh=1 强制重算）
+        """
+        from django.shortcuts import get_object_or_404
+        from django.template.response import TemplateResponse
+        from .review_progress import get_round_progress
+        
+        bidding_round = get_object_or_404(BiddingRound, id=round_id)
+        progress = get_round_progress(bidding_round, refresh=request.GET.get('refresh') == '1')
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'{bidding_round.name} - 互评进度',
+            'opts': self.model._meta,
+            'bidding_round': bidding_round,
+            'progress': progress,
+        }
+        return TemplateResponse(request, 'admin/songs/biddinground/review_progress.html', context)
+    
     readonly_fields = ('created_at', 'available_targets_count')
     
     fieldsets = (
@@ -348,6 +645,70 @@ class BidAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def delete_model(self, request, obj):
+        """删除竞标时同步释放承诺额度"""
+        from .bidding_service import BiddingService
+        BiddingService.delete_bid(obj)
+    
+    def delete_queryset(self, request, queryset):
+        from .bidding_service import BiddingService
+        for bid in queryset:
+            BiddingService.delete_bid(bid)
+
+
+@admin.register(BidEscrow)
+class BidEscrowAdmin(admin.ModelAdmin):
+    list_display = ('bidding_round', 'user', 'committed_tokens', 'active_bids', 'updated_at')
+    list_filter = ('bidding_round',)
+    ordering = ('-updated_at',)
+    search_fields = ('user__username', 'bidding_round__name')
+    readonly_fields = ('bidding_round', 'user', 'committed_tokens', 'active_bids', 'updated_at')
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(TargetMarketStats)
+class TargetMarketStatsAdmin(admin.ModelAdmin):
+    list_display = ('bidding_round', 'bid_type', 'song', 'chart', 'bid_count', 'max_amount', 'second_amount', 'updated_at')
+    list_filter = ('bidding_round', 'bid_type')
+    ordering = ('-updated_at',)
+    search_fields = ('song__title', 'chart__song__title', 'bidding_round__name')
+    readonly_fields = ('bidding_round', 'bid_type', 'song', 'chart', 'bid_count', 'max_amount', 'second_amount', 'updated_at')
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(RoundRanking)
+class RoundRankingAdmin(admin.ModelAdmin):
+    list_display = ('bidding_round', 'method', 'entry_count', 'review_count', 'computed_at')
+    list_filter = ('bidding_round', 'method')
+    ordering = ('-computed_at',)
+    readonly_fields = ('bidding_round', 'method', 'review_count', 'computed_at', 'entries')
+    
+    def entry_count(self, obj):
+        return len(obj.entries)
+    entry_count.short_description = '谱面数'
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'ref_count', 'created_at')
+    ordering = ('-created_at',)
+    search_fields = ('name', 'sha256')
+    readonly_fields = ('name', 'sha256', 'size', 'ref_count', 'created_at')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        # 引用数归零时自动删除，手动删除会使文件失去记录
+        return False
 
 
 @admin.register(BidResult)
@@ -369,13 +730,25 @@ class BidResultAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(AllocationLog)
+class AllocationLogAdmin(admin.ModelAdmin):
+    list_display = ('bidding_round', 'seed', 'strategy', 'backend', 'priority_self', 'created_at')
+    list_filter = ('bidding_round', 'strategy', 'created_at')
+    ordering = ('-created_at',)
+    search_fields = ('bidding_round__name',)
+    readonly_fields = ('bidding_round', 'seed', 'strategy', 'backend', 'priority_self', 'created_at')
+    exclude = ('bids', 'order', 'winners', 'fallbacks', 'targets', 'target_owners')
+
+
 @admin.register(Chart)
 class ChartAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'song', 'status', 'is_part_one', 'designer', 'review_count', 'average_score', 'created_at')
+    list_display = ('id', 'user', 'song', 'status', 'is_part_one', 'designer', 'review_count', 'average_score',
+                    'favorite_count', 'created_at')
     list_filter = ('status', 'is_part_one', 'bidding_round', 'created_at')
     ordering = ('-created_at',)
     search_fields = ('user__username', 'song__title', 'designer')
-    readonly_fields = ('review_count', 'total_score', 'average_score', 'created_at', 'submitted_at', 'review_completed_at')
+    readonly_fields = ('review_count', 'total_score', 'average_score', 'favorite_count', 'created_at', 'submitted_at',
+                       'review_completed_at')
     actions = ['view_available_for_bidding']
     
     def view_available_for_bidding(self, request, queryset):
@@ -419,7 +792,9 @@ class ChartAdmin(admin.ModelAdmin):
 @admin.register(PeerReviewAllocation)
 class PeerReviewAllocationAdmin(admin.ModelAdmin):
     list_display = ('id', 'reviewer', 'chart', 'status', 'allocated_at')
-    list_filter = ('status', 'allocated_at')
+    list_filter = ('status', 'bidding_round', 'allocated_at')
+    # chart 列显示 Chart.__str__（关联 user / song），一次 JOIN 取出，避免逐行查询
+    list_select_related = ('reviewer', 'chart__user', 'chart__song')
     ordering = ('-allocated_at',)
     search_fields = ('reviewer__username', 'chart__song__title')
     readonly_fields = ('allocated_at',)
@@ -0,0 +1,460 @@
+"""
+竞标分配核心算法（不依赖 ORM）
+
+输入为三个等长序列 (user_ids, target_ids, amounts)，第 i 个元素描述一条竞标。
+所有函数只返回下标，调用方负责把下标映射回竞标/用户/目标并写库，
+因此可以脱离 Django 单独测试、基准测试和调参。
+
+计算后端：
+- python：按金额分组后组内 shuffle，与历史实现的随机数消耗顺序一致
+- numpy：按 (-amount, 随机键) 排序 + 位图标记的一次扫描，适用于超大轮次
+- auto：安装了 NumPy 且竞标数不少于 NUMPY_AUTO_THRESHOLD 时使用 numpy，否则 python
+"""
+
+import heapq
+import random
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖
+    np = None
+
+
+ALLOCATION_BACKENDS = ('auto', 'python', 'numpy')
+
+# auto 模式下启用 NumPy 的最小竞标数
+NUMPY_AUTO_THRESHOLD = 100000
+
+
+def make_rng(seed=None):
+    """
+    获取随机数生成器
+
+    seed 为 None 时返回 random 模块本身（使用全局随机状态，与历史行为一致），
+    否则返回独立的 random.Random(seed)，保证结果可复现。
+    """
+    return random.Random(seed) if seed is not None else random
+
+
+def new_seed():
+    """生成新的随机种子（记录到分配日志中，以便预览/重放得到相同结果）"""
+    return random.randrange(2 ** 63)
+
+
+def resolve_backend(backend, num_bids):
+    """根据配置和竞标数量确定实际使用的计算后端"""
+    if backend not in ALLOCATION_BACKENDS:
+        raise ValueError(f'未知的计算后端: {backend}')
+    if backend == 'numpy' and np is None:
+        raise ValueError('未安装 NumPy，无法使用 numpy 后端')
+    if backend == 'auto':
+        return 'numpy' if (np is not None and num_bids >= NUMPY_AUTO_THRESHOLD) else 'python'
+    return backend
+
+
+def rank_bids(amounts, rng=random):
+    """
+    按出价从高到低返回竞标下标，同价格的竞标随机打乱
+
+    Args:
+        amounts: 出价序列
+        rng: 提供 shuffle 的随机数生成器（random 模块或 random.Random 实例）
+
+    Returns:
+        list[int]: 处理顺序
+    """
+    by_amount = {}
+    for idx, amount in enumerate(amounts):
+        by_amount.setdefault(amount, []).append(idx)
+
+    order = []
+    for amount in sorted(by_amount, reverse=True):
+        group = by_amount[amount]
+        rng.shuffle(group)  # 同价格随机排序
+        order.extend(group)
+    return order
+
+
+def assign_first_come(order, user_ids, target_ids):
+    """
+    按给定顺序逐个处理竞标：用户和目标都未被占用时中标
+
+    Returns:
+        list[int]: 中标竞标的下标（按处理顺序）
+    """
+    taken_users = set()
+    taken_targets = set()
+    winners = []
+    for idx in order:
+        user_id = user_ids[idx]
+        target_id = target_ids[idx]
+        if user_id in taken_users or target_id in taken_targets:
+            continue
+        taken_users.add(user_id)
+        taken_targets.add(target_id)
+        winners.append(idx)
+    return winners
+
+
+def rank_bids_numpy(amounts, seed=None):
+    """
+    NumPy 版 rank_bids：按 (-amount, 随机键) 排序，返回 int64 下标数组
+
+    出价跨度小于 2^31 时把两者打包为一个 int64 键做一次 argsort，
+    否则退回 lexsort（以最后一个键为主键）。
+    """
+    amounts = np.asarray(amounts, dtype=np.int64)
+    if len(amounts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    gen = np.random.default_rng(seed)
+    max_amount = int(amounts.max())
+    if max_amount - int(amounts.min()) < 2 ** 31:
+        keys = ((max_amount - amounts) << 32) | gen.integers(0, 2 ** 32, len(amounts), dtype=np.int64)
+        return np.argsort(keys)
+    return np.lexsort((gen.random(len(amounts)), -amounts))
+
+
+def _dense_ids(ids):
+    """
+    把 ID 数组转换为可直接做位图下标的非负整数
+
+    数据库自增 ID 本身足够稠密时直接使用（省去一次排序），否则用 np.unique 重新编号。
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if ids.min() >= 0 and ids.max() < 4 * len(ids) + 1024:
+        return ids
+    return np.unique(ids, return_inverse=True)[1].astype(np.int64)
+
+
+def assign_first_come_numpy(order, user_ids, target_ids):
+    """
+    NumPy 版 assign_first_come
+
+    先把用户/目标 ID 压缩为稠密编号，再用 bytearray 作为"已占用"位图做一次顺序扫描；
+    中标数达到 min(用户数, 目标数) 后提前结束。
+    """
+    order = np.asarray(order, dtype=np.int64)
+    if len(order) == 0:
+        return []
+    users = _dense_ids(np.asarray(user_ids)[order])
+    targets = _dense_ids(np.asarray(target_ids)[order])
+    user_taken = bytearray(int(users.max()) + 1)
+    target_taken = bytearray(int(targets.max()) + 1)
+    # 中标数上限 = min(不同用户数, 不同目标数)
+    limit = min(int(np.count_nonzero(np.bincount(users))), int(np.count_nonzero(np.bincount(targets))))
+
+    positions = []
+    for pos, (user, target) in enumerate(zip(users.tolist(), targets.tolist())):
+        if user_taken[user] or target_taken[target]:
+            continue
+        user_taken[user] = 1
+        target_taken[target] = 1
+        positions.append(pos)
+        if len(positions) == limit:
+            break
+    return order[positions].tolist()
+
+
+def greedy_allocate(user_ids, target_ids, amounts, seed=None, rng=None, backend='auto'):
+    """
+    价高者得的贪心分配（每个用户最多中标一个目标，每个目标最多一个中标者）
+
+    Args:
+        user_ids / target_ids / amounts: 等长序列
+        seed: 随机种子（None 表示使用全局随机状态）
+        rng: python 后端使用的随机数生成器，默认 make_rng(seed)
+        backend: 'auto' / 'python' / 'numpy'
+
+    Returns:
+        dict:
+            - order: 处理顺序（下标序列，python 后端为 list，numpy 后端为 ndarray）
+            - winners: 中标竞标的下标列表（按处理顺序）
+            - backend: 实际使用的后端
+    """
+    backend = resolve_backend(backend, len(amounts))
+    if backend == 'numpy':
+        order = rank_bids_numpy(amounts, seed)
+        winners = assign_first_come_numpy(order, user_ids, target_ids)
+    else:
+        if rng is None:
+            rng = make_rng(seed)
+        order = rank_bids(amounts, rng)
+        winners = assign_first_come(order, user_ids, target_ids)
+    return {
+        'order': order,
+        'winners': winners,
+        'backend': backend,
+    }
+
+
+# ==================== 最优匹配 ====================
+
+def optimal_allocate(user_ids, target_ids, amounts, seed=None, rng=None):
+    """
+    最优匹配：在"每个用户至多中标一个目标、每个目标至多一个中标者"约束下，
+    使中标出价总和最大（带权二分图最大权匹配）
+
+    把"不中标"视为每个用户私有的、代价为 0 的虚拟目标，问题变为行数 ≤ 列数的
+    矩形指派问题（代价 = -出价）。逐个加入用户，每次用带势能的 Dijkstra
+    （稀疏最短增广路，即匈牙利算法的 Dijkstra 形式）在交错图上寻找最短增广路：
+    - 约化代价 c(i,j) - u[i] - v[j] 始终非负，已匹配边为 0
+    - 弹出的最近列为空闲列（空闲目标或某个已访问用户的虚拟目标）时立即停止，
+      因此每次只探索增广路附近的局部子图
+    - 只更新本次访问到的行列势能，未访问节点不需要任何处理
+
+    复杂度：最坏 O(U · E log E)（U 为出价用户数，E 为竞标数）；
+    实际每个用户只探索很小的局部子图，5 万条竞标在普通机器上约 0.5 秒。
+    出价均为整数，结果是精确最优解。
+
+    同等总额的最优解可能有多个：用户加入顺序由 rng 打乱，
+    使同价竞争者之间不会固定偏向数据库中靠前的竞标。
+
+    Args:
+        user_ids / target_ids / amounts: 等长序列
+        seed: 随机种子（None 表示使用全局随机状态）
+        rng: 随机数生成器，默认 make_rng(seed)
+
+    Returns:
+        dict:
+            - order: 用户加入顺序
+            - winners: 中标竞标的下标列表
+            - backend: 固定为 'python'
+    """
+    if rng is None:
+        rng = make_rng(seed)
+
+    # 压缩用户/目标编号；同一用户对同一目标的重复竞标只保留出价最高的一条
+    row_of = {}
+    col_of = {}
+    best_bid = {}
+    for idx, (user_id, target_id) in enumerate(zip(user_ids, target_ids)):
+        row = row_of.setdefault(user_id, len(row_of))
+        col = col_of.setdefault(target_id, len(col_of))
+        key = (row, col)
+        if key not in best_bid or amounts[idx] > amounts[best_bid[key]]:
+            best_bid[key] = idx
+
+    num_rows = len(row_of)
+    num_targets = len(col_of)
+    # 列 num_targets + i 为第 i 个用户的虚拟目标（不中标，代价 0）
+    edges = [[] for _ in range(num_rows)]
+    for (row, col), idx in best_bid.items():
+        edges[row].append((col, -amounts[idx]))
+    for row in range(num_rows):
+        edges[row].append((num_targets + row, 0))
+
+    u = [0] * num_rows
+    v = [0] * (num_targets + num_rows)
+    col_match = [-1] * (num_targets + num_rows)   # 列 -> 行
+    row_match = [-1] * num_rows                   # 行 -> 列
+
+    order = list(range(num_rows))
+    rng.shuffle(order)
+    for start in order:
+        # 新加入的行：取满足可行性的最大势能，使其所有边的约化代价非负
+        u[start] = min(cost - v[col] for col, cost in edges[start])
+
+        dist = {}
+        pred = {}
+        done = {}            # 已确定最短距离的列 -> 距离
+        row_dist = {start: 0}
+        heap = []
+        row, row_d = start, 0
+        while True:
+            base = row_d - u[row]
+            for col, cost in edges[row]:
+                if col in done:
+                    continue
+                nd = base + cost - v[col]
+                if nd < dist.get(col, nd + 1):
+                    dist[col] = nd
+                    pred[col] = row
+                    heapq.heappush(heap, (nd, col))
+            while True:
+                d, col = heapq.heappop(heap)
+                if col not in done and d == dist[col]:
+                    break
+            done[col] = d
+            if col_match[col] == -1:
+                break
+            row = col_match[col]
+            row_d = d
+            row_dist[row] = d
+
+        # 更新势能（只涉及本次访问的节点），保持约化代价非负、匹配边为 0
+        end_col, total = col, d
+        for col, d in done.items():
+            if d < total:
+                v[col] -= total - d
+        for row, d in row_dist.items():
+            if d < total:
+                u[row] += total - d
+
+        # 沿前驱回溯增广
+        col = end_col
+        while True:
+            row = pred[col]
+            prev_col = row_match[row]
+            col_match[col] = row
+            row_match[row] = col
+            if row == start:
+                break
+            col = prev_col
+
+    winners = sorted(
+        best_bid[(row, col)]
+        for row, col in enumerate(row_match)
+        if col < num_targets
+    )
+    rows = list(row_of)
+    return {
+        'order': [rows[row] for row in order],
+        'winners': winners,
+        'backend': 'python',
+    }
+
+
+# ==================== 保底分配 ====================
+
+def _swap_remove(items, positions, value):
+    """O(1) 删除：把 value 与列表末尾元素交换后 pop，并维护位置索引"""
+    idx = positions.pop(value)
+    last = items.pop()
+    if idx < len(items):
+        items[idx] = last
+        positions[last] = idx
+
+
+class TargetPool:
+    """
+    保底分配用的可抽取目标池
+
+    - 目标列表 + 位置索引，抽取/删除均为 swap-remove，O(1)
+    - 可选的 拥有者 -> 目标列表 索引（同样 swap-remove），
+      用于 priority_self 时 O(1) 抽取用户自己的谱面，无需扫描全部未分配目标
+    """
+
+    def __init__(self, target_ids, owner_of=None):
+        """
+        Args:
+            target_ids: 可分配的目标ID（顺序决定同一种子下的抽取结果）
+            owner_of: 可选，目标ID -> 拥有者用户ID
+        """
+        self._items = list(target_ids)
+        self._positions = {target_id: idx for idx, target_id in enumerate(self._items)}
+        self._owner_of = owner_of or {}
+        self._owned = {}
+        self._owned_positions = {}
+        for target_id in self._items:
+            owner = self._owner_of.get(target_id)
+            if owner is None:
+                continue
+            owned = self._owned.setdefault(owner, [])
+            self._owned_positions[target_id] = len(owned)
+            owned.append(target_id)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, target_id):
+        return target_id in self._positions
+
+    def remove(self, target_id):
+        """从池中移除目标（同时维护拥有者索引）"""
+        _swap_remove(self._items, self._positions, target_id)
+        if target_id in self._owned_positions:
+            owner = self._owner_of[target_id]
+            _swap_remove(self._owned[owner], self._owned_positions, target_id)
+
+    def draw(self, rng=random, owner=None):
+        """
+        随机抽取并移除一个目标
+
+        Args:
+            rng: 提供 randrange 的随机数生成器
+            owner: 不为 None 时优先从该用户拥有的目标中抽取
+
+        Returns:
+            目标ID；池为空时返回 None
+        """
+        if owner is not None:
+            owned = self._owned.get(owner)
+            if owned:
+                target_id = owned[rng.randrange(len(owned))]
+                self.remove(target_id)
+                return target_id
+        if not self._items:
+            return None
+        target_id = self._items[rng.randrange(len(self._items))]
+        self.remove(target_id)
+        return target_id
+
+
+def fallback_allocate(user_ids, pool, rng=random, prefer_own=False):
+    """
+    保底分配：依次为未中标用户从目标池中随机抽取一个目标
+
+    总复杂度 O(用户数 + 目标数)（建池 O(目标数)，每次抽取 O(1)）。
+
+    Args:
+        user_ids: 需要保底的用户ID（顺序决定同一种子下的抽取结果）
+        pool: TargetPool
+        rng: 随机数生成器
+        prefer_own: 是否优先分配用户自己拥有的目标（谱面竞标 priority_self）
+
+    Returns:
+        list[tuple]: (user_id, target_id)；目标池耗尽后剩余用户不再分配
+    """
+    assignments = []
+    for user_id in user_ids:
+        if not pool:
+            break
+        target_id = pool.draw(rng, owner=user_id if prefer_own else None)
+        assignments.append((user_id, target_id))
+    return assignments
+
+
+# ==================== 完整分配方案 ====================
+
+ALLOCATION_STRATEGIES = ('greedy', 'optimal')
+
+
+def plan_allocation(user_ids, target_ids, amounts, available_targets, owner_of=None,
+                    prefer_own=False, seed=None, strategy='greedy', backend='auto'):
+    """
+    计算完整分配方案（中标 + 保底），不产生任何副作用
+
+    正式分配、预览（dry-run）和日志重放都调用本函数：
+    输入与随机种子相同时结果完全相同。
+
+    Args:
+        user_ids / target_ids / amounts: 等长的竞标序列
+        available_targets: 可分配的目标ID（保底分配的候选）
+        owner_of: 可选，目标ID -> 拥有者用户ID（prefer_own 时使用）
+        prefer_own: 保底分配是否优先分配用户自己拥有的目标
+        seed: 随机种子
+        strategy: 'greedy' / 'optimal'
+        backend: greedy 策略的计算后端
+
+    Returns:
+        dict:
+            - order / winners / backend: 同 greedy_allocate / optimal_allocate
+            - fallbacks: 保底分配 [(user_id, target_id), ...]
+            - remaining: 分配后仍未分配的可分配目标数
+    """
+    if strategy not in ALLOCATION_STRATEGIES:
+        raise ValueError(f'未知的分配策略: {strategy}')
+    rng = make_rng(seed)
+    if strategy == 'optimal':
+        outcome = optimal_allocate(user_ids, target_ids, amounts, seed=seed, rng=rng)
+    else:
+        outcome = greedy_allocate(user_ids, target_ids, amounts, seed=seed, rng=rng, backend=backend)
+
+    won_targets = set(target_ids[idx] for idx in outcome['winners'])
+    won_users = set(user_ids[idx] for idx in outcome['winners'])
+    # 排序后建池，使同一随机种子下的保底结果与数据库返回顺序无关
+    pool = TargetPool(sorted(set(available_targets) - won_targets), owner_of if prefer_own else None)
+    losing_users = sorted(set(user_ids) - won_users)
+    outcome['fallbacks'] = fallback_allocate(losing_users, pool, rng=rng, prefer_own=prefer_own)
+    outcome['remaining'] = len(pool)
+    return outcome
@@ -0,0 +1,383 @@
+"""
+竞标分配的蒙特卡洛公平性模拟
+
+在某轮竞标的快照上，用不同的随机种子和分配规则（策略 × 是否 priority_self）
+重复运行分配核心 allocation.plan_allocation 成千上万次，统计：
+- 每个用户的中标概率、保底概率和期望花费
+- 保底率（未中标、靠随机保底分配的出价用户比例）及保底分到自己谱面的比例
+- 每次分配总花费（中标出价 + 保底费用）的分布
+
+快照只读取一次，并压缩为紧凑数组（compact_snapshot）：用户/目标按原 ID 顺序重新编号为
+0..n-1，竞标存为 array('q')。编号保持原 ID 的相对顺序，因此同一种子下模拟结果与
+正式分配完全一致；快照很小，可以在进程池初始化时一次性传给各工作进程。
+进程池使用 spawn 方式启动工作进程，不 fork 调用方（Web worker）的数据库连接和内存状态。
+
+大量运行请使用 simulate_allocation 命令；Admin 页面每种规则最多 ADMIN_MAX_SIMULATION_RUNS 次，
+两者的最新结果都按轮次保存在 AllocationSimulation 表（store_result / latest_result），
+Admin 页面直接显示，不必重新计算。
+
+本模块顶层不依赖 ORM（工作进程只需导入 allocation），只有 simulate_round 读取数据库。
+同一批种子（seed, seed + 1, ...）用于所有规则，各规则之间是成对比较。
+"""
+
+import math
+import multiprocessing
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from . import allocation
+
+
+# 规则变体名：<策略> 或 <策略>+self（保底优先分配自己的谱面，仅谱面竞标）
+SELF_SUFFIX = '+self'
+
+# 单次模拟的最大运行次数
+MAX_SIMULATION_RUNS = 100000
+
+# Admin 页面（在 HTTP 请求中同步计算）每种规则的最大运行次数，更多次数请使用 simulate_allocation 命令
+ADMIN_MAX_SIMULATION_RUNS = 2000
+
+# 每个工作进程分到的任务块数（块越多负载越均衡，块越少进程间通信越少）
+CHUNKS_PER_WORKER = 4
+
+# 运行次数少于该值时直接在当前进程计算（启动进程池的开销大于收益）
+MIN_RUNS_FOR_POOL = 200
+
+
+def parse_variant(name):
+    """
+    解析规则变体名
+
+    Returns:
+        tuple: (strategy, prefer_own)
+
+    Raises:
+        ValueError: 变体名无效
+    """
+    strategy, prefer_own = name, False
+    if name.endswith(SELF_SUFFIX):
+        strategy, prefer_own = name[:-len(SELF_SUFFIX)], True
+    if strategy not in allocation.ALLOCATION_STRATEGIES:
+        raise ValueError(f'未知的分配规则: {name}')
+    return strategy, prefer_own
+
+
+def default_variants(bidding_type):
+    """某种竞标类型可用的全部规则变体（priority_self 只对谱面竞标有效）"""
+    variants = []
+    for strategy in allocation.ALLOCATION_STRATEGIES:
+        variants.append(strategy)
+        if bidding_type == 'chart':
+            variants.append(strategy + SELF_SUFFIX)
+    return variants
+
+
+def compact_snapshot(snapshot):
+    """
+    把 BiddingService._load_allocation_snapshot 的结果压缩为紧凑数组
+
+    Returns:
+        dict:
+            - bidding_type
+            - user_keys / target_keys: 编号 -> 原用户ID / 原目标ID（升序）
+            - user_ids / target_ids / amounts: 每条竞标的用户编号、目标编号、出价（array('q')）
+            - targets: 可分配目标的编号（array('q')）
+            - owners: 每个目标编号的拥有者用户编号（不是出价用户时为 -1，array('q')）
+    """
+    _, user_ids, target_ids, amounts = snapshot['bids']
+    user_keys = sorted(set(user_ids))
+    target_keys = sorted(set(target_ids) | set(snapshot['targets']))
+    user_index = {user_id: idx for idx, user_id in enumerate(user_keys)}
+    target_index = {target_id: idx for idx, target_id in enumerate(target_keys)}
+    owner_of = snapshot['owner_of']
+    return {
+        'bidding_type': snapshot['bidding_type'],
+        'user_keys': user_keys,
+        'target_keys': target_keys,
+        'user_ids': array('q', (user_index[user_id] for user_id in user_ids)),
+        'target_ids': array('q', (target_index[target_id] for target_id in target_ids)),
+        'amounts': array('q', amounts),
+        'targets': array('q', (target_index[target_id] for target_id in snapshot['targets'])),
+        'owners': array('q', (user_index.get(owner_of.get(target_id), -1) for target_id in target_keys)),
+    }
+
+
+def simulate_runs(compact, variant, seeds, backend='auto', random_cost=0):
+    """
+    在紧凑快照上按给定种子逐次运行分配核心，累计各项计数（可在工作进程中执行）
+
+    Returns:
+        dict:
+            - wins / fallbacks / own_fallbacks / spend: 每个用户编号的累计次数/花费（list）
+            - totals: 每次运行的总花费
+            - fallback_counts / unassigned_counts: 每次运行的保底人数 / 保底目标耗尽而未分到的人数
+    """
+    strategy, prefer_own = parse_variant(variant)
+    user_ids, target_ids, amounts = compact['user_ids'], compact['target_ids'], compact['amounts']
+    owners = compact['owners']
+    owner_of = {target: owner for target, owner in enumerate(owners) if owner >= 0} if prefer_own else None
+    num_users = len(compact['user_keys'])
+
+    wins = [0] * num_users
+    fallbacks = [0] * num_users
+    own_fallbacks = [0] * num_users
+    spend = [0] * num_users
+    totals = []
+    fallback_counts = []
+    unassigned_counts = []
+    for seed in seeds:
+        plan = allocation.plan_allocation(
+            user_ids, target_ids, amounts, compact['targets'],
+            owner_of=owner_of, prefer_own=prefer_own,
+            seed=seed, strategy=strategy, backend=backend
+        )
+        total = 0
+        for idx in plan['winners']:
+            user = user_ids[idx]
+            wins[user] += 1
+            spend[user] += amounts[idx]
+            total += amounts[idx]
+        for user, target in plan['fallbacks']:
+            fallbacks[user] += 1
+            spend[user] += random_cost
+            if owners[target] == user:
+                own_fallbacks[user] += 1
+        total += random_cost * len(plan['fallbacks'])
+        totals.append(total)
+        fallback_counts.append(len(plan['fallbacks']))
+        unassigned_counts.append(num_users - len(plan['winners']) - len(plan['fallbacks']))
+
+    return {
+        'wins': wins,
+        'fallbacks': fallbacks,
+        'own_fallbacks': own_fallbacks,
+        'spend': spend,
+        'totals': totals,
+        'fallback_counts': fallback_counts,
+        'unassigned_counts': unassigned_counts,
+    }
+
+
+# ==================== 进程池 ====================
+
+_worker_snapshot = None
+
+
+def _init_worker(compact):
+    """工作进程初始化：保存快照，之后的任务只传变体名和种子范围"""
+    global _worker_snapshot
+    _worker_snapshot = compact
+
+
+def _run_chunk(variant, start, stop, backend, random_cost):
+    return variant, simulate_runs(_worker_snapshot, variant, range(start, stop), backend, random_cost)
+
+
+def _merge(into, part):
+    if into is None:
+        return part
+    for key in ('wins', 'fallbacks', 'own_fallbacks', 'spend'):
+        into[key] = [a + b for a, b in zip(into[key], part[key])]
+    for key in ('totals', 'fallback_counts', 'unassigned_counts'):
+        into[key].extend(part[key])
+    return into
+
+
+def _seed_ranges(seed, runs, num_chunks):
+    """把种子区间 [seed, seed + runs) 切分为 num_chunks 段（按起点排序合并后与顺序执行结果相同）"""
+    size = max(1, math.ceil(runs / num_chunks))
+    return [(start, min(start + size, seed + runs)) for start in range(seed, seed + runs, size)]
+
+
+def _distribution(values):
+    """均值、标准差、最小值、5/50/95 分位数、最大值"""
+    if not values:
+        return {key: 0 for key in ('mean', 'std', 'min', 'p5', 'p50', 'p95', 'max')}
+    ordered = sorted(values)
+    n = len(ordered)
+    mean = sum(ordered) / n
+    std = math.sqrt(sum((v - mean) ** 2 for v in ordered) / n)
+
+    def percentile(q):
+        return ordered[min(n - 1, int(round(q * (n - 1))))]
+
+    return {
+        'mean': round(mean, 2),
+        'std': round(std, 2),
+        'min': ordered[0],
+        'p5': percentile(0.05),
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+        'max': ordered[-1],
+    }
+
+
+def run_simulation(compact, variants, runs, seed=0, workers=None, backend='auto', random_cost=0):
+    """
+    对每个规则变体运行 runs 次分配并汇总
+
+    Args:
+        compact: compact_snapshot 的结果
+        variants: 规则变体名列表
+        runs: 每个变体的运行次数（使用种子 seed .. seed + runs - 1）
+        workers: 工作进程数（None 表示 CPU 核数，<= 1 表示在当前进程中计算）
+        backend: greedy 策略的计算后端
+        random_cost: 保底分配的费用
+
+    Returns:
+        dict: {'runs', 'seed', 'workers', 'elapsed', 'variants': [每个变体的汇总]}，
+              变体汇总见 _summarize
+    """
+    if not 1 <= runs <= MAX_SIMULATION_RUNS:
+        raise ValueError(f'运行次数必须在 1 到 {MAX_SIMULATION_RUNS} 之间')
+    for variant in variants:
+        parse_variant(variant)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if runs * len(variants) < MIN_RUNS_FOR_POOL:
+        workers = 1
+
+    started = time.perf_counter()
+    tallies = {}
+    if workers <= 1:
+        workers = 1
+        for variant in variants:
+            tallies[variant] = simulate_runs(compact, variant, range(seed, seed + runs), backend, random_cost)
+    else:
+        tasks = [
+            (variant, start, stop)
+            for variant in variants
+            for start, stop in _seed_ranges(seed, runs, workers * CHUNKS_PER_WORKER)
+        ]
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(compact,),
+        ) as pool:
+            futures = [pool.submit(_run_chunk, variant, start, stop, backend, random_cost)
+                       for variant, start, stop in tasks]
+            # 按提交顺序合并，保证每次运行的记录顺序与顺序执行一致
+            for future in futures:
+                variant, part = future.result()
+                tallies[variant] = _merge(tallies.get(variant), part)
+
+    return {
+        'runs': runs,
+        'seed': seed,
+        'workers': workers,
+        'elapsed': round(time.perf_counter() - started, 3),
+        'variants': [_summarize(compact, variant, tallies[variant], runs) for variant in variants],
+    }
+
+
+def _summarize(compact, variant, tally, runs):
+    strategy, prefer_own = parse_variant(variant)
+    num_users = len(compact['user_keys'])
+    bid_counts = [0] * num_users
+    for user in compact['user_ids']:
+        bid_counts[user] += 1
+
+    users = []
+    for user, user_id in enumerate(compact['user_keys']):
+        users.append({
+            'user_id': user_id,
+            'bids': bid_counts[user],
+            'win_probability': round(tally['wins'][user] / runs, 4),
+            'fallback_probability': round(tally['fallbacks'][user] / runs, 4),
+            'own_fallback_probability': round(tally['own_fallbacks'][user] / runs, 4),
+            'expected_spend': round(tally['spend'][user] / runs, 2),
+        })
+    total_fallbacks = sum(tally['fallback_counts'])
+    return {
+        'variant': variant,
+        'strategy': strategy,
+        'prefer_own': prefer_own,
+        'fallback_rate': round(total_fallbacks / (runs * num_users), 4) if num_users else 0.0,
+        'own_fallback_rate': round(sum(tally['own_fallbacks']) / total_fallbacks, 4) if total_fallbacks else 0.0,
+        'unassigned_rate': round(sum(tally['unassigned_counts']) / (runs * num_users), 4) if num_users else 0.0,
+        'uncertain_users': sum(1 for row in users if 0 < row['win_probability'] < 1),
+        'spend': _distribution(tally['totals']),
+        'fallbacks': _distribution(tally['fallback_counts']),
+        'users': users,
+    }
+
+
+# ==================== 读取轮次 ====================
+
+def simulate_round(bidding_round, runs=1000, variants=None, seed=0, workers=None):
+    """
+    读取某轮竞标的快照（两条查询）并运行模拟
+
+    可分配目标为当前状态（与此刻执行正式分配时相同），priority_self 由规则变体决定。
+    工作进程数默认取 settings.ALLOCATION_SIMULATION_WORKERS（0 表示 CPU 核数）。
+
+    Returns:
+        dict: run_simulation 的结果，另含 round_id、bidding_type、bids、bidders、targets，
+              每个用户汇总附 username
+    """
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from .bidding_service import BiddingService, _chunked, BULK_WRITE_BATCH_SIZE
+    from .models import RANDOM_ALLOCATION_COST
+
+    snapshot = BiddingService._load_allocation_snapshot(bidding_round, priority_self=False)
+    compact = compact_snapshot(snapshot)
+    if workers is None:
+        workers = getattr(settings, 'ALLOCATION_SIMULATION_WORKERS', 0) or None
+    result = run_simulation(
+        compact,
+        variants or default_variants(compact['bidding_type']),
+        runs,
+        seed=seed,
+        workers=workers,
+        backend=getattr(settings, 'BIDDING_ALLOCATION_BACKEND', 'auto'),
+        random_cost=RANDOM_ALLOCATION_COST,
+    )
+
+    usernames = {}
+    for chunk in _chunked(compact['user_keys'], BULK_WRITE_BATCH_SIZE):
+        usernames.update(User.objects.filter(id__in=chunk).values_list('id', 'username'))
+    for summary in result['variants']:
+        for row in summary['users']:
+            row['username'] = usernames.get(row['user_id'], '')
+
+    result.update({
+        'round_id': bidding_round.id,
+        'bidding_type': compact['bidding_type'],
+        'bids': len(compact['amounts']),
+        'bidders': len(compact['user_keys']),
+        'targets': len(compact['targets']),
+    })
+    return result
+
+
+# ==================== 最新结果 ====================
+
+def store_result(result):
+    """
+    保存某轮最新的模拟结果（Admin 页面和 simulate_allocation 命令共用），
+    写入 AllocationSimulation 表，覆盖该轮之前的结果
+    """
+    from .models import AllocationSimulation
+
+    record, _ = AllocationSimulation.objects.update_or_create(
+        bidding_round_id=result['round_id'],
+        defaults={'result': result}
+    )
+    result['computed_at'] = record.computed_at.isoformat()
+    return result
+
+
+def latest_result(round_id):
+    """某轮最新的模拟结果，没有时为 None"""
+    from .models import AllocationSimulation
+
+    record = AllocationSimulation.objects.filter(bidding_round_id=round_id).first()
+    if record is None:
+        return None
+    result = dict(record.result)
+    result['computed_at'] = record.computed_at.isoformat()
+    return result
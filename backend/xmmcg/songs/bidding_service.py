@@ -4,15 +4,53 @@
 支持歌曲竞标和谱面竞标的统一处理
 """
 
-import random
-from django.db import transaction
-from django.db.models import Sum
+from itertools import islice
+from django.db import transaction, IntegrityError
+from django.db.models import F, Sum, OuterRef, Exists, Subquery, Case, When, Value
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.conf import settings
-from .models import Bid, BidResult, BiddingRound, Song, Chart, MAX_SONGS_PER_USER, RANDOM_ALLOCATION_COST
+from .models import (
+    Bid, BidEscrow, BidResult, BiddingRound, Song, Chart, AllocationLog, TargetMarketStats,
+    MAX_BIDS_PER_USER, MAX_SONGS_PER_USER, RANDOM_ALLOCATION_COST
+)
+from . import allocation, review_allocation, review_stats, favorites, ranking
 from users.models import UserProfile
+from users.token_service import TokenService
+
+
+# 可选的分配引擎
+ALLOCATION_ENGINES = ('bulk', 'legacy')
+
+# 可选的中标策略
+# - greedy：价高者得，逐条竞标先到先得
+# - optimal：最大化中标出价总和的最优匹配（见 allocation.optimal_allocate）
+ALLOCATION_STRATEGIES = allocation.ALLOCATION_STRATEGIES
+
+# 可选的互评分配方式
+# - greedy：最受限谱面优先、负担最轻的评分者优先（见 review_allocation.greedy_assign）
+# - flow：最大流，保证分配总数最大且最大任务数最小（见 review_allocation.flow_assign）
+PEER_REVIEW_METHODS = ('greedy', 'flow')
+
+# 批量提交互评时单次请求的最大条数
+PEER_REVIEW_BATCH_MAX_ITEMS = 100
+
+# 每首被分配的歌曲给原作者的奖励代币
+SONG_AUTHOR_REWARD = 100
+
+# 批量写入时每条 SQL 的最大行数/参数数（SQLite 默认参数上限为 999）
+BULK_WRITE_BATCH_SIZE = 500
+
+
+def _chunked(iterable, size):
+    """将可迭代对象按 size 切分为若干列表"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
 
 class BiddingService:
@@ -20,7 +58,7 @@ class BiddingService:
     
     @staticmethod
     @transaction.atomic
-    def allocate_bids(bidding_round_id, priority_self=False):
+    def allocate_bids(bidding_round_id, priority_self=False, engine='bulk', seed=None, strategy='greedy'):
         """
         执行竞标分配逻辑（统一支持歌曲和谱面竞标）
         
@@ -38,6 +76,16 @@ class BiddingService:
         Args:
             bidding_round_id: 竞标轮次ID
             priority_self: 是否优先分配自己的半成品谱面（仅谱面竞标有效，默认False）
+            engine: 分配引擎
+                - 'bulk'（默认）：在内存中基于 (id, user_id, target_id, amount) 元组完成整个分配，
+                  最后用少量 bulk_create / update 语句写回，写锁持有时间与竞标数量基本无关
+                - 'legacy'：逐条 save()/create() 的旧实现，仅用于对比测试
+            seed: 随机种子，控制同价竞标的排序和保底分配（默认None，自动生成；
+                  两种引擎都会把种子和全部决策记录到 AllocationLog，可用 replay_allocation 重放）
+            strategy: 中标策略
+                - 'greedy'（默认）：按出价从高到低先到先得（上述第3、4步）
+                - 'optimal'：在每人至多中标一个目标的约束下使中标出价总和最大，
+                  通常能让更多用户中标、减少保底分配；仅 bulk 引擎支持
             
         Returns:
             dict: 包含分配结果统计信息
@@ -55,7 +103,280 @@ class BiddingService:
         if bidding_round.status != 'active':
             raise ValidationError(f'只能对"进行中"的竞标轮次进行分配')
         
+        if engine not in ALLOCATION_ENGINES:
+            raise ValidationError(f'未知的分配引擎: {engine}')
+        
+        if strategy not in ALLOCATION_STRATEGIES:
+            raise ValidationError(f'未知的分配策略: {strategy}')
+        
+        if engine == 'legacy' and strategy != 'greedy':
+            raise ValidationError('legacy 引擎仅支持 greedy 策略')
+        
+        if seed is None:
+            seed = allocation.new_seed()
+        
+        bidding_type = bidding_round.bidding_type  # 'song' or 'chart'
+        
+        if engine == 'legacy':
+            outcome = BiddingService._allocate_bids_legacy(bidding_round, priority_self, seed)
+        else:
+            outcome = BiddingService._allocate_bids_bulk(bidding_round, priority_self, seed, strategy)
+        
+        # 标记竞标轮次为已完成
+        bidding_round.status = 'completed'
+        bidding_round.completed_at = timezone.now()
+        bidding_round.save()
+        
+        # 处理代币扣除
+        ignore_deduction_fail = priority_self and bidding_type == 'chart'
+        token_deduction = BiddingService.process_allocation_tokens(bidding_round.id,
+                                                                ignore_token_overshoot=ignore_deduction_fail )
+        
+        # 处理歌曲作者奖励（仅歌曲竞标）
+        song_author_rewards = {}
+        if bidding_type == 'song':
+            song_author_rewards = BiddingService.process_song_author_rewards(bidding_round.id)
+        
+        # 返回统计信息
+        target_type_name = '歌曲' if bidding_type == 'song' else '谱面'
+        result = {
+            'status': 'success',
+            'message': f'{target_type_name}竞标分配完成',
+            'bidding_type': bidding_type,
+            'engine': engine,
+            'strategy': strategy,
+            'seed': seed,
+            'total_targets': outcome['total_targets'],
+            'allocated_targets': outcome['allocated_targets'],
+            'unallocated_targets': outcome['unallocated_targets'],
+            'winners': outcome['winners'],
+            'total_bidders': outcome['total_bidders'],
+            'token_deduction': token_deduction,
+        }
+        
+        # 添加歌曲作者奖励信息（如果有）
+        if song_author_rewards:
+            result['song_author_rewards'] = song_author_rewards
+        
+        return result
+    
+    @staticmethod
+    def dry_run_allocation(bidding_round_id, priority_self=False, seed=None, strategy='greedy'):
+        """
+        分配预览（dry-run）：只读地计算完整分配结果，不修改任何数据
+
+        与 allocate_bids（bulk 引擎）使用同一套读取和计算逻辑；
+        使用返回的 seed 调用 allocate_bids 会得到与预览完全相同的分配结果。
+        
+        Args:
+            bidding_round_id: 竞标轮次ID
+            priority_self: 同 allocate_bids
+            seed: 随机种子（默认None，自动生成并在结果中返回）
+            strategy: 同 allocate_bids
+            
+        Returns:
+            dict: 统计信息（字段同 allocate_bids）以及
+                - seed: 本次使用的随机种子
+                - projected_results: 预计分配结果（中标 + 保底）
+                - token_deltas: 每个用户的预计代币变化
+                - insufficient_users: 余额不足以支付的用户ID
+            
+        Raises:
+            ValidationError: 如果竞标轮次不存在或状态不适合分配
+        """
+        try:
+            bidding_round = BiddingRound.objects.get(id=bidding_round_id)
+        except BiddingRound.DoesNotExist:
+            raise ValidationError('竞标轮次不存在')
+        
+        if bidding_round.status != 'active':
+            raise ValidationError(f'只能对"进行中"的竞标轮次进行分配预览')
+        
+        if strategy not in ALLOCATION_STRATEGIES:
+            raise ValidationError(f'未知的分配策略: {strategy}')
+        
+        if seed is None:
+            seed = allocation.new_seed()
+        
+        snapshot = BiddingService._load_allocation_snapshot(bidding_round, priority_self)
+        plan = BiddingService._plan_allocation(snapshot, seed, strategy)
+        bid_ids, user_ids, target_ids, amounts = snapshot['bids']
+        
+        projected_results = [
+            {
+                'user_id': user_ids[idx],
+                'target_id': target_ids[idx],
+                'bid_id': bid_ids[idx],
+                'amount': amounts[idx],
+                'allocation_type': 'win',
+            }
+            for idx in plan['winners']
+        ]
+        projected_results.extend(
+            {
+                'user_id': user_id,
+                'target_id': target_id,
+                'bid_id': None,
+                'amount': RANDOM_ALLOCATION_COST,
+                'allocation_type': 'random',
+            }
+            for user_id, target_id in plan['fallbacks']
+        )
+        
+        token_deltas, insufficient_users = BiddingService._project_token_deltas(
+            snapshot, projected_results,
+            ignore_token_overshoot=snapshot['prefer_own']
+        )
+        
+        result = {
+            'status': 'success',
+            'message': '分配预览（未写入数据库）',
+            'dry_run': True,
+            'bidding_type': snapshot['bidding_type'],
+            'strategy': strategy,
+            'backend': plan['backend'],
+            'seed': seed,
+        }
+        result.update(BiddingService._plan_summary(snapshot, plan))
+        result.update({
+            'projected_results': projected_results,
+            'token_deltas': token_deltas,
+            'insufficient_users': insufficient_users,
+        })
+        return result
+    
+    @staticmethod
+    def _project_token_deltas(snapshot, projected_results, ignore_token_overshoot=False):
+        """
+        按 process_allocation_tokens / process_song_author_rewards 的规则推算代币变化（只读）
+
+        Returns:
+            tuple: (token_deltas, insufficient_users)
+                token_deltas: [{'user_id', 'balance', 'deduction', 'reward', 'balance_after'}, ...]
+        """
+        deductions = {row['user_id']: row['amount'] for row in projected_results}
+        rewards = {}
+        if snapshot['bidding_type'] == 'song':
+            owner_of = snapshot['owner_of']
+            for row in projected_results:
+                author_id = owner_of.get(row['target_id'])
+                if author_id is not None:
+                    rewards[author_id] = rewards.get(author_id, 0) + SONG_AUTHOR_REWARD
+        
+        user_ids = set(deductions) | set(rewards)
+        balances = {}
+        for chunk in _chunked(sorted(user_ids), BULK_WRITE_BATCH_SIZE):
+            balances.update(UserProfile.objects.filter(user_id__in=chunk).values_list('user_id', 'token'))
+        
+        # 没有资料的用户结算时会以默认余额补建资料
+        default_balance = UserProfile._meta.get_field('token').get_default()
+        token_deltas = []
+        insufficient_users = []
+        for user_id in sorted(user_ids):
+            balance = balances.get(user_id, default_balance)
+            required = deductions.get(user_id, 0)
+            deduction = required
+            if balance < required:
+                insufficient_users.append(user_id)
+                # 与 process_allocation_tokens 一致：允许超额时扣光余额，否则不扣除
+                deduction = balance if ignore_token_overshoot else 0
+            reward = rewards.get(user_id, 0)
+            token_deltas.append({
+                'user_id': user_id,
+                'balance': balance,
+                'deduction': deduction,
+                'reward': reward,
+                'balance_after': balance - deduction + reward,
+            })
+        return token_deltas, insufficient_users
+    
+    @staticmethod
+    def replay_allocation(bidding_round_id):
+        """
+        重放并审计最近一次分配：只依据 AllocationLog 在内存中重新计算，不读取 Bid 表
+
+        核对三项：
+        - 重放得到的中标竞标与日志一致
+        - 重放得到的保底分配与日志一致
+        - 日志中的结果与当前 BidResult 表一致（发现事后被手工修改的结果）
+        
+        Returns:
+            dict: seed / strategy / backend / consistent 以及各项核对结果
+            
+        Raises:
+            ValidationError: 轮次不存在、没有分配日志或无法使用日志中的计算后端
+        """
+        try:
+            bidding_round = BiddingRound.objects.get(id=bidding_round_id)
+        except BiddingRound.DoesNotExist:
+            raise ValidationError('竞标轮次不存在')
+        
+        log = bidding_round.allocation_logs.first()
+        if log is None:
+            raise ValidationError(f'{bidding_round.name} 没有分配日志，无法重放')
+        
+        bids = log.bids
+        user_ids = [row[1] for row in bids]
+        target_ids = [row[2] for row in bids]
+        amounts = [row[3] for row in bids]
+        owner_of = dict(zip(log.targets, log.target_owners)) if log.target_owners else None
+        try:
+            plan = allocation.plan_allocation(
+                user_ids, target_ids, amounts, log.targets,
+                owner_of=owner_of,
+                prefer_own=log.priority_self,
+                seed=log.seed,
+                strategy=log.strategy,
+                backend=log.backend
+            )
+        except ValueError as e:
+            raise ValidationError(f'无法重放: {e}')
+        
+        replayed_winners = sorted(int(idx) for idx in plan['winners'])
+        replayed_fallbacks = sorted(list(pair) for pair in plan['fallbacks'])
+        winners_match = replayed_winners == sorted(log.winners)
+        fallbacks_match = replayed_fallbacks == sorted(log.fallbacks)
+        
+        # 日志中的结果 vs 当前数据库中的分配结果
+        target_field = 'song_id' if bidding_round.bidding_type == 'song' else 'chart_id'
+        logged_results = sorted(
+            [(bids[idx][1], bids[idx][2], bids[idx][3], 'win') for idx in log.winners]
+            + [(user_id, target_id, RANDOM_ALLOCATION_COST, 'random') for user_id, target_id in log.fallbacks]
+        )
+        stored_results = sorted(BidResult.objects.filter(bidding_round=bidding_round).values_list(
+            'user_id', target_field, 'bid_amount', 'allocation_type'
+        ))
+        results_match = logged_results == stored_results
+        
+        return {
+            'log_id': log.id,
+            'seed': log.seed,
+            'strategy': log.strategy,
+            'backend': log.backend,
+            'total_bids': len(bids),
+            'winners': len(replayed_winners),
+            'fallbacks': len(replayed_fallbacks),
+            'winners_match': winners_match,
+            'fallbacks_match': fallbacks_match,
+            'results_match': results_match,
+            'consistent': winners_match and fallbacks_match and results_match,
+        }
+    
+    @staticmethod
+    def _allocate_bids_legacy(bidding_round, priority_self, seed=None):
+        """
+        旧版分配实现：逐条竞标 save()，逐个结果 create()
+
+        保留用于与 bulk 引擎做写入性能对比（见 bench_bidding_allocation.py），
+        不建议在正式轮次中使用。分配决策与 bulk 引擎的 python 计算后端相同
+        （同价洗牌和保底抽取的随机数消耗顺序一致），同样写入 AllocationLog，
+        因此用 legacy 引擎完成的轮次也可以用 replay_allocation 审计。
+
+        Returns:
+            dict: total_targets / allocated_targets / unallocated_targets / winners / total_bidders
+        """
         bidding_type = bidding_round.bidding_type  # 'song' or 'chart'
+        rng = allocation.make_rng(seed)
         
         # 清空之前的分配结果（如果有重新分配）
         BidResult.objects.filter(bidding_round=bidding_round).delete()
@@ -74,6 +395,13 @@ class BiddingService:
                 bid_type='chart'
             ).select_related('user', 'chart', 'chart__user'))
         
+        # 分配日志用的竞标快照（按读取顺序，与 bulk 引擎一致）
+        bid_rows = [
+            [bid.id, bid.user.id, bid.song.id if bidding_type == 'song' else bid.chart.id, bid.amount]
+            for bid in all_bids
+        ]
+        index_of = {bid.id: idx for idx, bid in enumerate(all_bids)}
+        
         # 按出价从高到低排序，同价格随机打乱
         from collections import defaultdict
         bids_by_amount = defaultdict(list)
@@ -84,14 +412,16 @@ class BiddingService:
         sorted_bids = []
         for amount in sorted(bids_by_amount.keys(), reverse=True):
             group = bids_by_amount[amount]
-            random.shuffle(group)  # 同价格随机排序
+            rng.shuffle(group)  # 同价格随机排序
             sorted_bids.extend(group)
         
         all_bids = sorted_bids
+        order = [index_of[bid.id] for bid in all_bids]
         
         # 追踪已分配的目标和用户
         allocated_targets = set()  # 已分配的目标ID集合（歌曲或谱面）
         allocated_users = {}       # 用户ID -> 目标ID（每个用户最多一个）
+        winners = []               # 中标竞标在 bid_rows 中的下标
         
         # 第一阶段：按出价从高到低进行分配
         for bid in all_bids:
@@ -127,13 +457,16 @@ class BiddingService:
                 
                 allocated_targets.add(target_id)
                 allocated_users[bid.user.id] = target_id  # 记录用户已中标
+                winners.append(index_of[bid.id])
                 
-                # 立即drop该用户的所有其他竞标
+                # 立即drop该用户的所有其他竞标（只处理本轮类型的竞标，与 bulk 引擎一致；
+                # 查询集 update 不触发 auto_now，显式更新 updated_at）
                 Bid.objects.filter(
                     bidding_round=bidding_round,
                     user=bid.user,
+                    bid_type=bidding_type,
                     is_dropped=False
-                ).exclude(id=bid.id).update(is_dropped=True)
+                ).exclude(id=bid.id).update(is_dropped=True, updated_at=timezone.now())
             else:
                 # 该目标已被更高出价者获得，标记此竞标为drop
                 bid.is_dropped = True
@@ -158,103 +491,249 @@ class BiddingService:
             all_targets = all_targets.exclude(Exists(part_two_exists))
             all_target_ids = set(chart.id for chart in all_targets)
         
-        # 获取未被分配的目标
-        unallocated_targets = list(all_target_ids - allocated_targets)
+        # 获取未被分配的目标（排序后建池，与 allocation.plan_allocation 相同）
+        prefer_own = bidding_type == 'chart' and priority_self
         
         # 对于谱面竞标，预先建立chart_id到user_id的映射（优化查询）
         chart_owner_map = {}
-        if bidding_type == 'chart' and priority_self:
-            charts_info = Chart.objects.filter(id__in=unallocated_targets).values('id', 'user_id')
+        if prefer_own:
+            charts_info = Chart.objects.filter(id__in=all_target_ids).values('id', 'user_id')
             chart_owner_map = {chart['id']: chart['user_id'] for chart in charts_info}
+        pool = allocation.TargetPool(sorted(all_target_ids - allocated_targets), chart_owner_map)
         
         # 第二阶段：对于未获得任何目标的用户，随机分配（需扣除保底代币）
-        # 获取参与竞标的所有用户
+        # 获取参与竞标的所有用户（按用户ID顺序抽取，同一种子下与 bulk 引擎结果相同）
         bidding_users = set(bid.user.id for bid in all_bids)
+        fallbacks = []
         
-        for user_id in bidding_users:
+        for user_id in sorted(bidding_users):
             # 检查该用户是否已经获得了目标
             if user_id not in allocated_users:
+                if not pool:
+                    break
                 user = User.objects.get(id=user_id)
-                target_id = None
-                
-                # 如果启用priority_self且是谱面竞标，优先分配自己的半成品谱面
-                if priority_self and bidding_type == 'chart' and unallocated_targets:
-                    # 查找该用户自己的未分配的半成品谱面
-                    user_own_charts = [
-                        chart_id for chart_id in unallocated_targets 
-                        if chart_owner_map.get(chart_id) == user_id
-                    ]
-                    if user_own_charts:
-                        target_id = random.choice(user_own_charts)
-                
-                # 如果没有找到自己的谱面（或不启用priority_self），随机分配
-                if target_id is None and unallocated_targets:
-                    target_id = random.choice(unallocated_targets)
+                # 如果启用priority_self且是谱面竞标，优先分配自己的半成品谱面，否则随机分配
+                target_id = pool.draw(rng, owner=user_id if prefer_own else None)
                 
                 # 创建分配结果
-                if target_id is not None:
-                    if bidding_type == 'song':
-                        BidResult.objects.create(
-                            bidding_round=bidding_round,
-                            user=user,
-                            bid_type='song',
-                            song_id=target_id,
-                            bid_amount=RANDOM_ALLOCATION_COST,  # 保底分配需要支付代币
-                            allocation_type='random'
-                        )
-                    else:  # chart
-                        BidResult.objects.create(
-                            bidding_round=bidding_round,
-                            user=user,
-                            bid_type='chart',
-                            chart_id=target_id,
-                            bid_amount=RANDOM_ALLOCATION_COST,
-                            allocation_type='random'
-                        )
-                    
-                    allocated_targets.add(target_id)
-                    unallocated_targets.remove(target_id)
-        
-        # 标记竞标轮次为已完成
-        bidding_round.status = 'completed'
-        bidding_round.completed_at = timezone.now()
-        bidding_round.save()
-        
-        # 处理代币扣除
-        ignore_deduction_fail = priority_self and bidding_type == 'chart'
-        token_deduction = BiddingService.process_allocation_tokens(bidding_round.id,
-                                                                ignore_token_overshoot=ignore_deduction_fail )
+                if bidding_type == 'song':
+                    BidResult.objects.create(
+                        bidding_round=bidding_round,
+                        user=user,
+                        bid_type='song',
+                        song_id=target_id,
+                        bid_amount=RANDOM_ALLOCATION_COST,  # 保底分配需要支付代币
+                        allocation_type='random'
+                    )
+                else:  # chart
+                    BidResult.objects.create(
+                        bidding_round=bidding_round,
+                        user=user,
+                        bid_type='chart',
+                        chart_id=target_id,
+                        bid_amount=RANDOM_ALLOCATION_COST,
+                        allocation_type='random'
+                    )
+                
+                allocated_targets.add(target_id)
+                fallbacks.append([user_id, target_id])
         
-        # 处理歌曲作者奖励（仅歌曲竞标）
-        song_author_rewards = {}
-        if bidding_type == 'song':
-            song_author_rewards = BiddingService.process_song_author_rewards(bidding_round.id)
+        # 与 bulk 引擎写入同样的分配日志，供 replay_allocation 审计
+        targets = sorted(all_target_ids)
+        AllocationLog.objects.create(
+            bidding_round=bidding_round,
+            seed=seed,
+            strategy='greedy',
+            backend='python',
+            priority_self=prefer_own,
+            bids=bid_rows,
+            order=order,
+            winners=winners,
+            fallbacks=fallbacks,
+            targets=targets,
+            target_owners=[chart_owner_map[t] for t in targets] if prefer_own else None,
+        )
         
-        # 返回统计信息
-        target_type_name = '歌曲' if bidding_type == 'song' else '谱面'
-        result = {
-            'status': 'success',
-            'message': f'{target_type_name}竞标分配完成',
-            'bidding_type': bidding_type,
+        return {
             'total_targets': len(all_target_ids),
             'allocated_targets': len(allocated_targets),
-            'unallocated_targets': len(unallocated_targets),
+            'unallocated_targets': len(pool),
             'winners': len(allocated_users),
             'total_bidders': len(bidding_users),
-            'token_deduction': token_deduction,
         }
+    
+    @staticmethod
+    def _allocate_bids_bulk(bidding_round, priority_self, seed=None, strategy='greedy'):
+        """
+        集合式分配实现：整场竞标在内存中完成，最后批量写回
+
+        分配方案由 _plan_allocation（纯内存计算，与 dry_run_allocation 共用）给出，
+        本方法只负责写回结果：
+        - 中标/保底结果一次 bulk_create
+        - drop 标记：一条 UPDATE 把没有对应中标结果的有效竞标标记为 drop，
+          中标竞标不被改写（is_dropped / updated_at 与 legacy 引擎写入后的状态相同）
+        - 写入 AllocationLog，记录种子和全部决策，供 replay_allocation 审计
+
+        python 计算后端下与旧实现的随机数消耗顺序一致（同一随机种子下中标和保底结果都相同）；
+        计算后端由 settings.BIDDING_ALLOCATION_BACKEND 控制。
+
+        Returns:
+            dict: total_targets / allocated_targets / unallocated_targets / winners / total_bidders
+        """
+        bidding_type = bidding_round.bidding_type
+        target_field = 'song_id' if bidding_type == 'song' else 'chart_id'
         
-        # 添加歌曲作者奖励信息（如果有）
-        if song_author_rewards:
-            result['song_author_rewards'] = song_author_rewards
+        # 清空之前的分配结果（如果有重新分配）
+        BidResult.objects.filter(bidding_round=bidding_round).delete()
         
-        return result
+        active_bids = BiddingService._active_bids_queryset(bidding_round)
+        snapshot = BiddingService._load_allocation_snapshot(bidding_round, priority_self)
+        plan = BiddingService._plan_allocation(snapshot, seed, strategy)
+        bid_ids, user_ids, target_ids, amounts = snapshot['bids']
+        
+        results = []
+        for idx in plan['winners']:
+            results.append(BidResult(
+                bidding_round=bidding_round,
+                user_id=user_ids[idx],
+                bid_type=bidding_type,
+                bid_amount=amounts[idx],
+                allocation_type='win',
+                **{target_field: target_ids[idx]}
+            ))
+        for user_id, target_id in plan['fallbacks']:
+            results.append(BidResult(
+                bidding_round=bidding_round,
+                user_id=user_id,
+                bid_type=bidding_type,
+                bid_amount=RANDOM_ALLOCATION_COST,  # 保底分配需要支付代币
+                allocation_type='random',
+                **{target_field: target_id}
+            ))
+        
+        # 批量写回
+        BidResult.objects.bulk_create(results, batch_size=BULK_WRITE_BATCH_SIZE)
+        # 每个用户对每个目标至多一个有效竞标（unique_active_*_bid），按 (用户, 目标) 即可识别中标竞标
+        won = BidResult.objects.filter(
+            bidding_round=bidding_round,
+            allocation_type='win',
+            user_id=OuterRef('user_id'),
+            **{target_field: OuterRef(target_field)}
+        )
+        active_bids.exclude(Exists(won)).update(is_dropped=True, updated_at=timezone.now())
+        
+        owner_of = snapshot['owner_of']
+        AllocationLog.objects.create(
+            bidding_round=bidding_round,
+            seed=seed,
+            strategy=strategy,
+            backend=plan['backend'],
+            priority_self=snapshot['prefer_own'],
+            bids=[list(row) for row in zip(bid_ids, user_ids, target_ids, amounts)],
+            order=[int(x) for x in plan['order']],
+            winners=[int(idx) for idx in plan['winners']],
+            fallbacks=[list(pair) for pair in plan['fallbacks']],
+            targets=snapshot['targets'],
+            target_owners=[owner_of[t] for t in snapshot['targets']] if snapshot['prefer_own'] else None,
+        )
+        
+        return BiddingService._plan_summary(snapshot, plan)
     
     @staticmethod
+    def _active_bids_queryset(bidding_round):
+        """该轮次参与分配的有效竞标"""
+        return Bid.objects.filter(
+            bidding_round=bidding_round,
+            is_dropped=False,
+            bid_type=bidding_round.bidding_type
+        )
+    
+    @staticmethod
+    def _load_allocation_snapshot(bidding_round, priority_self):
+        """
+        读取分配所需的全部输入（两条查询，不实例化模型）
+
+        Returns:
+            dict:
+                - bids: (bid_ids, user_ids, target_ids, amounts) 四个等长元组
+                - targets: 可分配目标ID列表
+                - owner_of: 目标ID -> 拥有者用户ID
+                - prefer_own: 保底是否优先分配自己的谱面
+        """
+        bidding_type = bidding_round.bidding_type
+        target_field = 'song_id' if bidding_type == 'song' else 'chart_id'
+        # 保持与旧实现相同的读取顺序（Meta.ordering），保证同一种子下洗牌结果一致
+        bid_rows = list(BiddingService._active_bids_queryset(bidding_round).values_list(
+            'id', 'user_id', target_field, 'amount'
+        ))
+        bids = tuple(zip(*bid_rows)) if bid_rows else ((), (), (), ())
+        
+        # 可分配目标及其拥有者（歌曲作者奖励预览和 priority_self 都需要）
+        owner_of = dict(
+            BiddingService._available_targets_queryset(bidding_type).values_list('id', 'user_id')
+        )
+        return {
+            'bidding_type': bidding_type,
+            'bids': bids,
+            'targets': sorted(owner_of),
+            'owner_of': owner_of,
+            'prefer_own': bidding_type == 'chart' and priority_self,
+        }
+    
+    @staticmethod
+    def _plan_allocation(snapshot, seed, strategy):
+        """在快照上计算完整分配方案（纯内存，见 allocation.plan_allocation）"""
+        bid_ids, user_ids, target_ids, amounts = snapshot['bids']
+        return allocation.plan_allocation(
+            user_ids, target_ids, amounts,
+            snapshot['targets'],
+            owner_of=snapshot['owner_of'],
+            prefer_own=snapshot['prefer_own'],
+            seed=seed,
+            strategy=strategy,
+            backend=getattr(settings, 'BIDDING_ALLOCATION_BACKEND', 'auto')
+        )
+    
+    @staticmethod
+    def _plan_summary(snapshot, plan):
+        """分配方案的统计信息（与 allocate_bids 返回值中的统计字段一致）"""
+        user_ids, target_ids = snapshot['bids'][1], snapshot['bids'][2]
+        won_targets = set(target_ids[idx] for idx in plan['winners'])
+        return {
+            'total_targets': len(snapshot['targets']),
+            'allocated_targets': len(won_targets) + len(plan['fallbacks']),
+            'unallocated_targets': plan['remaining'],
+            'winners': len(plan['winners']),
+            'total_bidders': len(set(user_ids)),
+        }
+    
+    @staticmethod
+    def _available_targets_queryset(bidding_type):
+        """
+        获取可分配目标的查询集
+        - 歌曲竞标：所有歌曲
+        - 谱面竞标：第一部分且尚无第二部分的谱面
+        """
+        if bidding_type == 'song':
+            return Song.objects.all()
+        part_two_exists = Chart.objects.filter(
+            part_one_chart=OuterRef('pk'),
+            is_part_one=False
+        )
+        return Chart.objects.filter(
+            is_part_one=True,
+            status__in=['submitted', 'reviewed', 'part_submitted']
+        ).exclude(Exists(part_two_exists))
+    
+    @staticmethod
+    @transaction.atomic
     def create_bid(user, bidding_round, amount, song=None, chart=None):
         """
         创建竞标（支持歌曲或谱面）
         
+        竞标数量上限和余额校验通过 BidEscrow 一次完成（见 _reserve_escrow）：
+        用户在本轮所有未撤回竞标的金额之和不能超过当前代币余额。
+        
         Args:
             user: 竞标用户
             bidding_round: 竞标轮次
@@ -285,14 +764,6 @@ class BiddingService:
         if bidding_round.bidding_type != bid_type:
             raise ValidationError(f'该轮次是{bidding_round.get_bidding_type_display()}，不能竞标{"歌曲" if bid_type == "chart" else "谱面"}')
         
-        # 验证用户代币余额
-        try:
-            profile = UserProfile.objects.get(user=user)
-            if profile.token < amount:
-                raise ValidationError('代币余额不足')
-        except UserProfile.DoesNotExist:
-            raise ValidationError('用户资料不存在')
-        
         # 验证竞标金额
         if amount < 0:
             raise ValidationError('竞标金额必须大于等于0')
@@ -305,50 +776,182 @@ class BiddingService:
         if chart and chart.status != 'part_submitted':
             raise ValidationError(f'只能竞标半成品谱面，该谱面当前状态为：{chart.get_status_display()}')
         
-        # 验证用户在该轮次的竞标数量
-        bid_count = Bid.objects.filter(
-            bidding_round=bidding_round,
-            user=user,
-            is_dropped=False
-        ).count()
+        # 验证竞标数量和代币余额，并占用承诺额度（后续校验失败时随事务回滚）
+        BiddingService._reserve_escrow(user, bidding_round, amount)
+        
+        # 创建竞标；重复竞标由部分唯一约束（同一轮同一用户同一目标只能有一个未撤回竞标）拦截
+        try:
+            with transaction.atomic():
+                bid = Bid.objects.create(
+                    bidding_round=bidding_round,
+                    user=user,
+                    bid_type=bid_type,
+                    song=song,
+                    chart=chart,
+                    amount=amount
+                )
+        except IntegrityError:
+            raise ValidationError('您已经对该歌曲竞标过了' if song else '您已经对该谱面竞标过了')
+        
+        BiddingService._record_market_bid(bid)
         
-        from .models import MAX_BIDS_PER_USER
-        if bid_count >= MAX_BIDS_PER_USER:
+        return bid
+    
+    @staticmethod
+    def _reserve_escrow(user, bidding_round, amount):
+        """
+        占用竞标承诺额度
+        
+        一条条件 UPDATE 同时完成校验和占用：
+            UPDATE songs_bidescrow
+            SET committed_tokens = committed_tokens + amount, active_bids = active_bids + 1
+            WHERE bidding_round_id = ? AND user_id = ?
+              AND active_bids < MAX_BIDS_PER_USER
+              AND committed_tokens <= (SELECT token FROM users_userprofile WHERE user_id = ?) - amount
+        条件不满足时不产生任何写入，再读取一次用于给出具体的错误原因。
+        没有匹配的行时（可能是用户在本轮的第一次竞标，承诺行尚不存在）先确保承诺行存在再重试一次；
+        并发的第一次竞标中 get_or_create 未创建行的一方同样需要重试，不能直接判定为余额不足。
+        
+        Raises:
+            ValidationError: 用户资料不存在、超过竞标数量上限或代币余额不足
+        """
+        balance = Subquery(UserProfile.objects.filter(user_id=OuterRef('user_id')).values('token')[:1])
+        escrows = BidEscrow.objects.filter(bidding_round=bidding_round, user=user)
+        
+        def reserve():
+            return escrows.alias(balance=balance).filter(
+                active_bids__lt=MAX_BIDS_PER_USER,
+                committed_tokens__lte=F('balance') - amount
+            ).update(
+                committed_tokens=F('committed_tokens') + amount,
+                active_bids=F('active_bids') + 1,
+                updated_at=timezone.now()
+            )
+        
+        if reserve():
+            return
+        BidEscrow.objects.get_or_create(bidding_round=bidding_round, user=user)
+        if reserve():
+            return
+        
+        escrow = escrows.annotate(balance=balance).values('committed_tokens', 'active_bids', 'balance').get()
+        if escrow['balance'] is None:
+            raise ValidationError('用户资料不存在')
+        if escrow['active_bids'] >= MAX_BIDS_PER_USER:
             raise ValidationError(
                 f'超过每轮最多竞标 {MAX_BIDS_PER_USER} 个的限制'
             )
+        raise ValidationError(
+            f'代币余额不足：当前余额 {escrow["balance"]}，本轮已承诺 {escrow["committed_tokens"]}'
+        )
+    
+    @staticmethod
+    @transaction.atomic
+    def delete_bid(bid):
+        """
+        撤回竞标，并释放其占用的承诺额度
         
-        # 检查用户是否已经对该目标竞标过
-        if song:
-            existing_bid = Bid.objects.filter(
-                bidding_round=bidding_round,
-                user=user,
-                song=song,
-                is_dropped=False
-            ).first()
-            if existing_bid:
-                raise ValidationError('您已经对该歌曲竞标过了')
-        else:  # chart
-            existing_bid = Bid.objects.filter(
-                bidding_round=bidding_round,
-                user=user,
-                chart=chart,
-                is_dropped=False
-            ).first()
-            if existing_bid:
-                raise ValidationError('您已经对该谱面竞标过了')
-        
-        # 创建竞标
-        bid = Bid.objects.create(
-            bidding_round=bidding_round,
-            user=user,
-            bid_type=bid_type,
-            song=song,
-            chart=chart,
-            amount=amount
+        Args:
+            bid: 要撤回的竞标
+        """
+        is_active = not bid.is_dropped
+        if is_active:
+            BidEscrow.objects.filter(bidding_round_id=bid.bidding_round_id, user_id=bid.user_id).update(
+                committed_tokens=F('committed_tokens') - bid.amount,
+                active_bids=F('active_bids') - 1,
+                updated_at=timezone.now()
+            )
+        bid.delete()
+        if is_active:
+            BiddingService._release_market_bid(bid)
+    
+    @staticmethod
+    def _market_stats_for(bid):
+        """竞标目标对应的行情行（QuerySet）"""
+        target = {'song_id': bid.song_id} if bid.song_id else {'chart_id': bid.chart_id}
+        return TargetMarketStats.objects.filter(bidding_round_id=bid.bidding_round_id, **target)
+    
+    @staticmethod
+    def _record_market_bid(bid):
+        """
+        新竞标计入目标行情
+        
+        一条 UPDATE 完成（SET 子句中的列引用都是更新前的值）：
+            bid_count + 1；
+            amount > max_amount 时 second_amount = max_amount、max_amount = amount；
+            否则 amount > second_amount 时 second_amount = amount
+        目标在本轮的第一个竞标时先创建行情行再重试。
+        """
+        amount = bid.amount
+        stats = BiddingService._market_stats_for(bid)
+        
+        def record():
+            return stats.update(
+                bid_count=F('bid_count') + 1,
+                max_amount=Case(
+                    When(max_amount__lt=amount, then=Value(amount)),
+                    default=F('max_amount')
+                ),
+                second_amount=Case(
+                    When(max_amount__lt=amount, then=F('max_amount')),
+                    When(second_amount__lt=amount, then=Value(amount)),
+                    default=F('second_amount')
+                ),
+                updated_at=timezone.now()
+            )
+        
+        if not record():
+            TargetMarketStats.objects.get_or_create(
+                bidding_round_id=bid.bidding_round_id,
+                song_id=bid.song_id,
+                chart_id=bid.chart_id,
+                defaults={'bid_type': bid.bid_type}
+            )
+            record()
+    
+    @staticmethod
+    def _release_market_bid(bid):
+        """
+        撤回的竞标移出目标行情（需在竞标删除之后调用）
+        
+        出价低于第二高价时只需 bid_count - 1；
+        否则最高价/第二高价可能变化，从索引 (bidding_round, song/chart, is_dropped) 上取前两名重新计算。
+        """
+        stats = BiddingService._market_stats_for(bid)
+        now = timezone.now()
+        if stats.filter(second_amount__gt=bid.amount).update(bid_count=F('bid_count') - 1, updated_at=now):
+            return
+        target = {'song_id': bid.song_id} if bid.song_id else {'chart_id': bid.chart_id}
+        top_two = list(Bid.objects.filter(
+            bidding_round_id=bid.bidding_round_id,
+            is_dropped=False,
+            **target
+        ).order_by('-amount').values_list('amount', flat=True)[:2]) + [0, 0]
+        stats.update(
+            bid_count=F('bid_count') - 1,
+            max_amount=top_two[0],
+            second_amount=top_two[1],
+            updated_at=now
         )
+    
+    @staticmethod
+    def get_market_stats(bidding_round, song_ids=None, chart_ids=None):
+        """
+        批量获取目标行情（一次索引查询）
         
-        return bid
+        Args:
+            bidding_round: 竞标轮次
+            song_ids / chart_ids: 目标ID列表（均为 None 时返回该轮次全部目标）
+            
+        Returns:
+            QuerySet: TargetMarketStats 集合
+        """
+        stats = TargetMarketStats.objects.filter(bidding_round=bidding_round)
+        if song_ids is not None:
+            stats = stats.filter(song_id__in=song_ids)
+        elif chart_ids is not None:
+            stats = stats.filter(chart_id__in=chart_ids)
+        return stats.order_by('id')
     
     @staticmethod
     @transaction.atomic
@@ -362,6 +965,10 @@ class BiddingService:
         3. 随机分配的用户（bid_amount=0）不扣除代币
         4. 返回处理统计
         
+        实现：一条查询读取应扣金额，一条查询读取（锁定）余额，在内存中按集合划分
+        余额充足/不足的用户，再由 TokenService.apply_deltas 按批 UPDATE（token = token + CASE ...）并记流水，
+        总查询数与用户数基本无关（SQLite 下每 333 个用户一条 UPDATE）。
+        
         Args:
             bidding_round_id: 竞标轮次ID
             ignore_token_overshoot:bool=False 是否忽略代币不足的用户（默认False，抛出异常）。
@@ -380,45 +987,50 @@ class BiddingService:
         except BiddingRound.DoesNotExist:
             raise ValidationError('竞标轮次不存在')
         
-        # 获取该轮次的所有分配结果（包括竞价和随机分配）
-        results = BidResult.objects.filter(
-            bidding_round=bidding_round
-        ).select_related('user', 'song')
+        # 每个用户应扣金额（包括竞价和随机分配），一条查询
+        results = BidResult.objects.filter(bidding_round=bidding_round)
+        required = {}
+        for user_id, amount in results.values_list('user_id', 'bid_amount'):
+            required[user_id] = required.get(user_id, 0) + amount
+        
+        # 补建缺失的用户资料，并一次性读取（锁定）余额
+        TokenService.ensure_profiles(results.values('user_id'))
+        balances = dict(
+            UserProfile.objects.select_for_update()
+            .filter(user_id__in=results.values('user_id'))
+            .values_list('user_id', 'token')
+        )
         
+        # 在内存中按集合划分：余额充足的直接扣除；不足的记为失败，或在允许时扣光余额
+        deltas = {}
+        insufficient = []
         total_deducted = 0
         users_deducted = 0
-        failed_users = []
-        
-        for result in results:
-            try:
-                # 获取或创建用户资料
-                profile, created = UserProfile.objects.get_or_create(user=result.user)
-                
-                # 验证代币足够
-                if (profile.token < result.bid_amount):
-                    if not ignore_token_overshoot:
-                        failed_users.append({
-                            'user': result.user.username,
-                            'required': result.bid_amount,
-                            'available': profile.token
-                        })
-                    else:
-                        profile.token = 0 # 扣光代币，不报错
-                        profile.save()
-                    continue
-                
-                # 扣除代币
-                profile.token -= result.bid_amount
-                profile.save()
-                
-                total_deducted += result.bid_amount
-                users_deducted += 1
-                
-            except Exception as e:
-                failed_users.append({
-                    'user': result.user.username,
-                    'error': str(e)
-                })
+        for user_id, amount in required.items():
+            balance = balances[user_id]
+            if balance < amount:
+                if ignore_token_overshoot:
+                    deltas[user_id] = -balance  # 扣光代币，不报错
+                else:
+                    insufficient.append(user_id)
+                continue
+            deltas[user_id] = -amount
+            total_deducted += amount
+            users_deducted += 1
+        
+        TokenService.apply_deltas(deltas, reason='bid_settlement', memo=f'竞标轮次: {bidding_round.name}')
+        
+        usernames = {}
+        for chunk in _chunked(insufficient, BULK_WRITE_BATCH_SIZE):
+            usernames.update(User.objects.filter(id__in=chunk).values_list('id', 'username'))
+        failed_users = [
+            {
+                'user': usernames.get(user_id),
+                'required': required[user_id],
+                'available': balances[user_id]
+            }
+            for user_id in insufficient
+        ]
         
         return {
             'total_deducted': total_deducted,
@@ -462,44 +1074,27 @@ class BiddingService:
                 'total_reward': 0
             }
         
-        # 获取该轮次所有歌曲分配结果
-        results = BidResult.objects.filter(
-            bidding_round=bidding_round,
-            bid_type='song'
-        ).select_related('song', 'song__user')
-        
         # 统计每个歌曲作者的奖励（一个作者可能有多首歌被分配）
+        author_ids = BidResult.objects.filter(
+            bidding_round=bidding_round,
+            bid_type='song',
+            song__isnull=False
+        ).values_list('song__user_id', flat=True)
         author_rewards = {}  # user_id -> reward_count
-        
-        for result in results:
-            if result.song and result.song.user:
-                author_id = result.song.user.id
-                author_rewards[author_id] = author_rewards.get(author_id, 0) + 1
-        
-        # 给每个歌曲作者发放奖励代币
-        total_rewarded = 0
-        rewarded_authors = 0
+        for author_id in author_ids:
+            author_rewards[author_id] = author_rewards.get(author_id, 0) + 1
+        
+        # 每首被分配的歌曲奖励100代币，一次性发放
+        TokenService.ensure_profiles(author_ids)
+        TokenService.apply_deltas(
+            {author_id: reward_count * SONG_AUTHOR_REWARD for author_id, reward_count in author_rewards.items()},
+            reason='author_reward',
+            memo=f'竞标轮次: {bidding_round.name}'
+        )
+        total_rewarded = sum(author_rewards.values()) * SONG_AUTHOR_REWARD
+        rewarded_authors = len(author_rewards)
         failed_rewards = []
         
-        for author_id, reward_count in author_rewards.items():
-            try:
-                author = User.objects.get(id=author_id)
-                profile, created = UserProfile.objects.get_or_create(user=author)
-                
-                # 每首被分配的歌曲奖励100代币
-                reward_amount = reward_count * 100
-                profile.token += reward_amount
-                profile.save()
-                
-                total_rewarded += reward_amount
-                rewarded_authors += 1
-                
-            except Exception as e:
-                failed_rewards.append({
-                    'author_id': author_id,
-                    'error': str(e)
-                })
-        
         return {
             'message': f'歌曲作者奖励发放完成',
             'rewarded_authors': rewarded_authors,
@@ -547,23 +1142,33 @@ class PeerReviewService:
     
     @staticmethod
     @transaction.atomic
-    def allocate_peer_reviews(bidding_round_id, min_reviews_per_chart=None):
+    def allocate_peer_reviews(bidding_round_id, min_reviews_per_chart=None, method='greedy', incremental=False):
         """
         为某个竞标轮次分配互评任务
 
         目标：每张谱面至少收到 min_reviews_per_chart 个评分。
         在此前提下，尽量均衡每个评分者的任务数。
 
-        算法：
+        算法（method='greedy'）：
         - 每轮选"合法评分者最少"的谱面（最受限优先），平局时选评分数最少的
         - 对该谱面选"当前任务最少"的合法评分者
         - 每人的自然上限为：可评谱面总数（谱面数 - 自己参与的谱面数）
         - 循环直到所有谱面达到目标评分数，或无法再分配为止
 
+        method='flow' 时按最大流求解：只要存在可行分配就一定能让每张谱面达到目标，
+        并在此前提下使评分者的最大任务数最小。
+
+        incremental=True 时不清空已有分配，只补足差额（适用于迟交谱面、评分者退出后重新分配）：
+        - 已完成的分配全部保留（其 PeerReview 记录指向它们）
+        - 待评分的分配仍然有效（谱面仍可评、评分者仍参与、评分者不是贡献者）时保留，否则撤销
+        - 保留的有效分配计入评分数和任务数，只为未达到目标的谱面新增分配
+
         Args:
             bidding_round_id: 竞标轮次ID
             min_reviews_per_chart: 每张谱面至少收到的评分数
                                    （默认从 settings.PEER_REVIEW_MIN_PER_CHART 读取，缺省 8）
+            method: 分配方式，见 PEER_REVIEW_METHODS
+            incremental: 是否增量分配（默认 False，清空后全部重新分配）
 
         Returns:
             dict: 包含分配结果统计
@@ -578,6 +1183,9 @@ class PeerReviewService:
 
         if min_reviews_per_chart <= 0:
             raise ValidationError('min_reviews_per_chart 必须大于 0')
+
+        if method not in PEER_REVIEW_METHODS:
+            raise ValidationError(f'未知的互评分配方式: {method}')
         
         # 获取竞标轮次
         try:
@@ -607,7 +1215,7 @@ class PeerReviewService:
             if chart.part_one_chart:
                 reviewer_ids.add(chart.part_one_chart.user_id)  # 一部分原作者（可能与提交者同一人）
         
-        reviewers = User.objects.filter(id__in=reviewer_ids)
+        reviewers = User.objects.filter(id__in=reviewer_ids).order_by('id')
         
         num_charts = charts.count()
         num_reviewers = reviewers.count()
@@ -625,83 +1233,78 @@ class PeerReviewService:
             chart_contributors_map[chart.id] = contributors
 
         # 每人的自然上限：可以评的谱面数 = 总谱面数 - 自己参与的谱面数
-        reviewer_authored_counts = {}
-        for contributors in chart_contributors_map.values():
-            for uid in contributors:
-                reviewer_authored_counts[uid] = reviewer_authored_counts.get(uid, 0) + 1
-        reviewer_max_tasks = {
-            r.id: num_charts - reviewer_authored_counts.get(r.id, 0)
-            for r in reviewers_list
-        }
+        reviewer_max_tasks = review_allocation.natural_capacity(
+            chart_contributors_map.keys(),
+            [r.id for r in reviewers_list],
+            chart_contributors_map
+        )
 
         print(f"[互评分配] {num_charts}张谱面，{num_reviewers}个评分者，目标每张谱面至少{min_reviews_per_chart}个评分")
 
-        # 清空已有的分配（重新分配）
-        PeerReviewAllocation.objects.filter(
-            bidding_round=bidding_round
-        ).delete()
-
-        # 初始化分配计数
-        reviewer_task_counts = {reviewer.id: 0 for reviewer in reviewers_list}
-        assigned_pairs = set()
-        allocations = []
-        stuck_charts = set()  # 已无合法评分者、无法再增加评分的谱面
-
-        def get_eligible_reviewers(chart):
-            return [
-                r for r in reviewers_list
-                if (reviewer_task_counts[r.id] < reviewer_max_tasks[r.id]
-                    and r.id not in chart_contributors_map.get(chart.id, set())
-                    and (r.id, chart.id) not in assigned_pairs)
-            ]
-
-        # 贪心分配：最受限优先（合法评分者最少的谱面先处理），平局时取评分最少的谱面
-        # 循环直到所有谱面达到 min_reviews_per_chart，或无法继续分配
-        while True:
-            # 还未达到目标评分数且未卡住的谱面
-            needed_charts = [
-                c for c in charts_list
-                if c.id not in stuck_charts and chart_review_counts[c.id] < min_reviews_per_chart
-            ]
-            if not needed_charts:
-                break
-
-            # 为每张需要评分的谱面计算合法评分者列表
-            charts_with_eligible = []
-            for c in needed_charts:
-                eligible = get_eligible_reviewers(c)
-                if not eligible:
-                    stuck_charts.add(c.id)
-                    print(
-                        f'[互评分配] 警告：谱面 {c.id} (作者:{c.user.username}) '
-                        f'已无合法评分者，最终获得 {chart_review_counts[c.id]} 个评分（目标{min_reviews_per_chart}）'
-                    )
-                else:
-                    charts_with_eligible.append((c, eligible))
+        existing_pairs = []
+        removed_pairs = []
+        kept_count = 0
+        if incremental:
+            # 增量分配：有效的分配计入已有评分；失效的待评分分配撤销，失效的已完成分配原样保留但不计入
+            reviewer_id_set = {reviewer.id for reviewer in reviewers_list}
+            stale_ids = []
+            for allocation_id, reviewer_id, chart_id, allocation_status in PeerReviewAllocation.objects.filter(
+                bidding_round=bidding_round
+            ).values_list('id', 'reviewer_id', 'chart_id', 'status'):
+                valid = (
+                    chart_id in chart_contributors_map
+                    and reviewer_id in reviewer_id_set
+                    and reviewer_id not in chart_contributors_map[chart_id]
+                )
+                if valid:
+                    existing_pairs.append((reviewer_id, chart_id))
+                elif allocation_status == 'pending':
+                    stale_ids.append(allocation_id)
+                    removed_pairs.append((reviewer_id, chart_id))
+                    continue
+                kept_count += 1
+            for chunk in _chunked(stale_ids, BULK_WRITE_BATCH_SIZE):
+                PeerReviewAllocation.objects.filter(id__in=chunk).delete()
+            print(f"[互评分配] 增量模式：保留{kept_count}个已有分配，撤销{len(removed_pairs)}个失效的待评分分配")
+        else:
+            # 清空已有的分配（重新分配）
+            PeerReviewAllocation.objects.filter(
+                bidding_round=bidding_round
+            ).delete()
 
-            if not charts_with_eligible:
-                break
+        # greedy：最受限优先（合法评分者最少的谱面先处理），平局时取评分最少的谱面；
+        # 为谱面选当前任务最少的合法评分者。循环直到所有谱面达到 min_reviews_per_chart，或无法继续分配
+        # flow：最大流 + 二分最大任务数
+        assign = review_allocation.flow_assign if method == 'flow' else review_allocation.greedy_assign
+        outcome = assign(
+            [chart.id for chart in charts_list],
+            [reviewer.id for reviewer in reviewers_list],
+            chart_contributors_map,
+            min_reviews_per_chart,
+            capacity=reviewer_max_tasks,
+            existing=existing_pairs
+        )
+        chart_review_counts = outcome['chart_counts']
+        reviewer_task_counts = outcome['reviewer_loads']
 
-            # 最受限优先：合法评分者最少的谱面排前面；平局时取当前评分最少的
-            charts_with_eligible.sort(
-                key=lambda x: (len(x[1]), chart_review_counts[x[0].id])
+        charts_by_id = {chart.id: chart for chart in charts_list}
+        for chart_id in outcome['stuck']:
+            print(
+                f'[互评分配] 警告：谱面 {chart_id} (作者:{charts_by_id[chart_id].user.username}) '
+                f'已无合法评分者，最终获得 {chart_review_counts[chart_id]} 个评分（目标{min_reviews_per_chart}）'
             )
-            chart, eligible_reviewers = charts_with_eligible[0]
-
-            # 选当前任务最少的评分者，均衡各人负担
-            reviewer = min(eligible_reviewers, key=lambda r: reviewer_task_counts[r.id])
 
-            allocations.append(PeerReviewAllocation(
+        allocations = [
+            PeerReviewAllocation(
                 bidding_round=bidding_round,
-                reviewer=reviewer,
-                chart=chart
-            ))
-            assigned_pairs.add((reviewer.id, chart.id))
-            chart_review_counts[chart.id] += 1
-            reviewer_task_counts[reviewer.id] += 1
+                reviewer_id=reviewer_id,
+                chart_id=chart_id
+            )
+            for reviewer_id, chart_id in outcome['pairs']
+        ]
 
         # 批量创建分配记录
-        PeerReviewAllocation.objects.bulk_create(allocations)
+        PeerReviewAllocation.objects.bulk_create(allocations, batch_size=BULK_WRITE_BATCH_SIZE)
 
         # 统计实际分配结果
         actual_chart_counts = list(chart_review_counts.values())
@@ -711,7 +1314,7 @@ class PeerReviewService:
         reached_target = all(v >= min_reviews_per_chart for v in actual_chart_counts)
         if not reached_target:
             print(f"[互评分配] 注意：部分谱面评分数不足目标值{min_reviews_per_chart}，实际范围：{actual_min}~{actual_max}")
-        print(f"[互评分配] 完成，共{len(allocations)}个分配，每张谱面{actual_min}~{actual_max}个评分，每人{min(actual_task_counts)}~{max(actual_task_counts)}个任务")
+        print(f"[互评分配] 完成，新增{len(allocations)}个分配，每张谱面{actual_min}~{actual_max}个评分，每人{min(actual_task_counts)}~{max(actual_task_counts)}个任务")
 
         # 更新所有谱面状态为 under_review（从可评分的状态转为评分中）
         Chart.objects.filter(
@@ -719,9 +1322,9 @@ class PeerReviewService:
             status__in=['final_submitted', 'submitted']
         ).update(status='under_review')
 
-        return {
+        result = {
             'bidding_round_id': bidding_round_id,
-            'total_allocations': len(allocations),
+            'total_allocations': len(existing_pairs) + len(allocations),
             'charts_count': num_charts,
             'reviewers_count': num_reviewers,
             'min_reviews_per_chart_target': min_reviews_per_chart,
@@ -730,10 +1333,36 @@ class PeerReviewService:
             'reached_target': reached_target,
             'tasks_per_reviewer_min': min(actual_task_counts),
             'tasks_per_reviewer_max': max(actual_task_counts),
+            'method': method,
+            'incremental': incremental,
             'status': 'success'
         }
+        if incremental:
+            # 变更明细：新增/撤销的 (评分者, 谱面)，以及每张谱面新增的评分数
+            existing_chart_ids = {chart_id for _, chart_id in existing_pairs}
+            added_per_chart = {}
+            for _, chart_id in outcome['pairs']:
+                added_per_chart[chart_id] = added_per_chart.get(chart_id, 0) + 1
+            result.update({
+                'kept_allocations': kept_count,
+                'created_allocations': len(allocations),
+                'removed_allocations': len(removed_pairs),
+                'created': [{'reviewer_id': r, 'chart_id': c} for r, c in outcome['pairs']],
+                'removed': [{'reviewer_id': r, 'chart_id': c} for r, c in removed_pairs],
+                'added_per_chart': added_per_chart,
+                'new_charts': sorted(set(added_per_chart) - existing_chart_ids),
+                'stuck_charts': list(outcome['stuck']),
+            })
+        return result
     
     @staticmethod
+    def _favorite_value(value):
+        """把请求中的真爱票取值（true/"false"/1 等）转换为布尔值，保证计数与保存的值一致"""
+        from .models import PeerReview
+        return PeerReview._meta.get_field('favorite').to_python(value or False)
+    
+    @staticmethod
+    @transaction.atomic
     def submit_peer_review(allocation_id, score, comment=None,favorite=False):
         """
         提交互评打分
@@ -763,35 +1392,179 @@ class PeerReviewService:
         if score < 0 or score > PEER_REVIEW_MAX_SCORE:
             raise ValidationError(f'评分必须在0-{PEER_REVIEW_MAX_SCORE}之间')
         
+        favorite = PeerReviewService._favorite_value(favorite)
+        
+        # 条件更新标记分配为已完成，防止并发重复提交
+        if not PeerReviewAllocation.objects.filter(id=allocation_id, status='pending').update(status='completed'):
+            raise ValidationError('该任务已完成')
+        allocation.status = 'completed'
+        
         # 创建评分记录
         review = PeerReview.objects.create(
             allocation=allocation,
-            reviewer=allocation.reviewer,
-            chart=allocation.chart,
+            reviewer_id=allocation.reviewer_id,
+            chart_id=allocation.chart_id,
             score=score,
             comment=comment,
             favorite=favorite,
         )
         
-        # 标记分配为已完成
-        allocation.status = 'completed'
-        allocation.save()
-        
-        # 更新谱面的评分统计（仅计数，平均分后期统计）
-        chart = allocation.chart
-        chart.review_count += 1
-        chart.total_score += score
-        
-        # 检查该谱面是否已收到所有评分
-        expected_reviews = getattr(settings, 'PEER_REVIEW_TASKS_PER_USER', 8)
-        if chart.review_count >= expected_reviews:
-            chart.status = 'reviewed'
-            chart.review_completed_at = review.created_at
-        
-        chart.save()
+        # 原子地更新谱面的评分统计（评分数、总分、平均分、真爱票），并检查是否已收到所有评分
+        review_stats.apply_review_deltas(
+            {allocation.chart_id: (1, score)},
+            {allocation.chart_id: 1 if favorite else 0}
+        )
+        review_stats.mark_review_completed([allocation.chart_id])
+        if favorite:
+            favorites.invalidate_leaderboards([allocation.bidding_round_id])
+        ranking.invalidate_rankings([allocation.bidding_round_id])
         
         return review
     
+    @staticmethod
+    @transaction.atomic
+    def submit_peer_reviews(user, items):
+        """
+        批量提交互评打分（全部成功或全部失败）
+
+        与逐条调用 submit_peer_review 相比：
+        - 一次查询取出并校验全部分配任务（必须属于 user 且尚未完成）
+        - 用一条条件 UPDATE 把任务标记为已完成，受影响行数不足说明有并发提交，整体回滚
+        - bulk_create 写入全部评分记录
+        - 按谱面分组，用一条 F() 表达式 UPDATE 累加 review_count / total_score 并推导 average_score
+          （见 review_stats.apply_review_deltas），不存在并发提交时的读-改-写丢失
+
+        Args:
+            user: 评分者
+            items: [{'allocation_id', 'score', 'comment'（可选）, 'favorite'（可选）}]
+
+        Returns:
+            list[PeerReview]: 创建的评分记录（与 items 顺序一致）
+
+        Raises:
+            ValidationError: 参数非法、任务不存在/不属于该用户/已完成
+        """
+        from .models import Chart, PeerReviewAllocation, PeerReview, PEER_REVIEW_MAX_SCORE
+
+        if not items:
+            raise ValidationError('评分列表不能为空')
+        if len(items) > PEER_REVIEW_BATCH_MAX_ITEMS:
+            raise ValidationError(f'单次最多提交 {PEER_REVIEW_BATCH_MAX_ITEMS} 个评分')
+
+        allocation_ids = [item['allocation_id'] for item in items]
+        if len(set(allocation_ids)) != len(allocation_ids):
+            raise ValidationError('同一个分配任务不能重复提交')
+        for item in items:
+            if item['score'] < 0 or item['score'] > PEER_REVIEW_MAX_SCORE:
+                raise ValidationError(
+                    f'任务 {item["allocation_id"]}：评分必须在0-{PEER_REVIEW_MAX_SCORE}之间'
+                )
+        favorite_flags = [PeerReviewService._favorite_value(item.get('favorite')) for item in items]
+
+        allocations = {
+            allocation_id: (chart_id, allocation_status, round_id)
+            for allocation_id, chart_id, allocation_status, round_id in PeerReviewAllocation.objects.filter(
+                id__in=allocation_ids, reviewer=user
+            ).values_list('id', 'chart_id', 'status', 'bidding_round_id')
+        }
+        missing = [allocation_id for allocation_id in allocation_ids if allocation_id not in allocations]
+        if missing:
+            raise ValidationError(f'分配任务不存在: {", ".join(map(str, missing))}')
+        completed = [allocation_id for allocation_id in allocation_ids if allocations[allocation_id][1] == 'completed']
+        if completed:
+            raise ValidationError(f'任务已完成: {", ".join(map(str, completed))}')
+
+        # 条件更新：只有仍为 pending 的任务会被标记，防止并发重复提交
+        updated = PeerReviewAllocation.objects.filter(
+            id__in=allocation_ids, status='pending'
+        ).update(status='completed')
+        if updated != len(allocation_ids):
+            raise ValidationError('部分任务已被提交，请刷新后重试')
+
+        reviews = PeerReview.objects.bulk_create(
+            [
+                PeerReview(
+                    allocation_id=item['allocation_id'],
+                    reviewer=user,
+                    chart_id=allocations[item['allocation_id']][0],
+                    score=item['score'],
+                    comment=item.get('comment'),
+                    favorite=favorite,
+                )
+                for item, favorite in zip(items, favorite_flags)
+            ],
+            batch_size=BULK_WRITE_BATCH_SIZE
+        )
+
+        # 按谱面分组累加评分统计和真爱票，并检查谱面是否已收到所有评分
+        chart_stats = {}
+        chart_favorites = {}
+        favorite_rounds = set()
+        for item, favorite in zip(items, favorite_flags):
+            chart_id, _, round_id = allocations[item['allocation_id']]
+            count, total = chart_stats.get(chart_id, (0, 0))
+            chart_stats[chart_id] = (count + 1, total + item['score'])
+            if favorite:
+                chart_favorites[chart_id] = chart_favorites.get(chart_id, 0) + 1
+                favorite_rounds.add(round_id)
+        review_stats.apply_review_deltas(chart_stats, chart_favorites)
+        review_stats.mark_review_completed(chart_stats.keys())
+        favorites.invalidate_leaderboards(favorite_rounds)
+        ranking.invalidate_rankings(round_id for _, _, round_id in allocations.values())
+
+        return reviews
+
+    @staticmethod
+    @transaction.atomic
+    def submit_extra_peer_review(user, chart, score, comment='', favorite=False):
+        """
+        提交额外评分（用户自主选择的谱面，没有分配任务）
+
+        每人对每张谱面只保留一条额外评分，重复提交时修改原记录（可勾选/取消真爱票）。
+        是否计入谱面评分统计由 settings.PEER_REVIEW_EXTRA_REVIEW_POLICY 决定（见 review_stats），
+        真爱票总是计入 Chart.favorite_count。
+
+        Returns:
+            (PeerReview, created)
+        """
+        from .models import PeerReview
+
+        favorite = PeerReviewService._favorite_value(favorite)
+        review = PeerReview.objects.select_for_update().filter(
+            reviewer=user,
+            chart=chart,
+            allocation__isnull=True  # 额外评分没有allocation
+        ).first()
+
+        if review:
+            previous_score = review.score
+            favorite_delta = int(favorite) - int(review.favorite)
+            review.score = score
+            review.comment = comment
+            review.favorite = favorite
+            review.save(update_fields=['score', 'comment', 'favorite', 'updated_at'])
+            review_stats.record_extra_review(
+                chart.id, score, previous_score=previous_score, favorite_delta=favorite_delta
+            )
+            if favorite_delta:
+                favorites.invalidate_leaderboards([chart.bidding_round_id])
+            ranking.invalidate_rankings([chart.bidding_round_id])
+            return review, False
+
+        review = PeerReview.objects.create(
+            chart=chart,
+            reviewer=user,
+            allocation=None,
+            score=score,
+            comment=comment,
+            favorite=favorite
+        )
+        review_stats.record_extra_review(chart.id, score, favorite_delta=1 if favorite else 0)
+        if favorite:
+            favorites.invalidate_leaderboards([chart.bidding_round_id])
+        ranking.invalidate_rankings([chart.bidding_round_id])
+        return review, True
+
     @staticmethod
     def get_user_review_tasks(user):
         """
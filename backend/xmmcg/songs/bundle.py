@@ -0,0 +1,276 @@
+"""
+谱面资源包（zip）的流式生成
+
+iter_zip 边读取源文件边产出 zip 数据块，不在内存中拼出整个压缩包：
+- ZipFile 写入只追加的 _StreamSink（没有 seek，zipfile 自动使用数据描述符在文件数据之后补写 CRC 和大小），
+  每写入一个源文件数据块就把 sink 中累积的字节交给调用方
+- 音频、封面、视频本身已经压缩，用 ZIP_STORED 原样存储；只有 maidata.txt 等文本用 ZIP_DEFLATED
+- 每个请求的内存占用约为常数（BUNDLE_CHUNK_SIZE 量级），与文件大小无关，
+  读取第一个数据块后即产出第一批字节
+
+chart_bundle_entries 负责决定包内文件名（与 AstroDX / Majdata 的目录约定一致）。
+
+资源包缓存（build_chart_bundle）：
+- 提交谱面时或第一次下载时生成一次，保存在 MEDIA_ROOT/bundles/<谱面ID>/<输入摘要>.zip
+- 输入摘要由包内文件名、源文件路径、大小、修改时间和包内时间戳计算，任何源文件变化都会得到新的摘要，
+  下一次下载时重新生成并删除该谱面的旧缓存
+- 先写入同目录的临时文件再原子替换，多个进程同时生成时不会读到写了一半的文件
+- 生产环境由下载接口返回 X-Accel-Redirect，交给 nginx 直接发送文件（见 backend/nginx.conf）
+- 输入摘要同时作为下载接口的强 ETag（条件请求、断点续传见 songs/downloads.py）
+"""
+
+import os
+import time
+import hashlib
+import zipfile
+import tempfile
+
+from django.conf import settings
+
+
+# 每次从存储读取的字节数
+BUNDLE_CHUNK_SIZE = 64 * 1024
+
+# 需要压缩的扩展名（其余文件原样存储）
+DEFLATE_EXTENSIONS = ('.txt',)
+
+
+class _StreamSink:
+    """只追加的输出缓冲：ZipFile 写入这里，生成器每次取走已写入的数据"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compress_type_for(arcname):
+    """包内文件的压缩方式：文本压缩，已压缩的媒体文件原样存储"""
+    if os.path.splitext(arcname)[1].lower() in DEFLATE_EXTENSIONS:
+        return zipfile.ZIP_DEFLATED
+    return zipfile.ZIP_STORED
+
+
+def iter_zip(entries, date_time=None, chunk_size=BUNDLE_CHUNK_SIZE):
+    """
+    流式生成 zip
+
+    Args:
+        entries: [(包内文件名, open_func, 文件大小)]，open_func() 返回可 read(n) 的二进制文件对象
+        date_time: 包内文件的修改时间（6 元组），默认当前时间
+        chunk_size: 每次读取的字节数
+
+    Yields:
+        bytes: zip 数据块
+    """
+    if date_time is None:
+        date_time = time.localtime(time.time())[:6]
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, 'w') as zf:
+        for arcname, open_func, size in entries:
+            zinfo = zipfile.ZipInfo(arcname, date_time=date_time)
+            zinfo.compress_type = compress_type_for(arcname)
+            # 预先给出大小，超过 4GB 时 zipfile 会自动写 ZIP64 头
+            zinfo.file_size = size
+            with open_func() as src, zf.open(zinfo, 'w') as dst:
+                while True:
+                    block = src.read(chunk_size)
+                    if not block:
+                        break
+                    dst.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def _video_arcname(name):
+    """视频文件名包含 pv 时命名为 pv.mp4，否则为 bg.mp4（非 mp4 保留原扩展名）"""
+    basename = os.path.basename(name).lower()
+    if basename.startswith('pv') or 'pv.' in basename:
+        return 'pv.mp4'
+    if basename.endswith('.mp4'):
+        return 'bg.mp4'
+    return 'bg' + os.path.splitext(basename)[1].lower()
+
+
+def chart_bundle_entries(chart):
+    """
+    谱面资源包的文件列表（只包含存储中实际存在的文件）
+
+    Returns:
+        list[tuple]: [(包内文件名, FieldFile)]，顺序为 maidata.txt、音频、封面、视频
+    """
+    candidates = []
+    if chart.chart_file:
+        candidates.append(('maidata.txt', chart.chart_file))
+    if chart.audio_file:
+        candidates.append(('track' + (os.path.splitext(chart.audio_file.name)[1].lower() or '.mp3'), chart.audio_file))
+    if chart.cover_image:
+        candidates.append(('bg' + (os.path.splitext(chart.cover_image.name)[1].lower() or '.jpg'), chart.cover_image))
+    if chart.background_video:
+        candidates.append((_video_arcname(chart.background_video.name), chart.background_video))
+    return [
+        (arcname, field_file) for arcname, field_file in candidates
+        if field_file.storage.exists(field_file.name)
+    ]
+
+
+def _bundle_date_time(chart):
+    """包内文件时间取谱面的提交时间，同一份谱面每次生成的内容相同"""
+    from django.utils import timezone
+
+    stamp = chart.submitted_at or chart.created_at
+    return timezone.localtime(stamp).timetuple()[:6] if stamp else None
+
+
+def _iter_files_zip(files, date_time, chunk_size=BUNDLE_CHUNK_SIZE):
+    entries = [
+        (arcname, lambda f=field_file: f.storage.open(f.name, 'rb'), field_file.storage.size(field_file.name))
+        for arcname, field_file in files
+    ]
+    return iter_zip(entries, date_time=date_time, chunk_size=chunk_size)
+
+
+def iter_chart_bundle(chart, chunk_size=BUNDLE_CHUNK_SIZE):
+    """流式生成谱面资源包"""
+    return _iter_files_zip(chart_bundle_entries(chart), _bundle_date_time(chart), chunk_size=chunk_size)
+
+
+# ==================== 资源包缓存 ====================
+
+# 缓存目录（相对 MEDIA_ROOT）
+BUNDLE_CACHE_DIR = 'bundles'
+
+# zip 生成方式变化时递增，使旧缓存全部失效
+BUNDLE_FORMAT_VERSION = 1
+
+
+def bundle_cache_root():
+    return os.path.join(settings.MEDIA_ROOT, BUNDLE_CACHE_DIR)
+
+
+def bundle_digest(files, date_time):
+    """
+    资源包的输入摘要
+
+    只使用文件元数据（路径、大小、修改时间），不读取文件内容；
+    源文件需要在本地文件系统上（FieldFile.path 不可用时抛出 NotImplementedError）。
+    """
+    h = hashlib.sha256(f'v{BUNDLE_FORMAT_VERSION}\n{date_time}\n'.encode())
+    for arcname, field_file in files:
+        st = os.stat(field_file.path)
+        h.update(f'{arcname}\0{field_file.name}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode())
+    return h.hexdigest()[:32]
+
+
+def _bundle_inputs(chart):
+    files = chart_bundle_entries(chart)
+    date_time = _bundle_date_time(chart)
+    return f'{chart.id}/{bundle_digest(files, date_time)}.zip', files, date_time
+
+
+def chart_bundle_name(chart):
+    """
+    当前资源包的缓存路径（不生成文件）
+
+    zip 内容完全由输入摘要决定（同样的输入逐字节相同），文件名中的摘要可直接用作强 ETag。
+    """
+    return _bundle_inputs(chart)[0]
+
+
+def bundle_etag(name):
+    """缓存路径对应的 ETag（输入摘要）"""
+    return '"' + os.path.splitext(os.path.basename(name))[0] + '"'
+
+
+def build_chart_bundle(chart):
+    """
+    生成（或复用已有的）谱面资源包缓存文件
+
+    Returns:
+        str: 相对缓存目录的路径 '<谱面ID>/<输入摘要>.zip'
+
+    Raises:
+        OSError: 读取源文件或写入缓存失败
+        NotImplementedError: 存储后端不是本地文件系统
+    """
+    name, files, date_time = _bundle_inputs(chart)
+    path = os.path.join(bundle_cache_root(), name)
+    if os.path.exists(path):
+        return name
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in _iter_files_zip(files, date_time):
+                out.write(chunk)
+        # mkstemp 创建的文件权限为 0600，nginx 进程需要可读
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # 删除该谱面的旧缓存（nginx 正在发送的文件删除后仍可读完）
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.zip') and entry.path != path:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+    return name
+
+
+def bundle_cache_path(name):
+    """build_chart_bundle 返回值对应的绝对路径"""
+    return os.path.join(bundle_cache_root(), name)
+
+
+def delete_chart_bundles(chart_id):
+    """删除某张谱面的全部资源包缓存"""
+    directory = os.path.join(bundle_cache_root(), str(chart_id))
+    if not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    try:
+        os.rmdir(directory)
+    except OSError:
+        pass
+
+
+def bundle_filename(chart):
+    """下载文件名：<歌曲名>_chart.zip（去掉文件名中的非法字符）"""
+    name = chart.song.title or 'chart'
+    for ch in '\\/:*?"<>|':
+        name = name.replace(ch, '_')
+    return f"{name.strip() or 'chart'}_chart.zip"
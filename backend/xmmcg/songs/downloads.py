@@ -0,0 +1,196 @@
+"""
+由 Django 发送的文件下载：条件请求（ETag / 304）与断点续传（HTTP Range / 206）
+
+serve_file 在 FileResponse 之上补充：
+- 强 ETag（调用方给出，由内容哈希得出）和 Last-Modified
+- If-None-Match / If-Modified-Since 命中时返回 304，If-Match / If-Unmodified-Since 不满足时返回 412
+  （交给 django.utils.cache.get_conditional_response 按 RFC 9110 的顺序判断）
+- 单段 Range（bytes=a-b、bytes=a-、bytes=-n）返回 206，只读取请求的字节；超出文件范围返回 416；
+  多段 Range 或无法解析的 Range 忽略，返回完整文件
+- If-Range 只接受与当前 ETag 完全相同的强 ETag，否则（包括日期形式）返回完整文件
+
+用于谱面资源包（songs/bundle.py）和开发服务器下的 /media/（serve_media）。
+生产环境中这两类文件都由 nginx 发送，Range 由 nginx 处理（见 backend/nginx.conf）。
+"""
+
+import os
+import re
+import hashlib
+import mimetypes
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_etags
+
+
+# 文件内容哈希的缓存时间（秒）；缓存键包含文件大小和修改时间，文件变化后自动失效
+FILE_ETAG_CACHE_TIMEOUT = 24 * 3600
+
+# 计算内容哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def strong_etag(digest):
+    return f'"{digest}"'
+
+
+def file_content_etag(path, stat=None):
+    """文件内容的 SHA-256（前 32 位十六进制）作为强 ETag，按 (路径, 大小, 修改时间) 缓存"""
+    stat = stat or os.stat(path)
+    key = 'file_etag:' + hashlib.sha1(
+        f'{path}\0{stat.st_size}\0{stat.st_mtime_ns}'.encode()
+    ).hexdigest()
+    etag = cache.get(key)
+    if etag is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                h.update(block)
+        etag = strong_etag(h.hexdigest()[:32])
+        cache.set(key, etag, FILE_ETAG_CACHE_TIMEOUT)
+    return etag
+
+
+def parse_range(header, size):
+    """
+    解析单段 Range 请求头
+
+    Returns:
+        (start, end)：闭区间；None：忽略 Range，返回完整文件；'unsatisfiable'：返回 416
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        # 多段或格式错误
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # bytes=-n：最后 n 个字节
+        length = int(last)
+        if length == 0 or size == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        return 'unsatisfiable'
+    return start, min(end, size - 1)
+
+
+def if_range_passes(request, etag):
+    """没有 If-Range，或 If-Range 与当前强 ETag 相同时才按 Range 返回部分内容"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('W/'):
+        return False
+    return parse_etags(if_range) == [etag]
+
+
+def conditional_headers(request, etag, last_modified=None, cache_control='no-cache'):
+    """
+    条件请求判断
+
+    Returns:
+        (response, headers)：response 不为 None 时直接返回（304 / 412）；
+        否则 headers 为需要附加到正常响应上的 ETag / Last-Modified / Cache-Control
+    """
+    headers = HttpResponse()
+    headers['ETag'] = etag
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified, response=headers)
+    if response is not headers:
+        return response, None
+    return None, {name: headers[name] for name in ('ETag', 'Last-Modified', 'Cache-Control') if name in headers}
+
+
+class _RangeFile:
+    """只读取 [start, start + length) 的文件包装（没有 fileno，WSGI 服务器不会用 sendfile 发送整个文件）"""
+
+    def __init__(self, f, start, length):
+        self._f = f
+        self._f.seek(start)
+        self._remaining = length
+
+    def read(self, n=-1):
+        if self._remaining <= 0:
+            return b''
+        if n is None or n < 0 or n > self._remaining:
+            n = self._remaining
+        data = self._f.read(n)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+
+
+def serve_file(request, path, etag, content_type=None, filename=None, as_attachment=False,
+               cache_control='no-cache'):
+    """
+    发送本地文件，支持条件请求和单段 Range
+
+    Args:
+        path: 文件绝对路径
+        etag: 强 ETag（含引号），必须由文件内容决定
+        content_type: 默认按文件名猜测
+        filename / as_attachment: Content-Disposition
+        cache_control: 默认 no-cache（缓存但每次用 ETag 重新验证）
+    """
+    stat = os.stat(path)
+    not_modified, headers = conditional_headers(request, etag, int(stat.st_mtime), cache_control)
+    if not_modified is not None:
+        return not_modified
+
+    size = stat.st_size
+    if content_type is None:
+        content_type = mimetypes.guess_type(filename or path)[0] or 'application/octet-stream'
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size) if if_range_passes(request, etag) else None
+
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(_RangeFile(open(path, 'rb'), start, length), status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Length'] = str(size)
+
+    response['Accept-Ranges'] = 'bytes'
+    if filename and byte_range != 'unsatisfiable':
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def serve_media(request, path):
+    """
+    开发服务器下的 /media/<path>（代替 django.views.static.serve，增加 ETag 和 Range）
+    生产环境 /media/ 由 nginx 直接提供。
+    """
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('文件不存在')
+    if not os.path.isfile(fullpath):
+        raise Http404('文件不存在')
+    return serve_file(request, fullpath, file_content_etag(fullpath))
@@ -0,0 +1,74 @@
+"""
+真爱票排行榜
+
+Chart.favorite_count 由评分提交时增量维护（见 review_stats.apply_review_deltas），
+排行榜只需按 (bidding_round, -favorite_count) 索引读取一次，结果按轮次缓存；
+真爱票变化时在事务提交后清除对应轮次的缓存（invalidate_leaderboards）；
+缓存为各进程共用的后端（settings.CACHES），清除对所有 worker 立即生效。
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+
+def _cache_key(round_id):
+    return f'favorite_leaderboard:{round_id}'
+
+
+def invalidate_leaderboards(round_ids):
+    """事务提交后清除这些轮次的排行榜缓存（回滚时不清除）"""
+    keys = [_cache_key(round_id) for round_id in set(round_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_leaderboard(bidding_round):
+    """
+    某轮的真爱票排行榜（带缓存，只包含至少有一票的谱面）
+
+    名次按真爱票数计算，票数相同的谱面名次相同（1, 2, 2, 4 ...）；
+    同票时按平均分降序、谱面ID升序排列。
+
+    Returns:
+        dict: {'computed_at', 'total_favorites', 'entries': [{'rank', 'chart_id', 'username',
+               'song_title', 'favorite_count', 'average_score', 'review_count'}]}
+    """
+    from .models import Chart
+
+    key = _cache_key(bidding_round.id)
+    payload = cache.get(key)
+    if payload is not None:
+        return payload
+
+    charts = Chart.objects.filter(
+        bidding_round=bidding_round,
+        favorite_count__gt=0
+    ).select_related('user', 'song').only(
+        'id', 'favorite_count', 'average_score', 'review_count', 'user__username', 'song__title'
+    ).order_by('-favorite_count', '-average_score', 'id')
+
+    entries = []
+    for position, chart in enumerate(charts, start=1):
+        if entries and entries[-1]['favorite_count'] == chart.favorite_count:
+            rank = entries[-1]['rank']
+        else:
+            rank = position
+        entries.append({
+            'rank': rank,
+            'chart_id': chart.id,
+            'username': chart.user.username,
+            'song_title': chart.song.title,
+            'favorite_count': chart.favorite_count,
+            'average_score': chart.average_score,
+            'review_count': chart.review_count,
+        })
+
+    payload = {
+        'computed_at': timezone.now().isoformat(),
+        'total_favorites': sum(entry['favorite_count'] for entry in entries),
+        'entries': entries,
+    }
+    cache.set(key, payload, getattr(settings, 'FAVORITE_LEADERBOARD_CACHE_TIMEOUT', 300))
+    return payload
@@ -0,0 +1,63 @@
+"""
+Django management command to report reviewer bias / outliers for a round.
+
+Usage:
+    python manage.py analyze_reviewers <round_id>
+    python manage.py analyze_reviewers <round_id> --flagged-only
+    python manage.py analyze_reviewers <round_id> --refresh
+
+Loads all counted PeerReview scores of the round in one query and computes
+per-reviewer mean/variance, correlation with consensus and outlier flags
+(see songs/review_analysis.py). Results are cached per round.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from songs.models import BiddingRound
+from songs import review_analysis
+
+
+class Command(BaseCommand):
+    help = '分析某轮互评中评分者的偏差和异常（平均分、方差、与共识的相关性）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('round_id', type=int, help='竞标轮次ID')
+        parser.add_argument(
+            '--flagged-only',
+            action='store_true',
+            help='只显示被标记为异常的评分者',
+        )
+        parser.add_argument(
+            '--refresh',
+            action='store_true',
+            help='忽略缓存重新计算',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            bidding_round = BiddingRound.objects.get(id=options['round_id'])
+        except BiddingRound.DoesNotExist:
+            raise CommandError(f'竞标轮次不存在: {options["round_id"]}')
+
+        report = review_analysis.get_round_analysis(bidding_round, refresh=options['refresh'])
+        self.stdout.write(
+            f'{bidding_round.name}: {report["review_count"]} 条评分，{report["reviewer_count"]} 个评分者'
+        )
+        self.stdout.write('异常标记: ' + '，'.join(
+            f'{review_analysis.FLAG_LABELS[flag]}({flag}) {count} 人' for flag, count in report['flag_counts'].items()
+        ))
+        self.stdout.write('=' * 88)
+        self.stdout.write(
+            f'{"评分者":<16} {"评分数":>6} {"平均分":>8} {"标准差":>8} {"极端比例":>8} {"共识相关":>8} {"偏差":>8}  标记'
+        )
+        self.stdout.write('-' * 88)
+        for row in report['reviewers']:
+            if options['flagged_only'] and not row['flags']:
+                continue
+            correlation = '-' if row['correlation'] is None else f'{row["correlation"]:.2f}'
+            bias = '-' if row['bias'] is None else f'{row["bias"]:+.2f}'
+            line = (
+                f'{row["username"][:16]:<16} {row["review_count"]:>6} {row["mean"]:>8.2f} {row["std"]:>8.2f} '
+                f'{row["extreme_ratio"]:>8.0%} {correlation:>8} {bias:>8}  '
+                + ','.join(review_analysis.FLAG_LABELS[flag] for flag in row['flags'])
+            )
+            self.stdout.write(self.style.WARNING(line) if row['flags'] else line)
@@ -0,0 +1,57 @@
+"""
+Django management command to prebuild chart bundle zips.
+
+Usage:
+    python manage.py build_chart_bundles <round_id> [<round_id> ...]
+    python manage.py build_chart_bundles --all
+
+Run before peer review opens so that the first download of every chart is
+already served from the bundle cache (MEDIA_ROOT/bundles/, see songs/bundle.py).
+Bundles whose input files are unchanged are reused, not rebuilt.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from songs.models import BiddingRound, Chart
+from songs import bundle
+
+
+class Command(BaseCommand):
+    help = '预先生成谱面资源包缓存（zip）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('round_ids', nargs='*', type=int, help='竞标轮次ID')
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='生成所有轮次的谱面',
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            charts = Chart.objects.all()
+        elif options['round_ids']:
+            existing = set(BiddingRound.objects.filter(id__in=options['round_ids']).values_list('id', flat=True))
+            missing = set(options['round_ids']) - existing
+            if missing:
+                raise CommandError(f'竞标轮次不存在: {", ".join(map(str, sorted(missing)))}')
+            charts = Chart.objects.filter(bidding_round_id__in=existing)
+        else:
+            raise CommandError('请指定轮次ID，或使用 --all')
+
+        built = failed = 0
+        start = time.perf_counter()
+        for chart in charts.select_related('song').order_by('id').iterator():
+            try:
+                name = bundle.build_chart_bundle(chart)
+            except (OSError, NotImplementedError) as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'  ✗ 谱面 {chart.id}: {e}'))
+                continue
+            built += 1
+            self.stdout.write(f'  ✓ 谱面 {chart.id}: {name}')
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write(self.style.SUCCESS(f'✓ {built} 个资源包已就绪，{failed} 个失败，耗时 {elapsed:.1f} s'))
@@ -0,0 +1,44 @@
+"""
+Django management command to (re)build RoundRanking snapshots.
+
+Usage:
+    python manage.py compute_round_rankings <round_id> [<round_id> ...]
+
+Run once peer reviews for a round have closed (or after reviews change).
+Computes every ranking method from the round's PeerReview rows in one pass,
+stores the snapshots and clears the ranking cache.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from songs.models import BiddingRound
+from songs import ranking
+
+
+class Command(BaseCommand):
+    help = '根据互评记录生成轮次排名快照（所有计分方式）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('round_ids', nargs='+', type=int, help='竞标轮次ID')
+
+    def handle(self, *args, **options):
+        rounds = BiddingRound.objects.filter(id__in=options['round_ids']).order_by('id')
+        missing = set(options['round_ids']) - set(rounds.values_list('id', flat=True))
+        if missing:
+            raise CommandError(f'竞标轮次不存在: {", ".join(map(str, sorted(missing)))}')
+
+        for bidding_round in rounds:
+            start = time.perf_counter()
+            snapshots = ranking.compute_round_rankings(bidding_round)
+            elapsed = (time.perf_counter() - start) * 1000
+            default = snapshots[ranking.default_method()]
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ {bidding_round.name} (id={bidding_round.id}): '
+                f'{len(default.entries)} 张谱面，{default.review_count} 条评分，耗时 {elapsed:.1f} ms'
+            ))
+            for entry in default.entries[:3]:
+                self.stdout.write(
+                    f'  #{entry["rank"]} {entry["song_title"]} ({entry["username"]}) '
+                    f'{ranking.default_method()}={entry["score"]:.4f} 平均分={entry["average_score"]:.2f}'
+                )
@@ -0,0 +1,81 @@
+"""
+Django management command to move song/chart media into content-addressed storage.
+
+Usage:
+    python manage.py dedupe_media
+    python manage.py dedupe_media --dry-run
+    python manage.py dedupe_media --recount-only
+    python manage.py dedupe_media --prune
+
+Moves legacy uuid-named audio/cover/video files into blobs/ (identical files
+are stored once), points the Song/Chart fields at the blobs, then recomputes
+MediaBlob.ref_count from the actual field references. --recount-only skips
+the migration and only repairs reference counts (e.g. after cascade or bulk
+deletes); referenced blobs whose file is missing are reported. --prune also
+removes blobs whose count dropped to zero, old blob files without a MediaBlob
+row and stale upload temp files. See songs/media_store.py.
+"""
+
+from django.core.management.base import BaseCommand
+from songs import media_store
+
+
+class Command(BaseCommand):
+    help = '把歌曲 / 谱面的媒体文件迁移到内容寻址存储（相同文件只保存一次），并重算引用数'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只显示将要进行的修改，不实际修改数据库和文件',
+        )
+        parser.add_argument(
+            '--recount-only',
+            action='store_true',
+            help='不迁移旧文件，只重算引用数',
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='同时删除没有引用记录的 blob 文件和过期的上传临时文件',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        prefix = '[DRY RUN] ' if dry_run else ''
+
+        if not options['recount_only']:
+            result = media_store.migrate_legacy_files(dry_run=dry_run)
+            for name in result['missing']:
+                self.stdout.write(self.style.WARNING(f'  ⚠ 文件不存在，跳过: {name}'))
+            for item in result['migrated']:
+                self.stdout.write(f'  {prefix}{item["name"]} → {item["blob"] or "(blob)"}')
+            summary = f'{prefix}迁移旧文件 {result["files"]} 个，共 {result["bytes"] / 1024 / 1024:.1f} MB'
+            if not dry_run:
+                summary += f'，合并为 {result["blobs"]} 个 blob'
+            self.stdout.write(self.style.SUCCESS(summary))
+
+        recount = media_store.recount_references(dry_run=dry_run)
+        for change in recount['changed']:
+            self.stdout.write(self.style.WARNING(
+                f'  {prefix}{change["name"]}: 引用数 {change["before"]} → {change["after"]}'
+            ))
+        for name in recount['missing']:
+            self.stdout.write(self.style.ERROR(f'  ✗ 仍被引用但文件不存在: {name}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}被引用的 blob {recount["blobs"]} 个，修正引用数 {len(recount["changed"])} 个，'
+            f'文件缺失 {len(recount["missing"])} 个'
+        ))
+
+        if options['prune']:
+            removed = media_store.prune_orphans(dry_run=dry_run)
+            for name in removed:
+                self.stdout.write(f'  {prefix}删除 {name}')
+            self.stdout.write(self.style.SUCCESS(f'{prefix}删除无引用文件 {len(removed)} 个'))
+
+        # 输出总结
+        self.stdout.write('\n' + '=' * 60)
+        if dry_run:
+            self.stdout.write(self.style.NOTICE('【干运行模式 - 未实际修改数据库和文件】'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✓ 完成'))
@@ -0,0 +1,71 @@
+"""
+Django management command to rebuild Chart.favorite_count from PeerReview rows.
+
+Usage:
+    python manage.py rebuild_favorite_counts <round_id> [<round_id> ...]
+    python manage.py rebuild_favorite_counts --all
+    python manage.py rebuild_favorite_counts <round_id> --dry-run
+
+Counts favorite=True reviews (assigned and extra) per chart with one GROUP BY
+query per round, writes back only the charts whose count differs, and clears
+the favorite leaderboard cache of the rebuilt rounds.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from songs.models import BiddingRound
+from songs import review_stats, favorites
+
+
+class Command(BaseCommand):
+    help = '根据互评记录重算谱面的真爱票数（favorite_count）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('round_ids', nargs='*', type=int, help='竞标轮次ID')
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='重算所有轮次',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只显示将要修改的谱面，不实际修改数据库',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if options['all']:
+            rounds = BiddingRound.objects.order_by('id')
+        elif options['round_ids']:
+            rounds = BiddingRound.objects.filter(id__in=options['round_ids']).order_by('id')
+            missing = set(options['round_ids']) - set(rounds.values_list('id', flat=True))
+            if missing:
+                raise CommandError(f'竞标轮次不存在: {", ".join(map(str, sorted(missing)))}')
+        else:
+            raise CommandError('请指定轮次ID，或使用 --all')
+
+        total_changed = 0
+        for bidding_round in rounds:
+            with transaction.atomic():
+                result = review_stats.recompute_favorite_counts(bidding_round, dry_run=dry_run)
+                if result['changed'] and not dry_run:
+                    favorites.invalidate_leaderboards([bidding_round.id])
+            total_changed += len(result['changed'])
+            self.stdout.write(
+                f'{bidding_round.name} (id={bidding_round.id}): '
+                f'{result["charts"]} 张谱面，{len(result["changed"])} 张真爱票数不一致'
+            )
+            prefix = '[DRY RUN] 将修正' if dry_run else '✓ 已修正'
+            for change in result['changed']:
+                self.stdout.write(self.style.WARNING(
+                    f'  {prefix} 谱面 {change["chart_id"]}: 真爱票 {change["before"]} → {change["after"]}'
+                ))
+
+        # 输出总结
+        self.stdout.write('\n' + '=' * 60)
+        if dry_run:
+            self.stdout.write(self.style.NOTICE('【干运行模式 - 未实际修改数据库】'))
+            self.stdout.write(f'将修正 {total_changed} 张谱面')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ 成功修正 {total_changed} 张谱面'))
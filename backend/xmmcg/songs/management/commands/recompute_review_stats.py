@@ -0,0 +1,74 @@
+"""
+Django management command to recompute denormalized chart review stats.
+
+Usage:
+    python manage.py recompute_review_stats <round_id> [<round_id> ...]
+    python manage.py recompute_review_stats --all
+    python manage.py recompute_review_stats <round_id> --dry-run
+
+Recomputes Chart.review_count / total_score / average_score from PeerReview rows
+with one GROUP BY query per round (extra reviews follow PEER_REVIEW_EXTRA_REVIEW_POLICY),
+and writes back only the charts whose stats differ.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from songs.models import BiddingRound
+from songs import review_stats
+
+
+class Command(BaseCommand):
+    help = '根据互评记录重算谱面的评分统计（review_count / total_score / average_score）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('round_ids', nargs='*', type=int, help='竞标轮次ID')
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='重算所有轮次',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只显示将要修改的谱面，不实际修改数据库',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if options['all']:
+            rounds = BiddingRound.objects.order_by('id')
+        elif options['round_ids']:
+            rounds = BiddingRound.objects.filter(id__in=options['round_ids']).order_by('id')
+            missing = set(options['round_ids']) - set(rounds.values_list('id', flat=True))
+            if missing:
+                raise CommandError(f'竞标轮次不存在: {", ".join(map(str, sorted(missing)))}')
+        else:
+            raise CommandError('请指定轮次ID，或使用 --all')
+
+        self.stdout.write(f'额外评分策略: {review_stats.extra_review_policy()}')
+        total_changed = 0
+        for bidding_round in rounds:
+            with transaction.atomic():
+                result = review_stats.recompute_round_stats(bidding_round, dry_run=dry_run)
+            total_changed += len(result['changed'])
+            self.stdout.write(
+                f'{bidding_round.name} (id={bidding_round.id}): '
+                f'{result["charts"]} 张谱面，{len(result["changed"])} 张统计不一致'
+            )
+            prefix = '[DRY RUN] 将修正' if dry_run else '✓ 已修正'
+            for change in result['changed']:
+                before_count, before_total, before_avg = change['before']
+                after_count, after_total, after_avg = change['after']
+                self.stdout.write(self.style.WARNING(
+                    f'  {prefix} 谱面 {change["chart_id"]}: '
+                    f'评分数 {before_count} → {after_count}，总分 {before_total} → {after_total}，'
+                    f'平均分 {before_avg:.2f} → {after_avg:.2f}'
+                ))
+
+        # 输出总结
+        self.stdout.write('\n' + '=' * 60)
+        if dry_run:
+            self.stdout.write(self.style.NOTICE('【干运行模式 - 未实际修改数据库】'))
+            self.stdout.write(f'将修正 {total_changed} 张谱面')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ 成功修正 {total_changed} 张谱面'))
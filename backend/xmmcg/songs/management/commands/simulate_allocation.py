@@ -0,0 +1,99 @@
+"""
+Django management command to run a Monte-Carlo fairness simulation of bid allocation.
+
+Usage:
+    python manage.py simulate_allocation <round_id>
+    python manage.py simulate_allocation <round_id> --runs 5000 --seed 42
+    python manage.py simulate_allocation <round_id> --variants greedy greedy+self
+    python manage.py simulate_allocation <round_id> --workers 1 --top 50
+
+Loads the round's bids once into a compact array snapshot and reruns the allocation
+core (songs.allocation.plan_allocation) with seeds seed..seed+runs-1 for every rule
+variant across a process pool (see songs/allocation_simulation.py). Read-only
+apart from saving the result (AllocationSimulation), which the admin simulation
+page then displays.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from songs.models import BiddingRound
+from songs import allocation_simulation
+
+
+class Command(BaseCommand):
+    help = '蒙特卡洛模拟竞标分配：比较不同分配规则下各用户的中标概率、保底率和代币花费分布（只读）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('round_id', type=int, help='竞标轮次ID')
+        parser.add_argument('--runs', type=int, default=1000, help='每种规则的模拟次数（默认1000）')
+        parser.add_argument('--seed', type=int, default=0, help='起始随机种子（默认0）')
+        parser.add_argument(
+            '--variants',
+            nargs='+',
+            help='规则变体，如 greedy greedy+self optimal optimal+self（默认该轮可用的全部规则）',
+        )
+        parser.add_argument('--workers', type=int, help='工作进程数（默认 ALLOCATION_SIMULATION_WORKERS）')
+        parser.add_argument('--top', type=int, default=20, help='显示中标概率最不确定的前 N 个用户（默认20，0 表示全部）')
+
+    def handle(self, *args, **options):
+        try:
+            bidding_round = BiddingRound.objects.get(id=options['round_id'])
+        except BiddingRound.DoesNotExist:
+            raise CommandError(f'竞标轮次不存在: {options["round_id"]}')
+
+        try:
+            result = allocation_simulation.simulate_round(
+                bidding_round,
+                runs=options['runs'],
+                variants=options['variants'],
+                seed=options['seed'],
+                workers=options['workers'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        allocation_simulation.store_result(result)
+
+        self.stdout.write(
+            f'{bidding_round.name}: {result["bids"]} 条竞标，{result["bidders"]} 个出价用户，'
+            f'{result["targets"]} 个可分配目标'
+        )
+        self.stdout.write(
+            f'每种规则 {result["runs"]} 次（种子 {result["seed"]} 起），'
+            f'{result["workers"]} 个进程，耗时 {result["elapsed"]:.2f}s'
+        )
+
+        # 规则汇总
+        self.stdout.write('=' * 96)
+        self.stdout.write(
+            f'{"规则":<14} {"保底率":>7} {"自有谱面":>8} {"未分配":>7} {"不确定用户":>10} '
+            f'{"花费均值":>9} {"标准差":>8} {"P5":>7} {"P50":>7} {"P95":>7}'
+        )
+        self.stdout.write('-' * 96)
+        for summary in result['variants']:
+            spend = summary['spend']
+            self.stdout.write(
+                f'{summary["variant"]:<14} {summary["fallback_rate"]:>7.1%} {summary["own_fallback_rate"]:>8.1%} '
+                f'{summary["unassigned_rate"]:>7.1%} {summary["uncertain_users"]:>10} '
+                f'{spend["mean"]:>9.1f} {spend["std"]:>8.1f} {spend["p5"]:>7} {spend["p50"]:>7} {spend["p95"]:>7}'
+            )
+
+        # 用户明细：按各规则中 p(1-p) 的最大值排序，结果最不确定的用户在前
+        variants = result['variants']
+        rows = list(zip(*(summary['users'] for summary in variants)))
+        rows.sort(key=lambda per_variant: (
+            -max(row['win_probability'] * (1 - row['win_probability']) for row in per_variant),
+            per_variant[0]['user_id'],
+        ))
+        if options['top'] > 0:
+            rows = rows[:options['top']]
+
+        self.stdout.write('\n' + '=' * 96)
+        self.stdout.write('中标概率 / 保底概率 / 期望花费')
+        self.stdout.write(f'{"用户":<16} {"竞标":>4}  ' + '  '.join(f'{s["variant"]:>22}' for s in variants))
+        self.stdout.write('-' * 96)
+        for per_variant in rows:
+            first = per_variant[0]
+            cells = '  '.join(
+                f'{row["win_probability"]:>6.1%} /{row["fallback_probability"]:>6.1%} /{row["expected_spend"]:>6.0f}'
+                for row in per_variant
+            )
+            self.stdout.write(f'{first["username"][:16]:<16} {first["bids"]:>4}  {cells}')
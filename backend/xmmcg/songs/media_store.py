@@ -0,0 +1,325 @@
+"""
+内容寻址的媒体存储（歌曲 / 谱面的音频、封面、背景视频）
+
+- ContentAddressedStorage 按内容的 SHA-256 保存文件，路径为 blobs/<前两位>/<sha256>.<扩展名>。
+  上传时边写临时文件边计算哈希，相同内容已经存在时丢弃临时文件，直接返回已有路径，
+  同一份音频 / 封面（如歌曲和根据它提交的谱面）在磁盘上只保存一次；
+  上传处理器已计算哈希的文件（content.sha256，见 songs/upload_handlers.py）不再重新读取，临时文件直接移动为 blob
+- MediaBlob 记录每个 blob 被多少个文件字段引用（ref_count）：
+  Song / Chart 保存时对新引用 acquire、对被替换的引用 release，删除时 release 全部引用（见 BlobReferenceMixin）；
+  引用数归零时保留记录（ref_count=0），事务提交后在该行的行锁下再次确认没有新的引用，再删除文件和记录；
+  上传在判断文件是否已存在前拿同一把锁（lock_blob），复用的文件不会被并发的删除删掉
+- 旧数据（uuid 文件名）不是 blob，仍由所属记录独占，删除行为不变；
+  dedupe_media 命令把旧文件迁移为 blob 并重算引用数（也用于修复级联删除、批量删除造成的引用数偏差）
+"""
+
+import os
+import time
+import hashlib
+import logging
+import tempfile
+from collections import Counter
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+# blob 目录（相对 MEDIA_ROOT）
+BLOB_DIR = 'blobs'
+
+# 上传过程中的临时文件目录（相对 MEDIA_ROOT）
+BLOB_TMP_DIR = f'{BLOB_DIR}/tmp'
+
+
+def blob_name(digest, ext):
+    """blob 的存储路径，ext 含点（如 '.mp3'），可以为空"""
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{ext.lower()}'
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(BLOB_DIR + '/') and not name.startswith(BLOB_TMP_DIR + '/')
+
+
+def blob_digest(name):
+    """blob 路径中的 SHA-256"""
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """按内容哈希命名的文件系统存储（传入的文件名只用于取扩展名）"""
+
+    def get_available_name(self, name, max_length=None):
+        # 实际路径由内容决定（见 _save），相同内容共用一个路径，不需要避让同名文件
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1]
+        digest = getattr(content, 'sha256', None)
+        tmp_path = None
+        try:
+            if not (digest and hasattr(content, 'temporary_file_path')):
+                tmp_path, digest = self._write_temp(content)
+            name = blob_name(digest, ext)
+            full_path = self.path(name)
+            with transaction.atomic():
+                # 与 _delete_unreferenced 使用同一行锁：锁住期间引用数归零的文件不会被删除；
+                # 删除方先拿到锁时在这里等待，之后发现文件已不存在，重新写入
+                lock_blob(name)
+                if os.path.exists(full_path):
+                    # 刷新修改时间，prune_orphans 不会把刚被复用、尚未 acquire 的文件当作孤儿删除
+                    os.utime(full_path)
+                    return name
+                if tmp_path is None:
+                    # 先移动到 blob 目录下的临时路径（跨文件系统时为复制），再原子替换，不会出现写了一半的 blob
+                    tmp_path = self._temp_path()
+                    file_move_safe(content.temporary_file_path(), tmp_path, allow_overwrite=True)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+                # 同内容并发上传时后写入的覆盖先写入的，内容相同
+                os.replace(tmp_path, full_path)
+                tmp_path = None
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        return name
+
+    def _temp_path(self):
+        tmp_dir = self.path(BLOB_TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+        os.close(fd)
+        return tmp_path
+
+    def _write_temp(self, content):
+        """把内容写入 blob 临时目录并计算哈希，返回 (临时路径, sha256)"""
+        tmp_path = self._temp_path()
+        try:
+            h = hashlib.sha256()
+            with open(tmp_path, 'wb') as out:
+                for chunk in content.chunks():
+                    h.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, h.hexdigest()
+
+
+media_storage = ContentAddressedStorage()
+
+
+def get_media_storage():
+    """供模型字段使用的存储（callable，迁移文件中不序列化存储实例）"""
+    return media_storage
+
+
+def acquire(names):
+    """为每个 blob 路径增加一次引用（非 blob 路径忽略）"""
+    from .models import MediaBlob
+
+    for name, count in Counter(name for name in names if is_blob_name(name)).items():
+        if MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + count):
+            continue
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(
+                    name=name,
+                    sha256=blob_digest(name),
+                    size=media_storage.size(name),
+                    ref_count=count,
+                )
+        except IntegrityError:
+            # 并发创建：记录已由另一个请求创建
+            MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + count)
+
+
+def lock_blob(name):
+    """
+    锁住 blob 的 MediaBlob 行（行不存在时不加锁），直到当前事务结束
+
+    引用数归零后行保留（ref_count=0），由 _delete_unreferenced 在同一行锁下判断并删除文件和行；
+    上传（ContentAddressedStorage._save）在判断文件是否存在前先拿这把锁，
+    两者不会出现"上传方复用了文件、删除方随后把它删除"的交错。
+    """
+    from .models import MediaBlob
+
+    return list(MediaBlob.objects.select_for_update().filter(name=name).values_list('ref_count', flat=True))
+
+
+def release(names):
+    """为每个 blob 路径减少一次引用，引用数归零时在事务提交后删除文件和记录（非 blob 路径忽略）"""
+    from .models import MediaBlob
+
+    for name, count in Counter(name for name in names if is_blob_name(name)).items():
+        MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') - count)
+        if MediaBlob.objects.filter(name=name, ref_count__lte=0).exists():
+            transaction.on_commit(lambda name=name: _delete_unreferenced(name))
+
+
+def _delete_unreferenced(name):
+    from .models import MediaBlob
+
+    # 引用数归零到事务提交之间可能又有相同内容上传：在行锁下重新确认引用数，
+    # 删除文件和记录完成前，相同内容的上传在 _save 的 lock_blob 处等待
+    with transaction.atomic():
+        if not any(count <= 0 for count in lock_blob(name)):
+            return
+        MediaBlob.objects.filter(name=name).delete()
+        try:
+            media_storage.delete(name)
+        except OSError as e:
+            # 记录已删除，残留的文件由 prune_orphans 清理
+            logger.warning(f"删除媒体文件失败: {name}: {e}")
+
+
+def blob_references():
+    """
+    数据库中对每个 blob 的实际引用数（遍历所有使用内容寻址存储的文件字段）
+
+    Returns:
+        Counter: {blob 路径: 引用数}
+    """
+    from .models import Song, Chart
+
+    counts = Counter()
+    for model in (Song, Chart):
+        for field_name in model.BLOB_FIELDS:
+            for name in model.objects.exclude(**{field_name: ''}).exclude(
+                **{f'{field_name}__isnull': True}
+            ).values_list(field_name, flat=True).iterator():
+                if is_blob_name(name):
+                    counts[name] += 1
+    return counts
+
+
+def recount_references(dry_run=False):
+    """
+    按实际引用重算 MediaBlob.ref_count（修复级联删除、QuerySet 批量删除等绕过 delete() 的情况），
+    并找出仍被引用但文件已不存在的 blob
+
+    Returns:
+        dict: {'blobs': 被引用的 blob 数, 'changed': [{'name', 'before', 'after'}], 'missing': [文件不存在的 blob 路径]}
+    """
+    from .models import MediaBlob
+
+    actual = blob_references()
+    stored = dict(MediaBlob.objects.values_list('name', 'ref_count'))
+    changed = [
+        {'name': name, 'before': stored.get(name, 0), 'after': actual.get(name, 0)}
+        for name in sorted(set(actual) | set(stored))
+        if stored.get(name, 0) != actual.get(name, 0)
+    ]
+    missing = [name for name in sorted(actual) if not media_storage.exists(name)]
+    if not dry_run:
+        with transaction.atomic():
+            for change in changed:
+                if change['after'] == 0:
+                    MediaBlob.objects.filter(name=change['name']).update(ref_count=0)
+                    transaction.on_commit(lambda name=change['name']: _delete_unreferenced(name))
+                elif change['name'] in stored:
+                    MediaBlob.objects.filter(name=change['name']).update(ref_count=change['after'])
+                else:
+                    MediaBlob.objects.create(
+                        name=change['name'],
+                        sha256=blob_digest(change['name']),
+                        size=media_storage.size(change['name']) if change['name'] not in missing else 0,
+                        ref_count=change['after'],
+                    )
+    return {'blobs': len(actual), 'changed': changed, 'missing': missing}
+
+
+def legacy_references():
+    """
+    仍使用旧路径（非 blob）的文件字段
+
+    Returns:
+        dict: {旧路径: [(模型, 字段名, 主键)]}
+    """
+    from .models import Song, Chart
+
+    references = {}
+    for model in (Song, Chart):
+        for field_name in model.BLOB_FIELDS:
+            for pk, name in model.objects.exclude(**{field_name: ''}).exclude(
+                **{f'{field_name}__isnull': True}
+            ).values_list('pk', field_name).iterator():
+                if not is_blob_name(name):
+                    references.setdefault(name, []).append((model, field_name, pk))
+    return references
+
+
+def migrate_legacy_files(dry_run=False):
+    """
+    把旧的独占文件迁移为 blob：保存到内容寻址存储（相同内容只保存一次），
+    更新引用它的字段，事务提交后删除旧文件。
+    不修改引用数（字段用 QuerySet.update 更新），迁移后需要调用 recount_references。
+
+    Returns:
+        dict: {'files': 旧文件数, 'bytes': 旧文件总大小, 'blobs': 迁移后的不同 blob 数,
+               'missing': [存储中不存在的旧路径], 'migrated': [{'name', 'blob'}]}
+    """
+    result = {'files': 0, 'bytes': 0, 'blobs': 0, 'missing': [], 'migrated': []}
+    blobs = set()
+    for name, refs in sorted(legacy_references().items()):
+        if not media_storage.exists(name):
+            result['missing'].append(name)
+            continue
+        result['files'] += 1
+        result['bytes'] += media_storage.size(name)
+        if dry_run:
+            result['migrated'].append({'name': name, 'blob': None})
+            continue
+        with media_storage.open(name, 'rb') as f:
+            new_name = media_storage.save(name, File(f))
+        blobs.add(new_name)
+        with transaction.atomic():
+            for model, field_name, pk in refs:
+                model.objects.filter(pk=pk, **{field_name: name}).update(**{field_name: new_name})
+            transaction.on_commit(lambda name=name: media_storage.delete(name))
+        result['migrated'].append({'name': name, 'blob': new_name})
+    result['blobs'] = len(blobs)
+    return result
+
+
+def prune_orphans(dry_run=False, tmp_max_age=24 * 3600):
+    """
+    删除引用数已归零的 blob、超过 tmp_max_age 秒且没有 MediaBlob 记录的 blob 文件，以及超过 tmp_max_age 秒的上传临时文件
+
+    Returns:
+        list[str]: 删除（dry_run 时为将要删除）的路径
+    """
+    from .models import MediaBlob
+
+    root = media_storage.path(BLOB_DIR)
+    if not os.path.isdir(root):
+        return []
+    removed = []
+    # 引用数已归零但没有删除的记录（如提交后删除前进程退出）
+    for name in MediaBlob.objects.filter(ref_count__lte=0).values_list('name', flat=True):
+        removed.append(name)
+        if not dry_run:
+            _delete_unreferenced(name)
+
+    known = set(MediaBlob.objects.values_list('name', flat=True))
+    now = time.time()
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, media_storage.location).replace(os.sep, '/')
+            if name in removed:
+                continue
+            # 没有记录的 blob 同样要超过 tmp_max_age：刚上传、尚未提交 acquire 的文件也没有记录
+            orphan = (not is_blob_name(name) or name not in known) and now - os.path.getmtime(path) > tmp_max_age
+            if orphan:
+                removed.append(name)
+                if not dry_run:
+                    os.remove(path)
+    return removed
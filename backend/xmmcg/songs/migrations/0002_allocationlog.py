@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-17 19:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seed', models.BigIntegerField(help_text='随机种子（控制同价竞标排序和保底分配）')),
+                ('strategy', models.CharField(default='greedy', help_text='中标策略（greedy/optimal）', max_length=20)),
+                ('backend', models.CharField(default='python', help_text='实际使用的计算后端（python/numpy）', max_length=20)),
+                ('priority_self', models.BooleanField(default=False, help_text='保底分配是否优先分配用户自己的谱面')),
+                ('bids', models.JSONField(default=list, help_text='竞标快照 [[bid_id, user_id, target_id, amount], ...]，按分配时的读取顺序')),
+                ('order', models.JSONField(default=list, help_text='处理顺序：greedy 为 bids 下标，optimal 为用户加入顺序（用户ID）')),
+                ('winners', models.JSONField(default=list, help_text='中标竞标在 bids 中的下标，其余竞标均为落选（drop）')),
+                ('fallbacks', models.JSONField(default=list, help_text='保底分配 [[user_id, target_id], ...]')),
+                ('targets', models.JSONField(default=list, help_text='分配时的可分配目标ID')),
+                ('target_owners', models.JSONField(blank=True, help_text='与 targets 对应的拥有者用户ID（仅 priority_self 时记录）', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='记录时间')),
+                ('bidding_round', models.ForeignKey(help_text='所属竞标轮次', on_delete=django.db.models.deletion.CASCADE, related_name='allocation_logs', to='songs.biddinground')),
+            ],
+            options={
+                'verbose_name': '分配决策日志',
+                'verbose_name_plural': '分配决策日志',
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-17 19:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_escrows(apps, schema_editor):
+    """按已有未撤回竞标汇总每个（轮次, 用户）的承诺代币和竞标数量"""
+    Bid = apps.get_model('songs', 'Bid')
+    BidEscrow = apps.get_model('songs', 'BidEscrow')
+    totals = Bid.objects.filter(is_dropped=False).values('bidding_round_id', 'user_id').annotate(
+        committed=Sum('amount'),
+        count=Count('id')
+    ).order_by()
+    BidEscrow.objects.bulk_create(
+        [
+            BidEscrow(
+                bidding_round_id=row['bidding_round_id'],
+                user_id=row['user_id'],
+                committed_tokens=row['committed'],
+                active_bids=row['count']
+            )
+            for row in totals
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0002_allocationlog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BidEscrow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('committed_tokens', models.IntegerField(default=0, help_text='已承诺代币（未撤回竞标金额之和）')),
+                ('active_bids', models.IntegerField(default=0, help_text='未撤回的竞标数量')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='最后更新时间')),
+                ('bidding_round', models.ForeignKey(help_text='所属竞标轮次', on_delete=django.db.models.deletion.CASCADE, related_name='escrows', to='songs.biddinground')),
+                ('user', models.ForeignKey(help_text='竞标用户', on_delete=django.db.models.deletion.CASCADE, related_name='bid_escrows', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '竞标承诺',
+                'verbose_name_plural': '竞标承诺',
+                'constraints': [models.UniqueConstraint(fields=('bidding_round', 'user'), name='unique_bid_escrow_per_round_user')],
+            },
+        ),
+        migrations.RunPython(backfill_escrows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 6.0.1 on 2026-10-17 19:43
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def drop_duplicate_active_bids(apps, schema_editor):
+    """
+    添加唯一约束前，把同一用户在同一轮对同一目标的重复未撤回竞标只保留最新一条，
+    其余标记为已撤回，并重新计算受影响用户的竞标承诺
+    """
+    Bid = apps.get_model('songs', 'Bid')
+    BidEscrow = apps.get_model('songs', 'BidEscrow')
+    affected = set()
+    for target in ('song', 'chart'):
+        duplicates = Bid.objects.filter(is_dropped=False, **{f'{target}__isnull': False}).values(
+            'bidding_round_id', 'user_id', target
+        ).annotate(count=Count('id'), keep=Max('id')).filter(count__gt=1).order_by()
+        for row in duplicates:
+            Bid.objects.filter(
+                bidding_round_id=row['bidding_round_id'],
+                user_id=row['user_id'],
+                is_dropped=False,
+                **{target: row[target]}
+            ).exclude(id=row['keep']).update(is_dropped=True)
+            affected.add((row['bidding_round_id'], row['user_id']))
+    for round_id, user_id in affected:
+        totals = Bid.objects.filter(bidding_round_id=round_id, user_id=user_id, is_dropped=False).aggregate(
+            committed=Sum('amount'),
+            count=Count('id')
+        )
+        BidEscrow.objects.filter(bidding_round_id=round_id, user_id=user_id).update(
+            committed_tokens=totals['committed'] or 0,
+            active_bids=totals['count']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0003_bidescrow'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['bidding_round', 'user', 'is_dropped'], name='songs_bid_bidding_9fc5b3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['bidding_round', 'song', 'is_dropped'], name='songs_bid_bidding_04ca18_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['bidding_round', 'chart', 'is_dropped'], name='songs_bid_bidding_f12dad_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bidresult',
+            index=models.Index(fields=['bidding_round', 'user'], name='songs_bidre_bidding_95d498_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chart',
+            index=models.Index(fields=['status', 'is_part_one'], name='songs_chart_status_31dd3a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chart',
+            index=models.Index(fields=['bidding_round', 'status'], name='songs_chart_bidding_279802_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='peerreviewallocation',
+            index=models.Index(fields=['reviewer', 'status'], name='songs_peerr_reviewe_a35c45_idx'),
+        ),
+        migrations.RunPython(drop_duplicate_active_bids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bid',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_dropped', False), ('song__isnull', False)), fields=('bidding_round', 'user', 'song'), name='unique_active_song_bid'),
+        ),
+        migrations.AddConstraint(
+            model_name='bid',
+            constraint=models.UniqueConstraint(condition=models.Q(('chart__isnull', False), ('is_dropped', False)), fields=('bidding_round', 'user', 'chart'), name='unique_active_chart_bid'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 6.0.1 on 2026-10-17 19:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_market_stats(apps, schema_editor):
+    """按已有未撤回竞标汇总每个（轮次, 目标）的竞标数量、最高价和第二高价"""
+    Bid = apps.get_model('songs', 'Bid')
+    TargetMarketStats = apps.get_model('songs', 'TargetMarketStats')
+    stats = {}
+    bids = Bid.objects.filter(is_dropped=False).order_by('-amount').values_list(
+        'bidding_round_id', 'bid_type', 'song_id', 'chart_id', 'amount'
+    )
+    for round_id, bid_type, song_id, chart_id, amount in bids.iterator():
+        key = (round_id, bid_type, song_id, chart_id)
+        row = stats.setdefault(key, {'bid_count': 0, 'max_amount': amount, 'second_amount': 0})
+        row['bid_count'] += 1
+        if row['bid_count'] == 2:
+            row['second_amount'] = amount
+    TargetMarketStats.objects.bulk_create(
+        [
+            TargetMarketStats(bidding_round_id=round_id, bid_type=bid_type, song_id=song_id, chart_id=chart_id, **row)
+            for (round_id, bid_type, song_id, chart_id), row in stats.items()
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TargetMarketStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bid_type', models.CharField(choices=[('song', '歌曲竞标'), ('chart', '谱面竞标')], default='song', help_text='竞标类型：歌曲或谱面', max_length=20)),
+                ('bid_count', models.IntegerField(default=0, help_text='未撤回的竞标数量')),
+                ('max_amount', models.IntegerField(default=0, help_text='最高出价')),
+                ('second_amount', models.IntegerField(default=0, help_text='第二高出价（竞标少于2个时为0）')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='最后更新时间')),
+                ('bidding_round', models.ForeignKey(help_text='所属竞标轮次', on_delete=django.db.models.deletion.CASCADE, related_name='market_stats', to='songs.biddinground')),
+                ('chart', models.ForeignKey(blank=True, help_text='目标谱面（仅当bid_type=chart时使用）', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='market_stats', to='songs.chart')),
+                ('song', models.ForeignKey(blank=True, help_text='目标歌曲（仅当bid_type=song时使用）', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='market_stats', to='songs.song')),
+            ],
+            options={
+                'verbose_name': '竞标行情',
+                'verbose_name_plural': '竞标行情',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('song__isnull', False)), fields=('bidding_round', 'song'), name='unique_market_stats_song'), models.UniqueConstraint(condition=models.Q(('chart__isnull', False)), fields=('bidding_round', 'chart'), name='unique_market_stats_chart')],
+            },
+        ),
+        migrations.RunPython(backfill_market_stats, migrations.RunPython.noop),
+    ]
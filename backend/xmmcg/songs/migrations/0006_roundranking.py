@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-17 20:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0005_targetmarketstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoundRanking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(choices=[('zscore', '评分者标准化（z-score）平均'), ('mean', '原始平均分'), ('trimmed', '截尾平均分'), ('favorites', '喜欢数')], help_text='计分方式', max_length=20)),
+                ('entries', models.JSONField(default=list, help_text='排名条目（按名次排序）：rank, chart_id, username, song_title, score, average_score, review_count, total_score, favorite_count')),
+                ('review_count', models.IntegerField(default=0, help_text='参与计算的评分数')),
+                ('computed_at', models.DateTimeField(auto_now=True, help_text='生成时间')),
+                ('bidding_round', models.ForeignKey(help_text='所属竞标轮次', on_delete=django.db.models.deletion.CASCADE, related_name='rankings', to='songs.biddinground')),
+            ],
+            options={
+                'verbose_name': '排名快照',
+                'verbose_name_plural': '排名快照',
+                'constraints': [models.UniqueConstraint(fields=('bidding_round', 'method'), name='unique_round_ranking_method')],
+            },
+        ),
+    ]
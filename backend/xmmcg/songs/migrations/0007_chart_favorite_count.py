@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-17 20:13
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_favorite_counts(apps, schema_editor):
+    """按已有评分记录汇总每张谱面的真爱票数"""
+    Chart = apps.get_model('songs', 'Chart')
+    PeerReview = apps.get_model('songs', 'PeerReview')
+    counts = PeerReview.objects.filter(favorite=True).values('chart_id').annotate(n=Count('id')).order_by()
+    charts = []
+    for row in counts:
+        charts.append(Chart(id=row['chart_id'], favorite_count=row['n']))
+    Chart.objects.bulk_update(charts, ['favorite_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0006_roundranking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chart',
+            name='favorite_count',
+            field=models.IntegerField(default=0, help_text='收到的真爱票数（包括额外评分）'),
+        ),
+        migrations.AddIndex(
+            model_name='chart',
+            index=models.Index(fields=['bidding_round', '-favorite_count'], name='songs_chart_bidding_7ae026_idx'),
+        ),
+        migrations.RunPython(backfill_favorite_counts, migrations.RunPython.noop),
+    ]
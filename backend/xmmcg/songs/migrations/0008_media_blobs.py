@@ -0,0 +1,60 @@
+# Generated by Django 6.0.1 on 2026-10-17 20:27
+
+import songs.media_store
+import songs.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0007_chart_favorite_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='存储路径 blobs/<前两位>/<sha256>.<扩展名>', max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, help_text='文件内容 SHA256', max_length=64)),
+                ('size', models.BigIntegerField(help_text='文件大小（字节）')),
+                ('ref_count', models.IntegerField(default=0, help_text='引用该文件的文件字段数')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': '媒体文件',
+                'verbose_name_plural': '媒体文件',
+            },
+        ),
+        migrations.AlterField(
+            model_name='chart',
+            name='audio_file',
+            field=models.FileField(blank=True, help_text='谱面对应音频文件', null=True, storage=songs.media_store.get_media_storage, upload_to=songs.models.get_chart_audio_filename),
+        ),
+        migrations.AlterField(
+            model_name='chart',
+            name='background_video',
+            field=models.FileField(blank=True, help_text='谱面背景视频（可选）', null=True, storage=songs.media_store.get_media_storage, upload_to=songs.models.get_chart_video_filename),
+        ),
+        migrations.AlterField(
+            model_name='chart',
+            name='cover_image',
+            field=models.ImageField(blank=True, help_text='谱面封面图片', null=True, storage=songs.media_store.get_media_storage, upload_to=songs.models.get_chart_cover_filename),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='audio_file',
+            field=models.FileField(help_text='音频文件', storage=songs.media_store.get_media_storage, upload_to=songs.models.get_audio_filename),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='background_video',
+            field=models.FileField(blank=True, help_text='背景视频（bg.mp4或pv.mp4，最大20MB，可选）', null=True, storage=songs.media_store.get_media_storage, upload_to=songs.models.get_video_filename),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='cover_image',
+            field=models.ImageField(blank=True, help_text='封面图片（可选）', null=True, storage=songs.media_store.get_media_storage, upload_to=songs.models.get_cover_filename),
+        ),
+    ]
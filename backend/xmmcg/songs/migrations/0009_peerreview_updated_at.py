@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0008_media_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='peerreview',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='最后修改时间（额外评分可重复提交修改）'),
+        ),
+    ]
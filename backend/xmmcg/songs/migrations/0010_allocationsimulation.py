@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-17 20:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0009_peerreview_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationSimulation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('result', models.JSONField(default=dict, help_text='simulate_round 的返回值（规则汇总和用户明细）')),
+                ('computed_at', models.DateTimeField(auto_now=True, help_text='计算时间')),
+                ('bidding_round', models.OneToOneField(help_text='所属竞标轮次', on_delete=django.db.models.deletion.CASCADE, related_name='allocation_simulation', to='songs.biddinground')),
+            ],
+            options={
+                'verbose_name': '分配模拟结果',
+                'verbose_name_plural': '分配模拟结果',
+            },
+        ),
+    ]
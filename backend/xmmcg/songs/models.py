@@ -1,8 +1,10 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 
+from .media_store import get_media_storage
+
 # ==================== 可调整的常量 ====================
 # 每个用户可上传的歌曲数量限制
 MAX_SONGS_PER_USER = 3
@@ -189,6 +191,9 @@ class CompetitionPhase(models.Model):
             return max(0, min(100, int((elapsed / total_duration) * 100)))
 
 
+# 注意：歌曲 / 谱面的音频、封面、视频字段使用内容寻址存储（songs/media_store.py），
+# 下面生成的文件名只用于确定扩展名，实际路径为 blobs/<前两位>/<sha256>.<扩展名>；maidata.txt 不受影响
+
 def get_audio_filename(instance, filename):
     """
     生成音频文件名
@@ -260,8 +265,97 @@ def get_chart_video_filename(instance, filename):
     return f'charts/video_user{instance.user.id}_song{instance.song.id}_{unique_id}.{ext}'
 
 
-class Song(models.Model):
+class MediaBlob(models.Model):
+    """
+    内容寻址存储中的一个文件（见 songs/media_store.py）
+    同一内容只保存一次，ref_count 为引用它的 Song / Chart 文件字段数，归零时删除文件。
+    """
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        help_text='存储路径 blobs/<前两位>/<sha256>.<扩展名>'
+    )
+    sha256 = models.CharField(
+        max_length=64,
+        db_index=True,
+        help_text='文件内容 SHA256'
+    )
+    size = models.BigIntegerField(help_text='文件大小（字节）')
+    ref_count = models.IntegerField(default=0, help_text='引用该文件的文件字段数')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = '媒体文件'
+        verbose_name_plural = '媒体文件'
+
+    def __str__(self):
+        return f"{self.name} (引用 {self.ref_count})"
+
+
+class BlobReferenceMixin:
+    """
+    文件字段使用内容寻址存储的模型（BLOB_FIELDS 列出这些字段）：
+    保存时为新的文件 acquire 引用、为被替换的文件 release 引用；release_files 在删除记录时释放全部引用。
+    """
+    BLOB_FIELDS = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_blob_names = instance._loaded_blob_names()
+        return instance
+
+    def _loaded_blob_names(self):
+        """已加载（非延迟）的文件字段当前值 {字段名: 存储路径}"""
+        names = {}
+        for field_name in self.BLOB_FIELDS:
+            if field_name in self.__dict__:
+                value = self.__dict__[field_name]
+                names[field_name] = getattr(value, 'name', value) or ''
+        return names
+
+    def save(self, *args, **kwargs):
+        from . import media_store
+
+        update_fields = kwargs.get('update_fields')
+        fields = [f for f in self.BLOB_FIELDS if update_fields is None or f in update_fields]
+        with transaction.atomic():
+            old = {} if self._state.adding else dict(getattr(self, '_saved_blob_names', {}))
+            missing = [f for f in fields if f not in old and f in self.__dict__]
+            if missing and not self._state.adding:
+                row = type(self).objects.filter(pk=self.pk).values(*missing).first() or {}
+                old.update({f: row.get(f) or '' for f in missing})
+
+            super().save(*args, **kwargs)
+
+            new = self._loaded_blob_names()
+            changed = [f for f in fields if f in new and new[f] != old.get(f, '')]
+            media_store.acquire(new[f] for f in changed)
+            media_store.release(old.get(f, '') for f in changed)
+            old.update(new)
+            self._saved_blob_names = old
+
+    def release_files(self):
+        """删除记录前处理文件：blob 释放引用（最后一个引用释放时删除文件），旧的独占文件直接删除"""
+        from . import media_store
+
+        blobs = []
+        for field_name in self.BLOB_FIELDS:
+            field_file = getattr(self, field_name)
+            if not field_file:
+                continue
+            if media_store.is_blob_name(field_file.name):
+                blobs.append(field_file.name)
+            else:
+                field_file.delete(save=False)
+        media_store.release(blobs)
+
+
+class Song(BlobReferenceMixin, models.Model):
     """用户上传的歌曲模型"""
+
+    # 使用内容寻址存储的文件字段（见 songs/media_store.py）
+    BLOB_FIELDS = ('audio_file', 'cover_image', 'background_video')
     
     # 主键
     id = models.AutoField(primary_key=True)
@@ -287,16 +381,19 @@ class Song(models.Model):
     )
     audio_file = models.FileField(
         upload_to=get_audio_filename,
+        storage=get_media_storage,
         help_text='音频文件'
     )
     cover_image = models.ImageField(
         upload_to=get_cover_filename,
+        storage=get_media_storage,
         null=True,
         blank=True,
         help_text='封面图片（可选）'
     )
     background_video = models.FileField(
         upload_to=get_video_filename,
+        storage=get_media_storage,
         null=True,
         blank=True,
         help_text='背景视频（bg.mp4或pv.mp4，最大20MB，可选）'
@@ -336,14 +433,16 @@ class Song(models.Model):
         return f"#{self.id} - {self.title} (by {self.user.username})"
     
     def delete(self, *args, **kwargs):
-        """删除歌曲时同时删除关联文件"""
-        if self.audio_file:
-            self.audio_file.delete(save=False)
-        if self.cover_image:
-            self.cover_image.delete(save=False)
-        if self.background_video:
-            self.background_video.delete(save=False)
-        super().delete(*args, **kwargs)
+        """
+        删除歌曲时同时删除关联文件（与其他歌曲 / 谱面共用的文件在最后一个引用删除时才删除）
+
+        该歌曲的谱面由级联删除，不经过 Chart.delete()，在同一事务中先释放它们的文件
+        """
+        with transaction.atomic():
+            for chart in self.charts.all():
+                chart.release_files()
+            self.release_files()
+            super().delete(*args, **kwargs)
 
 
 class BiddingRound(models.Model):
@@ -487,6 +586,26 @@ class Bid(models.Model):
         verbose_name = '竞标'
         verbose_name_plural = '竞标'
         ordering = ['-amount', '-created_at']
+        indexes = [
+            # 用户在某轮的竞标 / 未撤回竞标
+            models.Index(fields=['bidding_round', 'user', 'is_dropped']),
+            # 某个目标在某轮收到的竞标（行情、分配）
+            models.Index(fields=['bidding_round', 'song', 'is_dropped']),
+            models.Index(fields=['bidding_round', 'chart', 'is_dropped']),
+        ]
+        constraints = [
+            # 同一用户在同一轮对同一目标只能有一个未撤回的竞标（部分唯一索引）
+            models.UniqueConstraint(
+                fields=['bidding_round', 'user', 'song'],
+                condition=models.Q(is_dropped=False, song__isnull=False),
+                name='unique_active_song_bid'
+            ),
+            models.UniqueConstraint(
+                fields=['bidding_round', 'user', 'chart'],
+                condition=models.Q(is_dropped=False, chart__isnull=False),
+                name='unique_active_chart_bid'
+            ),
+        ]
     
     def __str__(self):
         target = self.song.title if self.song else (f"{self.chart.user.username}的谱面" if self.chart else "未知")
@@ -530,6 +649,134 @@ class Bid(models.Model):
         return self.song if self.bid_type == 'song' else self.chart
 
 
+class BidEscrow(models.Model):
+    """
+    竞标承诺（每个轮次每个用户一行）
+
+    汇总用户在该轮次中未撤回竞标的承诺代币总额和竞标数量，
+    由 BiddingService.create_bid / delete_bid 在同一事务中原子更新，
+    创建竞标时用一条条件 UPDATE 同时校验竞标数量上限和余额是否足以覆盖全部承诺。
+    仅在轮次进行中有意义（分配时的 drop 不回写）。
+    """
+    
+    bidding_round = models.ForeignKey(
+        BiddingRound,
+        on_delete=models.CASCADE,
+        related_name='escrows',
+        help_text='所属竞标轮次'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='bid_escrows',
+        help_text='竞标用户'
+    )
+    committed_tokens = models.IntegerField(
+        default=0,
+        help_text='已承诺代币（未撤回竞标金额之和）'
+    )
+    active_bids = models.IntegerField(
+        default=0,
+        help_text='未撤回的竞标数量'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text='最后更新时间'
+    )
+    
+    class Meta:
+        verbose_name = '竞标承诺'
+        verbose_name_plural = '竞标承诺'
+        constraints = [
+            models.UniqueConstraint(fields=['bidding_round', 'user'], name='unique_bid_escrow_per_round_user'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} 在 {self.bidding_round.name} 承诺 {self.committed_tokens}代币（{self.active_bids}个竞标）"
+
+
+
+class TargetMarketStats(models.Model):
+    """
+    竞标行情汇总（每个轮次每个目标一行）
+
+    记录目标当前未撤回竞标的数量、最高出价和第二高出价，
+    由 BiddingService.create_bid / delete_bid 在同一事务中增量维护，
+    列表页可以一次查询拿到所有目标的行情，而不必逐个加载竞标明细。
+    分配时对竞标的 drop 不回写，轮次完成后保留的是截止时的行情。
+    """
+    
+    BID_TYPE_CHOICES = [
+        ('song', '歌曲竞标'),
+        ('chart', '谱面竞标'),
+    ]
+    
+    bidding_round = models.ForeignKey(
+        BiddingRound,
+        on_delete=models.CASCADE,
+        related_name='market_stats',
+        help_text='所属竞标轮次'
+    )
+    bid_type = models.CharField(
+        max_length=20,
+        choices=BID_TYPE_CHOICES,
+        default='song',
+        help_text='竞标类型：歌曲或谱面'
+    )
+    song = models.ForeignKey(
+        Song,
+        on_delete=models.CASCADE,
+        related_name='market_stats',
+        null=True,
+        blank=True,
+        help_text='目标歌曲（仅当bid_type=song时使用）'
+    )
+    chart = models.ForeignKey(
+        'Chart',
+        on_delete=models.CASCADE,
+        related_name='market_stats',
+        null=True,
+        blank=True,
+        help_text='目标谱面（仅当bid_type=chart时使用）'
+    )
+    bid_count = models.IntegerField(
+        default=0,
+        help_text='未撤回的竞标数量'
+    )
+    max_amount = models.IntegerField(
+        default=0,
+        help_text='最高出价'
+    )
+    second_amount = models.IntegerField(
+        default=0,
+        help_text='第二高出价（竞标少于2个时为0）'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text='最后更新时间'
+    )
+    
+    class Meta:
+        verbose_name = '竞标行情'
+        verbose_name_plural = '竞标行情'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bidding_round', 'song'],
+                condition=models.Q(song__isnull=False),
+                name='unique_market_stats_song'
+            ),
+            models.UniqueConstraint(
+                fields=['bidding_round', 'chart'],
+                condition=models.Q(chart__isnull=False),
+                name='unique_market_stats_chart'
+            ),
+        ]
+    
+    def __str__(self):
+        target = self.song.title if self.song else (f"{self.chart.user.username}的谱面" if self.chart else "未知")
+        return f"{self.bidding_round.name} - {target}：{self.bid_count}个竞标，最高 {self.max_amount}代币"
+
+
 
 class BidResult(models.Model):
     """竞标结果（分配结果）"""
@@ -601,6 +848,9 @@ class BidResult(models.Model):
         verbose_name = '竞标结果'
         verbose_name_plural = '竞标结果'
         ordering = ['-allocated_at']
+        indexes = [
+            models.Index(fields=['bidding_round', 'user']),
+        ]
     
     def __str__(self):
         allocation_type_display = self.get_allocation_type_display()
@@ -624,8 +874,113 @@ class BidResult(models.Model):
         return self.song if self.bid_type == 'song' else self.chart
 
 
-class Chart(models.Model):
+class AllocationLog(models.Model):
+    """
+    竞标分配决策日志
+
+    记录一次分配所需的全部输入和决策（随机种子、竞标快照、处理顺序、逐条结果、保底结果），
+    使已完成的轮次可以在内存中重放和审计，而不需要读取或修改 Bid 表。
+    """
+    
+    bidding_round = models.ForeignKey(
+        BiddingRound,
+        on_delete=models.CASCADE,
+        related_name='allocation_logs',
+        help_text='所属竞标轮次'
+    )
+    seed = models.BigIntegerField(
+        help_text='随机种子（控制同价竞标排序和保底分配）'
+    )
+    strategy = models.CharField(
+        max_length=20,
+        default='greedy',
+        help_text='中标策略（greedy/optimal）'
+    )
+    backend = models.CharField(
+        max_length=20,
+        default='python',
+        help_text='实际使用的计算后端（python/numpy）'
+    )
+    priority_self = models.BooleanField(
+        default=False,
+        help_text='保底分配是否优先分配用户自己的谱面'
+    )
+    bids = models.JSONField(
+        default=list,
+        help_text='竞标快照 [[bid_id, user_id, target_id, amount], ...]，按分配时的读取顺序'
+    )
+    order = models.JSONField(
+        default=list,
+        help_text='处理顺序：greedy 为 bids 下标，optimal 为用户加入顺序（用户ID）'
+    )
+    winners = models.JSONField(
+        default=list,
+        help_text='中标竞标在 bids 中的下标，其余竞标均为落选（drop）'
+    )
+    fallbacks = models.JSONField(
+        default=list,
+        help_text='保底分配 [[user_id, target_id], ...]'
+    )
+    targets = models.JSONField(
+        default=list,
+        help_text='分配时的可分配目标ID'
+    )
+    target_owners = models.JSONField(
+        null=True,
+        blank=True,
+        help_text='与 targets 对应的拥有者用户ID（仅 priority_self 时记录）'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        help_text='记录时间'
+    )
+    
+    class Meta:
+        verbose_name = '分配决策日志'
+        verbose_name_plural = '分配决策日志'
+        ordering = ['-created_at', '-id']
+    
+    def __str__(self):
+        return f"{self.bidding_round.name} 分配日志 (seed={self.seed}, {self.strategy})"
+
+
+class AllocationSimulation(models.Model):
+    """
+    轮次最新的分配公平性模拟结果（每个轮次一行）
+
+    由 songs.allocation_simulation.store_result 写入（Admin 页面和 simulate_allocation 命令共用），
+    Admin 模拟页面不带参数打开时直接读取，不重新计算；存在数据库中，
+    命令行进程和各 Web worker 看到的是同一份结果。
+    """
+    
+    bidding_round = models.OneToOneField(
+        BiddingRound,
+        on_delete=models.CASCADE,
+        related_name='allocation_simulation',
+        help_text='所属竞标轮次'
+    )
+    result = models.JSONField(
+        default=dict,
+        help_text='simulate_round 的返回值（规则汇总和用户明细）'
+    )
+    computed_at = models.DateTimeField(
+        auto_now=True,
+        help_text='计算时间'
+    )
+    
+    class Meta:
+        verbose_name = '分配模拟结果'
+        verbose_name_plural = '分配模拟结果'
+    
+    def __str__(self):
+        return f"{self.bidding_round.name} 分配模拟 ({self.computed_at:%Y-%m-%d %H:%M})"
+
+
+class Chart(BlobReferenceMixin, models.Model):
     """用户提交的谱面（beatmap）"""
+
+    # 使用内容寻址存储的文件字段（与歌曲上传的相同文件只保存一次）
+    BLOB_FIELDS = ('audio_file', 'cover_image', 'background_video')
     
     STATUS_CHOICES = [
         ('part_submitted', '半成品'),
@@ -678,18 +1033,21 @@ class Chart(models.Model):
     # 上传资源（第一阶段半成品需要打包文件）
     audio_file = models.FileField(
         upload_to=get_chart_audio_filename,
+        storage=get_media_storage,
         null=True,
         blank=True,
         help_text='谱面对应音频文件'
     )
     cover_image = models.ImageField(
         upload_to=get_chart_cover_filename,
+        storage=get_media_storage,
         null=True,
         blank=True,
         help_text='谱面封面图片'
     )
     background_video = models.FileField(
         upload_to=get_chart_video_filename,
+        storage=get_media_storage,
         null=True,
         blank=True,
         help_text='谱面背景视频（可选）'
@@ -732,6 +1090,10 @@ class Chart(models.Model):
         default=0.0,
         help_text='平均分（0-50）'
     )
+    favorite_count = models.IntegerField(
+        default=0,
+        help_text='收到的真爱票数（包括额外评分）'
+    )
     
     # 二部分谱面支持（第二轮竞标续写）
     is_part_one = models.BooleanField(
@@ -761,22 +1123,37 @@ class Chart(models.Model):
         ordering = ['-created_at']
         # 一个用户对同一歌曲在同一轮中只能提交一个谱面
         unique_together = ('bidding_round', 'user', 'song')
+        indexes = [
+            # 半成品谱面 / 可竞标谱面
+            models.Index(fields=['status', 'is_part_one']),
+            # 某轮可评分的谱面
+            models.Index(fields=['bidding_round', 'status']),
+            # 某轮的真爱票排行榜
+            models.Index(fields=['bidding_round', '-favorite_count']),
+        ]
     
     def __str__(self):
         part_info = '（二部分）' if not self.is_part_one else ''
         return f"{self.user.username} - {self.song.title} {part_info}({self.get_status_display()})"
     
-    def delete(self, *args, **kwargs):
-        """删除谱面时同时删除关联的谱面文件"""
+    def release_files(self):
+        """
+        删除记录前处理文件：释放 blob 引用；谱面文件和资源包缓存在事务提交后删除（回滚时保留）
+        """
+        from .bundle import delete_chart_bundles
+        
+        super().release_files()
+        chart_id = self.id
         if self.chart_file:
-            self.chart_file.delete(save=False)
-        if self.audio_file:
-            self.audio_file.delete(save=False)
-        if self.cover_image:
-            self.cover_image.delete(save=False)
-        if self.background_video:
-            self.background_video.delete(save=False)
-        super().delete(*args, **kwargs)
+            storage, name = self.chart_file.storage, self.chart_file.name
+            transaction.on_commit(lambda: storage.delete(name))
+        transaction.on_commit(lambda: delete_chart_bundles(chart_id))
+    
+    def delete(self, *args, **kwargs):
+        """删除谱面时同时删除关联的谱面文件（与其他歌曲 / 谱面共用的文件在最后一个引用删除时才删除）"""
+        with transaction.atomic():
+            self.release_files()
+            super().delete(*args, **kwargs)
 
 
 class PeerReviewAllocation(models.Model):
@@ -828,6 +1205,10 @@ class PeerReviewAllocation(models.Model):
         ordering = ['allocated_at']
         # 同一个评分者不能多次评同一个谱面
         unique_together = ('reviewer', 'chart')
+        indexes = [
+            # 评分者的待评分任务
+            models.Index(fields=['reviewer', 'status']),
+        ]
     
     def __str__(self):
         return f"{self.reviewer.username} -> {self.chart.user.username}的{self.chart.song.title}"
@@ -882,6 +1263,10 @@ class PeerReview(models.Model):
         auto_now_add=True,
         help_text='评分时间'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text='最后修改时间（额外评分可重复提交修改）'
+    )
     
     class Meta:
         verbose_name = '互评记录'
@@ -899,6 +1284,58 @@ class PeerReview(models.Model):
             )
 
 
+class RoundRanking(models.Model):
+    """
+    轮次排名快照（每个轮次每种计分方式一行）
+
+    由 songs.ranking.compute_round_rankings 从该轮的 PeerReview 一次性计算生成，
+    排名接口直接读取快照（并缓存），不再在每次请求时排序。
+    提交评分的事务提交后 songs.ranking.invalidate_rankings 删除该轮的快照和缓存，
+    下一次读取时按当前评分自动重新生成；管理员操作和 compute_round_rankings 命令可提前生成。
+    """
+    
+    METHOD_CHOICES = [
+        ('zscore', '评分者标准化（z-score）平均'),
+        ('mean', '原始平均分'),
+        ('trimmed', '截尾平均分'),
+        ('favorites', '喜欢数'),
+    ]
+    
+    bidding_round = models.ForeignKey(
+        BiddingRound,
+        on_delete=models.CASCADE,
+        related_name='rankings',
+        help_text='所属竞标轮次'
+    )
+    method = models.CharField(
+        max_length=20,
+        choices=METHOD_CHOICES,
+        help_text='计分方式'
+    )
+    entries = models.JSONField(
+        default=list,
+        help_text='排名条目（按名次排序）：rank, chart_id, username, song_title, score, average_score, review_count, total_score, favorite_count'
+    )
+    review_count = models.IntegerField(
+        default=0,
+        help_text='参与计算的评分数'
+    )
+    computed_at = models.DateTimeField(
+        auto_now=True,
+        help_text='生成时间'
+    )
+    
+    class Meta:
+        verbose_name = '排名快照'
+        verbose_name_plural = '排名快照'
+        constraints = [
+            models.UniqueConstraint(fields=['bidding_round', 'method'], name='unique_round_ranking_method'),
+        ]
+    
+    def __str__(self):
+        return f"{self.bidding_round.name} - {self.get_method_display()}"
+
+
 # ==================== 第二轮竞标系统（已废弃，使用统一的Bid系统） ====================
 # 注意：以下代码已被注释，现在使用统一的Bid/BidResult系统来处理歌曲和谱面竞标
 # 请使用 BiddingRound.bidding_type='chart' 来进行谱面竞标
@@ -0,0 +1,280 @@
+"""
+轮次排名计算
+
+计分核心（score_reviews / rank_order）不依赖 ORM，输入为等长序列
+(reviewer_ids, chart_ids, scores, favorites)，第 i 个元素描述一条评分；
+compute_round_rankings 一次读取整轮评分，为所有计分方式生成 RoundRanking 快照，
+get_ranking 从缓存/快照中读取排名供接口分页返回；
+提交评分时 invalidate_rankings 删除该轮的快照和缓存，下次读取时重新生成
+（缓存须为各进程共用的后端，见 settings.CACHES，否则其他 worker 仍返回旧排名）。
+
+计分方式：
+- zscore（默认）：先把每条评分按评分者标准化 z = (分数 - 该评分者平均分) / 该评分者标准差，
+  再对谱面取平均，消除"手松/手紧"评分者的影响（评分者只评了一个谱面或打分全相同时 z 记为 0）
+- mean：原始平均分
+- trimmed：截尾平均分，每张谱面去掉最高、最低各 TRIM_RATIO 比例的评分后取平均
+- favorites：喜欢数
+名次按 (计分 降序, 原始平均分 降序, 评分数 降序, 谱面ID 升序) 排列。
+settings.ROUND_RANKING_EXCLUDE_FLAGS 非空时，带有其中任一标记的评分者（见 review_analysis）的评分不参与排名。
+
+安装了 NumPy 时使用 np.bincount 等向量化运算（1 万条评分约数毫秒），否则使用纯 Python。
+"""
+
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖
+    np = None
+
+
+RANKING_METHODS = ('zscore', 'mean', 'trimmed', 'favorites')
+
+# 截尾平均时每端去掉的评分比例（向下取整，评分较少的谱面可能一个也不去掉）
+TRIM_RATIO = 0.1
+
+# 计分保留的小数位数（也保证 NumPy 与纯 Python 两种实现的名次一致）
+SCORE_DIGITS = 6
+
+
+def score_reviews(reviewer_ids, chart_ids, scores, favorites, trim_ratio=TRIM_RATIO):
+    """
+    计算每张谱面在各种计分方式下的得分
+
+    Returns:
+        dict: {
+            'chart_ids': [谱面ID]（升序）,
+            'review_count', 'total_score', 'favorites': [int]（与 chart_ids 对应）,
+            'mean', 'zscore', 'trimmed': [float]（与 chart_ids 对应）,
+        }
+    """
+    if np is not None:
+        return _score_reviews_numpy(reviewer_ids, chart_ids, scores, favorites, trim_ratio)
+    return _score_reviews_python(reviewer_ids, chart_ids, scores, favorites, trim_ratio)
+
+
+def _score_reviews_numpy(reviewer_ids, chart_ids, scores, favorites, trim_ratio):
+    if len(scores) == 0:
+        return _empty_scores()
+    _, reviewer_idx = np.unique(np.asarray(reviewer_ids, dtype=np.int64), return_inverse=True)
+    charts, chart_idx = np.unique(np.asarray(chart_ids, dtype=np.int64), return_inverse=True)
+    scores = np.asarray(scores, dtype=np.float64)
+    num_charts = len(charts)
+
+    # 评分者的平均分和标准差
+    reviewer_n = np.bincount(reviewer_idx)
+    reviewer_mean = np.bincount(reviewer_idx, scores) / reviewer_n
+    deviation = scores - reviewer_mean[reviewer_idx]
+    reviewer_std = np.sqrt(np.bincount(reviewer_idx, deviation * deviation) / reviewer_n)
+    std = reviewer_std[reviewer_idx]
+    z = np.divide(deviation, std, out=np.zeros_like(deviation), where=std > 1e-12)
+
+    counts = np.bincount(chart_idx, minlength=num_charts)
+    totals = np.bincount(chart_idx, scores, minlength=num_charts)
+
+    # 截尾平均：按 (谱面, 分数) 排序后，保留每组中名次在 [k, n - k) 的评分
+    order = np.lexsort((scores, chart_idx))
+    sorted_charts = chart_idx[order]
+    starts = np.cumsum(counts) - counts
+    position = np.arange(len(order)) - starts[sorted_charts]
+    trim = np.floor(counts * trim_ratio).astype(np.int64)
+    keep = (position >= trim[sorted_charts]) & (position < counts[sorted_charts] - trim[sorted_charts])
+    trimmed_sum = np.bincount(sorted_charts[keep], scores[order][keep], minlength=num_charts)
+
+    return {
+        'chart_ids': charts.tolist(),
+        'review_count': counts.tolist(),
+        'total_score': np.rint(totals).astype(np.int64).tolist(),
+        'favorites': np.bincount(chart_idx, np.asarray(favorites, dtype=np.float64), minlength=num_charts)
+                       .astype(np.int64).tolist(),
+        'mean': np.round(totals / counts, SCORE_DIGITS).tolist(),
+        'zscore': np.round(np.bincount(chart_idx, z, minlength=num_charts) / counts, SCORE_DIGITS).tolist(),
+        'trimmed': np.round(trimmed_sum / (counts - 2 * trim), SCORE_DIGITS).tolist(),
+    }
+
+
+def _score_reviews_python(reviewer_ids, chart_ids, scores, favorites, trim_ratio):
+    if len(scores) == 0:
+        return _empty_scores()
+    by_reviewer = {}
+    for reviewer_id, score in zip(reviewer_ids, scores):
+        by_reviewer.setdefault(reviewer_id, []).append(score)
+    reviewer_stats = {}
+    for reviewer_id, values in by_reviewer.items():
+        mean = sum(values) / len(values)
+        std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+        reviewer_stats[reviewer_id] = (mean, std)
+
+    by_chart = {}
+    for reviewer_id, chart_id, score, favorite in zip(reviewer_ids, chart_ids, scores, favorites):
+        mean, std = reviewer_stats[reviewer_id]
+        z = (score - mean) / std if std > 1e-12 else 0.0
+        by_chart.setdefault(chart_id, []).append((score, z, bool(favorite)))
+
+    result = _empty_scores()
+    for chart_id in sorted(by_chart):
+        entries = by_chart[chart_id]
+        n = len(entries)
+        values = sorted(score for score, _, _ in entries)
+        trim = int(math.floor(n * trim_ratio))
+        kept = values[trim:n - trim]
+        result['chart_ids'].append(chart_id)
+        result['review_count'].append(n)
+        result['total_score'].append(int(sum(values)))
+        result['favorites'].append(sum(1 for _, _, favorite in entries if favorite))
+        result['mean'].append(round(sum(values) / n, SCORE_DIGITS))
+        result['zscore'].append(round(sum(z for _, z, _ in entries) / n, SCORE_DIGITS))
+        result['trimmed'].append(round(sum(kept) / len(kept), SCORE_DIGITS))
+    return result
+
+
+def _empty_scores():
+    return {key: [] for key in ('chart_ids', 'review_count', 'total_score', 'favorites', 'mean', 'zscore', 'trimmed')}
+
+
+def rank_order(scored, method):
+    """按名次返回 scored 中的下标：(计分 降序, 原始平均分 降序, 评分数 降序, 谱面ID 升序)"""
+    if method not in RANKING_METHODS:
+        raise ValueError(f'未知的计分方式: {method}')
+    primary = scored[method]
+    if np is not None:
+        return np.lexsort((
+            np.asarray(scored['chart_ids']),
+            -np.asarray(scored['review_count']),
+            -np.asarray(scored['mean']),
+            -np.asarray(primary),
+        )).tolist()
+    return sorted(
+        range(len(scored['chart_ids'])),
+        key=lambda i: (-primary[i], -scored['mean'][i], -scored['review_count'][i], scored['chart_ids'][i])
+    )
+
+
+# ==================== 快照与缓存 ====================
+
+def default_method():
+    return getattr(settings, 'ROUND_RANKING_DEFAULT_METHOD', 'zscore')
+
+
+def _cache_key(round_id, method):
+    return f'round_ranking:{round_id}:{method}'
+
+
+def invalidate_rankings(round_ids):
+    """
+    评分变化后，事务提交时删除这些轮次的排名快照和缓存（回滚时不删除），
+    下次读取时按当前评分重新生成，互评进行中不会一直返回第一次请求时的部分排名
+    """
+    from .models import RoundRanking
+
+    round_ids = set(round_ids)
+    if not round_ids:
+        return
+
+    def invalidate():
+        RoundRanking.objects.filter(bidding_round_id__in=round_ids).delete()
+        cache.delete_many([
+            _cache_key(round_id, method) for round_id in round_ids for method in RANKING_METHODS
+        ])
+
+    transaction.on_commit(invalidate)
+
+
+def compute_round_rankings(bidding_round):
+    """
+    从该轮的评分一次性计算所有计分方式的排名，写入 RoundRanking 快照并清除缓存
+
+    参与计算的评分与谱面统计一致（额外评分按 PEER_REVIEW_EXTRA_REVIEW_POLICY，见 review_stats）；
+    评分者的标准化使用他在本轮的全部评分，排名只包含已评分完成（reviewed）的谱面。
+
+    Returns:
+        dict: {method: RoundRanking}
+    """
+    from .models import Chart, PeerReview, RoundRanking
+    from .review_stats import counted_reviews_filter
+
+    rows = list(
+        PeerReview.objects.filter(
+            counted_reviews_filter(),
+            chart__bidding_round=bidding_round
+        ).values_list('reviewer_id', 'chart_id', 'score', 'favorite')
+    )
+    exclude_flags = getattr(settings, 'ROUND_RANKING_EXCLUDE_FLAGS', ())
+    if exclude_flags and rows:
+        from .models import PEER_REVIEW_MAX_SCORE
+        from .review_analysis import analyze_reviews, flagged_reviewer_ids
+        reviewer_ids, chart_ids, scores, _ = zip(*rows)
+        report = analyze_reviews(
+            reviewer_ids, chart_ids, scores, getattr(settings, 'PEER_REVIEW_MAX_SCORE', PEER_REVIEW_MAX_SCORE)
+        )
+        excluded = flagged_reviewer_ids(report, exclude_flags)
+        rows = [row for row in rows if row[0] not in excluded]
+    columns = list(zip(*rows)) if rows else ([], [], [], [])
+    scored = score_reviews(*columns)
+
+    charts = {
+        chart.id: chart
+        for chart in Chart.objects.filter(
+            bidding_round=bidding_round, status='reviewed'
+        ).select_related('user', 'song').only('id', 'user__username', 'song__title')
+    }
+
+    snapshots = {}
+    with transaction.atomic():
+        for method in RANKING_METHODS:
+            entries = []
+            for i in rank_order(scored, method):
+                chart = charts.get(scored['chart_ids'][i])
+                if chart is None:
+                    continue
+                entries.append({
+                    'rank': len(entries) + 1,
+                    'chart_id': chart.id,
+                    'username': chart.user.username,
+                    'song_title': chart.song.title,
+                    'score': scored[method][i],
+                    'average_score': scored['mean'][i],
+                    'review_count': scored['review_count'][i],
+                    'total_score': scored['total_score'][i],
+                    'favorite_count': scored['favorites'][i],
+                })
+            snapshots[method], _ = RoundRanking.objects.update_or_create(
+                bidding_round=bidding_round,
+                method=method,
+                defaults={'entries': entries, 'review_count': len(rows)}
+            )
+    cache.delete_many([_cache_key(bidding_round.id, method) for method in RANKING_METHODS])
+    return snapshots
+
+
+def get_ranking(bidding_round, method):
+    """
+    读取排名：缓存 → RoundRanking 快照 → 尚无快照时现场生成
+
+    Returns:
+        dict: {'method', 'computed_at', 'review_count', 'entries'}
+    """
+    from .models import RoundRanking
+
+    if method not in RANKING_METHODS:
+        raise ValueError(f'未知的计分方式: {method}')
+    key = _cache_key(bidding_round.id, method)
+    payload = cache.get(key)
+    if payload is not None:
+        return payload
+
+    snapshot = RoundRanking.objects.filter(bidding_round=bidding_round, method=method).first()
+    if snapshot is None:
+        snapshot = compute_round_rankings(bidding_round)[method]
+    payload = {
+        'method': method,
+        'computed_at': snapshot.computed_at.isoformat(),
+        'review_count': snapshot.review_count,
+        'entries': snapshot.entries,
+    }
+    cache.set(key, payload, getattr(settings, 'ROUND_RANKING_CACHE_TIMEOUT', 600))
+    return payload
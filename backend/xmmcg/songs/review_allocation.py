@@ -0,0 +1,417 @@
+"""
+互评任务分配核心算法（不依赖 ORM）
+
+输入：
+- chart_ids：谱面ID列表（顺序即平局时的优先顺序）
+- reviewer_ids：评分者ID列表（顺序即平局时的优先顺序）
+- contributors：{chart_id: 参与该谱面创作的用户ID集合}，贡献者不能评自己参与的谱面
+- min_reviews：每张谱面的目标评分数
+
+所有函数只返回 (reviewer_id, chart_id) 分配对及统计信息，调用方负责写库，
+因此可以脱离 Django 单独测试和基准测试。
+"""
+
+import heapq
+
+
+def natural_capacity(chart_ids, reviewer_ids, contributors):
+    """每人的自然上限：可以评的谱面数 = 总谱面数 - 自己参与的谱面数"""
+    authored = {}
+    for chart_id in chart_ids:
+        for user_id in contributors.get(chart_id, ()):
+            authored[user_id] = authored.get(user_id, 0) + 1
+    return {reviewer_id: len(chart_ids) - authored.get(reviewer_id, 0) for reviewer_id in reviewer_ids}
+
+
+def greedy_assign(chart_ids, reviewer_ids, contributors, min_reviews, capacity=None, existing=()):
+    """
+    贪心分配：最受限优先，负担最轻的评分者优先
+
+    每一步选"合法评分者最少"的谱面（平局时选评分数最少的，再平局按 chart_ids 顺序），
+    为它选"当前任务最少"的合法评分者（平局按 reviewer_ids 顺序），
+    直到所有谱面达到 min_reviews 或无法再分配。
+
+    合法评分者 = 未达到上限、不是该谱面贡献者、尚未分配到该谱面的评分者。
+    合法评分者数 = 未满评分者总数 - 该谱面"受阻"的未满评分者数（贡献者或已分配者），
+    评分者达到上限时所有谱面的合法数同时减 1，相对顺序只在他受阻的谱面上改变，
+    因此谱面堆以受阻数为键（受阻越多越受限），只需增量更新少量谱面：
+    - 谱面堆：键为 (-受阻数, 当前评分数, 顺序)，过期条目惰性丢弃
+    - 评分者堆：键为 (当前任务数, 顺序)，为谱面选人时跳过贡献者和已分配的评分者（至多 min_reviews + 贡献者数 个）
+    - 某评分者达到上限时，只更新他参与创作或已分配的谱面
+    总复杂度约为 O(分配数 × log n)。
+
+    Args:
+        capacity: {reviewer_id: 最大任务数}，缺省为 natural_capacity
+        existing: 已有的 (reviewer_id, chart_id) 分配（增量分配时保留的任务），
+            计入评分数和任务数，只在此基础上补足差额
+
+    Returns:
+        dict: {
+            'pairs': [(reviewer_id, chart_id)]（本次新增，按分配顺序）,
+            'chart_counts': {chart_id: 评分数（含已有分配）},
+            'reviewer_loads': {reviewer_id: 任务数（含已有分配）},
+            'stuck': [已无合法评分者、未达到目标的 chart_id]（按发现顺序）,
+        }
+    """
+    if capacity is None:
+        capacity = natural_capacity(chart_ids, reviewer_ids, contributors)
+
+    chart_counts = {chart_id: 0 for chart_id in chart_ids}
+    loads = {reviewer_id: 0 for reviewer_id in reviewer_ids}
+    assigned = {chart_id: set() for chart_id in chart_ids}
+    reviewer_charts = {reviewer_id: [] for reviewer_id in reviewer_ids}
+    reviewer_order = {reviewer_id: index for index, reviewer_id in enumerate(reviewer_ids)}
+    chart_order = {chart_id: index for index, chart_id in enumerate(chart_ids)}
+    for reviewer_id, chart_id in existing:
+        assigned[chart_id].add(reviewer_id)
+        reviewer_charts[reviewer_id].append(chart_id)
+        chart_counts[chart_id] += 1
+        loads[reviewer_id] += 1
+    open_reviewers = {reviewer_id for reviewer_id in reviewer_ids if loads[reviewer_id] < capacity[reviewer_id]}
+
+    # 每张谱面受阻的未满评分者数；评分者参与创作的谱面
+    blocked = {}
+    authored = {}
+    for chart_id in chart_ids:
+        excluded = open_reviewers.intersection(contributors.get(chart_id, ()))
+        blocked[chart_id] = len(excluded) + len(open_reviewers.intersection(assigned[chart_id]))
+        for reviewer_id in excluded:
+            authored.setdefault(reviewer_id, []).append(chart_id)
+
+    chart_heap = [
+        (-blocked[chart_id], chart_counts[chart_id], chart_order[chart_id], chart_id)
+        for chart_id in chart_ids
+        if chart_counts[chart_id] < min_reviews
+    ]
+    heapq.heapify(chart_heap)
+    reviewer_heap = [(loads[reviewer_id], reviewer_order[reviewer_id], reviewer_id) for reviewer_id in open_reviewers]
+    heapq.heapify(reviewer_heap)
+
+    stuck = []
+    stuck_set = set()
+
+    def push_chart(chart_id):
+        # 合法评分者数只减不增，卡住的谱面不再入堆
+        if chart_counts[chart_id] < min_reviews and chart_id not in stuck_set:
+            heapq.heappush(chart_heap, (-blocked[chart_id], chart_counts[chart_id], chart_order[chart_id], chart_id))
+
+    pairs = []
+    while chart_heap:
+        neg_blocked, count, _, chart_id = heapq.heappop(chart_heap)
+        if -neg_blocked != blocked[chart_id] or count != chart_counts[chart_id]:
+            continue  # 过期条目
+        if chart_id in stuck_set:
+            continue
+        if blocked[chart_id] == len(open_reviewers):
+            stuck.append(chart_id)
+            stuck_set.add(chart_id)
+            continue
+
+        # 选当前任务最少的合法评分者；跳过的条目稍后放回
+        excluded = contributors.get(chart_id, set())
+        skipped = []
+        reviewer_id = None
+        while reviewer_heap:
+            entry = heapq.heappop(reviewer_heap)
+            load, _, candidate = entry
+            if load != loads[candidate] or candidate not in open_reviewers:
+                continue  # 过期条目
+            if candidate in excluded or candidate in assigned[chart_id]:
+                skipped.append(entry)
+                continue
+            reviewer_id = candidate
+            break
+        for entry in skipped:
+            heapq.heappush(reviewer_heap, entry)
+
+        pairs.append((reviewer_id, chart_id))
+        assigned[chart_id].add(reviewer_id)
+        reviewer_charts[reviewer_id].append(chart_id)
+        chart_counts[chart_id] += 1
+        loads[reviewer_id] += 1
+        blocked[chart_id] += 1
+
+        if loads[reviewer_id] < capacity[reviewer_id]:
+            heapq.heappush(reviewer_heap, (loads[reviewer_id], reviewer_order[reviewer_id], reviewer_id))
+            push_chart(chart_id)
+        else:
+            # 评分者达到上限：其余谱面的合法数统一减 1，只有他受阻的谱面的受阻数需要减 1
+            open_reviewers.discard(reviewer_id)
+            for other_id in reviewer_charts[reviewer_id] + authored.get(reviewer_id, []):
+                blocked[other_id] -= 1
+                if other_id != chart_id:
+                    push_chart(other_id)
+            push_chart(chart_id)
+
+    return {
+        'pairs': pairs,
+        'chart_counts': chart_counts,
+        'reviewer_loads': loads,
+        'stuck': stuck,
+    }
+
+INF = float('inf')
+
+
+class _ReviewFlow:
+    """
+    评分者-谱面二分图上的最大流（Dinic）
+
+    网络：源点 → 评分者（容量 = 上限）→ 谱面（容量 1，贡献者之间无边）→ 汇点（容量 = 需求数）。
+    评分者与谱面之间几乎是完全二分图，边数为 谱面数 × 评分者数，因此不显式建边：
+    评分者 → 谱面 的剩余边 = 除贡献者和已分配者以外的所有组合（补图），
+    谱面 → 评分者 的反向边 = 已分配给该谱面的评分者。
+    BFS 在补图上使用"未访问集合"技巧，每个分层阶段的代价为 O(评分者数 + 谱面数 + 已分配数)。
+    """
+
+    def __init__(self, num_charts, num_reviewers, excluded_by_chart, capacity, demand):
+        self.num_charts = num_charts
+        self.num_reviewers = num_reviewers
+        self.excluded_by_chart = excluded_by_chart      # chart -> set(reviewer)
+        self.capacity = capacity                        # reviewer -> 上限
+        self.demand = demand                            # chart -> 需求数
+        self.chart_reviewers = [set() for _ in range(num_charts)]
+        self.reviewer_charts = [set() for _ in range(num_reviewers)]
+
+    def assign(self, reviewer, chart):
+        self.chart_reviewers[chart].add(reviewer)
+        self.reviewer_charts[reviewer].add(chart)
+
+    def unassign(self, reviewer, chart):
+        self.chart_reviewers[chart].discard(reviewer)
+        self.reviewer_charts[reviewer].discard(chart)
+
+    def can_assign(self, reviewer, chart):
+        return reviewer not in self.excluded_by_chart[chart] and reviewer not in self.chart_reviewers[chart]
+
+    def deficit(self, chart):
+        return self.demand[chart] - len(self.chart_reviewers[chart])
+
+    def spare(self, reviewer):
+        return self.capacity[reviewer] - len(self.reviewer_charts[reviewer])
+
+    def _levels(self):
+        """
+        从汇点反向 BFS，计算各节点到汇点的距离（谱面为奇数层，评分者为偶数层）
+
+        Returns:
+            (chart_dist, reviewer_dist, source_dist)；source_dist 为 INF 表示不存在增广路
+        """
+        chart_dist = [INF] * self.num_charts
+        reviewer_dist = [INF] * self.num_reviewers
+        frontier = [c for c in range(self.num_charts) if self.deficit(c) > 0]
+        for c in frontier:
+            chart_dist[c] = 1
+        unvisited_reviewers = list(range(self.num_reviewers))
+        dist = 1
+        while frontier:
+            # 谱面层 → 评分者层：评分者可以新分配到该谱面（补图上的边）
+            reviewers = []
+            for c in frontier:
+                if not unvisited_reviewers:
+                    break
+                blocked = self.excluded_by_chart[c] | self.chart_reviewers[c]
+                remaining = []
+                for r in unvisited_reviewers:
+                    if r in blocked:
+                        remaining.append(r)
+                    else:
+                        reviewer_dist[r] = dist + 1
+                        reviewers.append(r)
+                unvisited_reviewers = remaining
+            if not reviewers:
+                break
+            if any(self.spare(r) > 0 for r in reviewers):
+                return chart_dist, reviewer_dist, dist + 2
+            # 评分者层 → 谱面层：评分者放弃已分配的谱面（反向边）
+            frontier = []
+            for r in reviewers:
+                for c in self.reviewer_charts[r]:
+                    if chart_dist[c] == INF:
+                        chart_dist[c] = dist + 2
+                        frontier.append(c)
+            dist += 2
+        return chart_dist, reviewer_dist, INF
+
+    def _augment_phase(self, chart_dist, reviewer_dist, source_dist):
+        """沿距离严格递减的边寻找增广路（阻塞流），返回本阶段增广次数"""
+        charts_by_dist = {}
+        for c, d in enumerate(chart_dist):
+            if d != INF:
+                charts_by_dist.setdefault(d, []).append(c)
+        reviewer_ptr = [0] * self.num_reviewers
+        chart_candidates = {}
+        chart_ptr = {}
+        augmented = 0
+
+        sources = [r for r in range(self.num_reviewers)
+                   if reviewer_dist[r] == source_dist - 1 and self.spare(r) > 0]
+        for start in sources:
+            while self.spare(start) > 0 and reviewer_dist[start] != INF:
+                # path 交替为 评分者, 谱面, 评分者, 谱面, ...
+                path = [start]
+                while path:
+                    node = path[-1]
+                    if len(path) % 2 == 1:
+                        # 评分者：找距离少 1、可新分配的谱面
+                        d = reviewer_dist[node] - 1
+                        level = charts_by_dist.get(d, ())
+                        nxt = None
+                        while reviewer_ptr[node] < len(level):
+                            c = level[reviewer_ptr[node]]
+                            if chart_dist[c] == d and self.can_assign(node, c):
+                                nxt = c
+                                break
+                            reviewer_ptr[node] += 1
+                        if nxt is None:
+                            reviewer_dist[node] = INF
+                            path.pop()
+                            if path:
+                                chart_ptr[path[-1]] += 1
+                            continue
+                        path.append(nxt)
+                    else:
+                        d = chart_dist[node]
+                        if d == 1:
+                            if self.deficit(node) > 0:
+                                break
+                            chart_dist[node] = INF
+                            path.pop()
+                            reviewer_ptr[path[-1]] += 1
+                            continue
+                        # 谱面：找距离少 1、当前分配在该谱面上的评分者（反向边）
+                        if node not in chart_ptr:
+                            chart_candidates[node] = [r for r in self.chart_reviewers[node]
+                                                      if reviewer_dist[r] == d - 1]
+                            chart_ptr[node] = 0
+                        candidates = chart_candidates[node]
+                        nxt = None
+                        while chart_ptr[node] < len(candidates):
+                            r = candidates[chart_ptr[node]]
+                            if reviewer_dist[r] == d - 1 and r in self.chart_reviewers[node]:
+                                nxt = r
+                                break
+                            chart_ptr[node] += 1
+                        if nxt is None:
+                            chart_dist[node] = INF
+                            path.pop()
+                            reviewer_ptr[path[-1]] += 1
+                            continue
+                        path.append(nxt)
+                if not path:
+                    break
+                # 沿路径增广：评分者→谱面 为新分配，谱面→评分者 为撤销分配
+                for i in range(0, len(path) - 1, 2):
+                    self.assign(path[i], path[i + 1])
+                    if i + 2 < len(path):
+                        self.unassign(path[i + 2], path[i + 1])
+                augmented += 1
+        return augmented
+
+    def max_flow(self):
+        """在当前分配的基础上增广到最大流，返回总分配数"""
+        while True:
+            chart_dist, reviewer_dist, source_dist = self._levels()
+            if source_dist == INF:
+                break
+            if not self._augment_phase(chart_dist, reviewer_dist, source_dist):
+                break
+        return sum(len(reviewers) for reviewers in self.chart_reviewers)
+
+
+def _flow_with_max_load(chart_ids, reviewer_ids, contributors, min_reviews, capacity, max_load, existing=()):
+    """
+    每人任务数（含已有分配）不超过 max_load 时的最大新增分配（以贪心结果为初始流）
+
+    已有分配固定不动：视同贡献者排除在该谱面之外，并从评分者上限和谱面需求中扣除，
+    流网络里只包含新增的分配。
+    """
+    limited = {r: min(capacity[r], max_load) for r in reviewer_ids}
+    chart_index = {chart_id: i for i, chart_id in enumerate(chart_ids)}
+    reviewer_index = {reviewer_id: i for i, reviewer_id in enumerate(reviewer_ids)}
+    excluded_by_chart = [
+        {reviewer_index[u] for u in contributors.get(chart_id, ()) if u in reviewer_index}
+        for chart_id in chart_ids
+    ]
+    existing_loads = [0] * len(reviewer_ids)
+    existing_counts = [0] * len(chart_ids)
+    for reviewer_id, chart_id in existing:
+        excluded_by_chart[chart_index[chart_id]].add(reviewer_index[reviewer_id])
+        existing_loads[reviewer_index[reviewer_id]] += 1
+        existing_counts[chart_index[chart_id]] += 1
+    flow = _ReviewFlow(
+        len(chart_ids),
+        len(reviewer_ids),
+        excluded_by_chart,
+        [max(0, limited[r] - existing_loads[i]) for i, r in enumerate(reviewer_ids)],
+        [max(0, min_reviews - count) for count in existing_counts],
+    )
+    greedy = greedy_assign(chart_ids, reviewer_ids, contributors, min_reviews, capacity=limited, existing=existing)
+    for reviewer_id, chart_id in greedy['pairs']:
+        flow.assign(reviewer_index[reviewer_id], chart_index[chart_id])
+    total = flow.max_flow()
+    return flow, total
+
+
+def flow_assign(chart_ids, reviewer_ids, contributors, min_reviews, capacity=None, existing=()):
+    """
+    最大流分配：在分配总数最大的前提下，使评分者的最大任务数最小
+
+    1. 以每人自然上限求最大流，得到可达到的最大分配总数 F
+       （F = 谱面数 × min_reviews 时每张谱面都能达到目标，否则贪心卡住的谱面也是真正无解的）
+    2. 对每人任务上限 L 二分查找：最小的 L 使得最大流仍为 F
+    结果对这两个目标都是最优的（由最大流最小割定理保证）。
+
+    每次求最大流都以 greedy_assign 的结果为初始流，Dinic 只需补足少量增广路。
+    传入 existing 时已有分配固定不动，F 和 L 都针对新增部分（L 按含已有分配的总任务数计）。
+
+    Returns:
+        dict: 与 greedy_assign 相同，另含 'max_load'（最小的最大任务数）
+    """
+    if capacity is None:
+        capacity = natural_capacity(chart_ids, reviewer_ids, contributors)
+
+    existing = list(existing)
+    existing_loads = [0] * len(reviewer_ids)
+    existing_counts = {chart_id: 0 for chart_id in chart_ids}
+    reviewer_index = {reviewer_id: i for i, reviewer_id in enumerate(reviewer_ids)}
+    for reviewer_id, chart_id in existing:
+        existing_loads[reviewer_index[reviewer_id]] += 1
+        existing_counts[chart_id] += 1
+
+    flow, target = _flow_with_max_load(
+        chart_ids, reviewer_ids, contributors, min_reviews, capacity, max(capacity.values(), default=0), existing
+    )
+
+    # 上界：这个最大流本身的最大任务数；
+    # 下界：已有的最大任务数，以及全部分配平均到有余量的评分者
+    high = max((len(charts) + existing_loads[r] for r, charts in enumerate(flow.reviewer_charts)), default=0)
+    open_reviewers = sum(1 for c in capacity.values() if c > 0)
+    low = -(-(target + len(existing)) // open_reviewers) if open_reviewers else 0
+    low = min(max(low, max(existing_loads, default=0)), high)
+    while low < high:
+        mid = (low + high) // 2
+        candidate, total = _flow_with_max_load(
+            chart_ids, reviewer_ids, contributors, min_reviews, capacity, mid, existing
+        )
+        if total == target:
+            flow, high = candidate, mid
+        else:
+            low = mid + 1
+
+    pairs = [
+        (reviewer_ids[r], chart_ids[c])
+        for c in range(len(chart_ids))
+        for r in sorted(flow.chart_reviewers[c])
+    ]
+    chart_counts = {
+        chart_id: existing_counts[chart_id] + len(flow.chart_reviewers[c]) for c, chart_id in enumerate(chart_ids)
+    }
+    loads = {reviewer_id: existing_loads[r] + len(flow.reviewer_charts[r]) for r, reviewer_id in enumerate(reviewer_ids)}
+    return {
+        'pairs': pairs,
+        'chart_counts': chart_counts,
+        'reviewer_loads': loads,
+        'stuck': [chart_id for chart_id in chart_ids if chart_counts[chart_id] < min_reviews],
+        'max_load': high,
+    }
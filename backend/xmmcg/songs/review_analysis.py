@@ -0,0 +1,233 @@
+"""
+评分者偏差/异常分析
+
+analyze_reviews 不依赖 ORM，输入为等长序列 (reviewer_ids, chart_ids, scores)，第 i 个元素描述一条评分，
+一次计算每个评分者的：
+- 评分数、平均分、方差、标准差
+- 极端分比例：打 0 分或满分的评分占比
+- 共识相关系数：评分者的分数与"该谱面其他人的平均分"（留一法共识）的 Pearson 相关系数
+- 偏差：评分者的分数比共识平均高/低多少
+并据此标记异常评分者（评分数不少于 MIN_REVIEWS_FOR_FLAGS 时才标记）：
+- constant：所有谱面打同一个分数
+- extreme：极端分比例不低于 EXTREME_RATIO
+- contrarian：与共识的相关系数低于 CONTRARIAN_CORRELATION
+- biased：偏差的绝对值超过满分的 BIAS_RATIO
+
+安装了 NumPy 时使用 np.bincount 向量化计算，否则使用纯 Python。
+get_round_analysis 读取整轮评分并按"评分数 + 最大评分ID"缓存结果，评分没有变化时直接返回缓存；
+排名计算可以通过 ROUND_RANKING_EXCLUDE_FLAGS 排除被标记的评分者（见 ranking.compute_round_rankings）。
+"""
+
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖
+    np = None
+
+
+REVIEWER_FLAGS = ('constant', 'extreme', 'contrarian', 'biased')
+
+FLAG_LABELS = {
+    'constant': '全打同分',
+    'extreme': '极端分',
+    'contrarian': '与共识相反',
+    'biased': '明显偏高/偏低',
+}
+
+# 评分数少于该值的评分者不做标记（样本太少）
+MIN_REVIEWS_FOR_FLAGS = 3
+
+# 极端分（0 分或满分）比例阈值
+EXTREME_RATIO = 0.8
+
+# 与共识的相关系数阈值
+CONTRARIAN_CORRELATION = -0.2
+
+# 偏差阈值（占满分的比例）
+BIAS_RATIO = 0.3
+
+
+def analyze_reviews(reviewer_ids, chart_ids, scores, max_score):
+    """
+    计算每个评分者的统计量和异常标记
+
+    Returns:
+        list[dict]: 每个评分者一项（按 reviewer_id 升序）：
+            reviewer_id, review_count, mean, variance, std, extreme_ratio,
+            correlation（无法计算时为 None）, bias（无法计算时为 None）, flags
+    """
+    if len(scores) == 0:
+        return []
+    if np is not None:
+        columns = _analyze_numpy(reviewer_ids, chart_ids, scores, max_score)
+    else:
+        columns = _analyze_python(reviewer_ids, chart_ids, scores, max_score)
+
+    report = []
+    for reviewer_id, n, mean, variance, extreme_ratio, correlation, bias in zip(*columns):
+        flags = []
+        if n >= MIN_REVIEWS_FOR_FLAGS:
+            if variance < 1e-9:
+                flags.append('constant')
+            if extreme_ratio >= EXTREME_RATIO:
+                flags.append('extreme')
+            if correlation is not None and correlation < CONTRARIAN_CORRELATION:
+                flags.append('contrarian')
+            if bias is not None and abs(bias) > BIAS_RATIO * max_score:
+                flags.append('biased')
+        report.append({
+            'reviewer_id': reviewer_id,
+            'review_count': n,
+            'mean': round(mean, 4),
+            'variance': round(variance, 4),
+            'std': round(math.sqrt(variance), 4),
+            'extreme_ratio': round(extreme_ratio, 4),
+            'correlation': None if correlation is None else round(correlation, 4),
+            'bias': None if bias is None else round(bias, 4),
+            'flags': flags,
+        })
+    return report
+
+
+def _analyze_numpy(reviewer_ids, chart_ids, scores, max_score):
+    reviewers, reviewer_idx = np.unique(np.asarray(reviewer_ids, dtype=np.int64), return_inverse=True)
+    _, chart_idx = np.unique(np.asarray(chart_ids, dtype=np.int64), return_inverse=True)
+    x = np.asarray(scores, dtype=np.float64)
+
+    n = np.bincount(reviewer_idx)
+    mean = np.bincount(reviewer_idx, x) / n
+    deviation = x - mean[reviewer_idx]
+    variance = np.bincount(reviewer_idx, deviation * deviation) / n
+    extreme_ratio = np.bincount(reviewer_idx, ((x <= 0) | (x >= max_score)).astype(np.float64)) / n
+
+    # 留一法共识：该谱面其他评分的平均分（只有一条评分的谱面没有共识）
+    chart_n = np.bincount(chart_idx)
+    chart_sum = np.bincount(chart_idx, x)
+    others = chart_n[chart_idx] - 1
+    valid = others > 0
+    y = np.divide(chart_sum[chart_idx] - x, others, out=np.zeros_like(x), where=valid)
+    w = valid.astype(np.float64)
+
+    vn = np.bincount(reviewer_idx, w, minlength=len(reviewers))
+    sx = np.bincount(reviewer_idx, x * w, minlength=len(reviewers))
+    sy = np.bincount(reviewer_idx, y * w, minlength=len(reviewers))
+    sxx = np.bincount(reviewer_idx, x * x * w, minlength=len(reviewers))
+    syy = np.bincount(reviewer_idx, y * y * w, minlength=len(reviewers))
+    sxy = np.bincount(reviewer_idx, x * y * w, minlength=len(reviewers))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bias = np.where(vn > 0, (sx - sy) / vn, np.nan)
+        denominator = np.sqrt(np.maximum(vn * sxx - sx * sx, 0) * np.maximum(vn * syy - sy * sy, 0))
+        correlation = np.where((vn >= 2) & (denominator > 1e-9), (vn * sxy - sx * sy) / denominator, np.nan)
+
+    def optional(values):
+        return [None if math.isnan(v) else v for v in values.tolist()]
+
+    return (
+        reviewers.tolist(), n.tolist(), mean.tolist(), variance.tolist(), extreme_ratio.tolist(),
+        optional(correlation), optional(bias),
+    )
+
+
+def _analyze_python(reviewer_ids, chart_ids, scores, max_score):
+    chart_totals = {}
+    for chart_id, score in zip(chart_ids, scores):
+        count, total = chart_totals.get(chart_id, (0, 0))
+        chart_totals[chart_id] = (count + 1, total + score)
+
+    by_reviewer = {}
+    for reviewer_id, chart_id, score in zip(reviewer_ids, chart_ids, scores):
+        count, total = chart_totals[chart_id]
+        consensus = (total - score) / (count - 1) if count > 1 else None
+        by_reviewer.setdefault(reviewer_id, []).append((score, consensus))
+
+    columns = ([], [], [], [], [], [], [])
+    for reviewer_id in sorted(by_reviewer):
+        entries = by_reviewer[reviewer_id]
+        n = len(entries)
+        mean = sum(score for score, _ in entries) / n
+        variance = sum((score - mean) ** 2 for score, _ in entries) / n
+        extreme_ratio = sum(1 for score, _ in entries if score <= 0 or score >= max_score) / n
+
+        pairs = [(score, consensus) for score, consensus in entries if consensus is not None]
+        bias = correlation = None
+        if pairs:
+            vn = len(pairs)
+            sx = sum(p[0] for p in pairs)
+            sy = sum(p[1] for p in pairs)
+            bias = (sx - sy) / vn
+            denominator = math.sqrt(
+                max(vn * sum(p[0] * p[0] for p in pairs) - sx * sx, 0)
+                * max(vn * sum(p[1] * p[1] for p in pairs) - sy * sy, 0)
+            )
+            if vn >= 2 and denominator > 1e-9:
+                correlation = (vn * sum(p[0] * p[1] for p in pairs) - sx * sy) / denominator
+
+        for column, value in zip(columns, (reviewer_id, n, mean, variance, extreme_ratio, correlation, bias)):
+            column.append(value)
+    return columns
+
+
+def flagged_reviewer_ids(report, flags):
+    """带有 flags 中任一标记的评分者ID集合"""
+    flags = set(flags)
+    return {row['reviewer_id'] for row in report if flags.intersection(row['flags'])}
+
+
+# ==================== 整轮分析与缓存 ====================
+
+def _round_reviews(bidding_round):
+    from .models import PeerReview
+    from .review_stats import counted_reviews_filter
+
+    return PeerReview.objects.filter(counted_reviews_filter(), chart__bidding_round=bidding_round)
+
+
+def get_round_analysis(bidding_round, refresh=False):
+    """
+    某轮全部评分者的分析报告（带缓存）
+
+    缓存键包含该轮的评分数、最大评分ID和最后修改时间，新增评分或修改额外评分后自动失效；refresh=True 时强制重算。
+
+    Returns:
+        dict: {
+            'round_id', 'review_count', 'reviewer_count',
+            'flag_counts': {flag: 人数},
+            'reviewers': analyze_reviews 的结果（附 username，异常者在前、按偏差绝对值降序）,
+        }
+    """
+    from .models import PEER_REVIEW_MAX_SCORE
+
+    reviews = _round_reviews(bidding_round)
+    version = reviews.aggregate(count=Count('id'), last=Max('id'), updated=Max('updated_at'))
+    updated = version['updated'].timestamp() if version['updated'] else 0
+    key = f'review_analysis:{bidding_round.id}:{version["count"]}:{version["last"]}:{updated}'
+    if not refresh:
+        payload = cache.get(key)
+        if payload is not None:
+            return payload
+
+    rows = list(reviews.values_list('reviewer_id', 'chart_id', 'score'))
+    columns = list(zip(*rows)) if rows else ([], [], [])
+    max_score = getattr(settings, 'PEER_REVIEW_MAX_SCORE', PEER_REVIEW_MAX_SCORE)
+    report = analyze_reviews(*columns, max_score)
+
+    usernames = dict(reviews.order_by().values_list('reviewer_id', 'reviewer__username').distinct())
+    for row in report:
+        row['username'] = usernames.get(row['reviewer_id'], '')
+    report.sort(key=lambda row: (not row['flags'], -abs(row['bias'] or 0), row['reviewer_id']))
+
+    payload = {
+        'round_id': bidding_round.id,
+        'review_count': len(rows),
+        'reviewer_count': len(report),
+        'flag_counts': {flag: sum(1 for row in report if flag in row['flags']) for flag in REVIEWER_FLAGS},
+        'reviewers': report,
+    }
+    cache.set(key, payload, getattr(settings, 'REVIEW_ANALYSIS_CACHE_TIMEOUT', 3600))
+    return payload
@@ -0,0 +1,135 @@
+"""
+互评进度看板
+
+不逐行读取 PeerReviewAllocation（也不调用其 __str__ 关联 chart.user / chart.song），而是：
+- 一条 GROUP BY reviewer 查询：每个评分者的任务数、已完成数、超期数
+- 一条 GROUP BY chart 查询：每张谱面被分配的评分数、已收到的评分数
+- 一条带 LIMIT 的查询：最早的超期任务明细
+结果按轮次缓存 REVIEW_PROGRESS_CACHE_TIMEOUT 秒（默认 30，互评期间刷新页面不会反复聚合）。
+
+超期：分配后超过 PEER_REVIEW_TASK_DEADLINE_HOURS 小时仍未完成的任务。
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+
+# 返回的超期任务明细的最大条数（按分配时间最早排列）
+OVERDUE_TASK_LIMIT = 200
+
+
+def _cache_key(round_id):
+    return f'review_progress:{round_id}'
+
+
+def _rate(done, total):
+    return round(done / total, 4) if total else 0.0
+
+
+def get_round_progress(bidding_round, refresh=False):
+    """
+    某轮互评的进度（带缓存，refresh=True 时强制重算）
+
+    Returns:
+        dict: {
+            'round_id', 'computed_at', 'deadline_hours',
+            'summary': {'tasks', 'completed', 'pending', 'overdue', 'completion_rate',
+                        'reviewers', 'reviewers_done', 'charts', 'charts_done'},
+            'reviewers': [{'reviewer_id', 'username', 'tasks', 'completed', 'overdue', 'completion_rate'}]
+                         （完成率升序，进度最慢的在前）,
+            'charts': [{'chart_id', 'username', 'song_title', 'assigned', 'received', 'completion_rate'}]
+                      （收到的评分数升序）,
+            'overdue_tasks': [{'allocation_id', 'reviewer_id', 'username', 'chart_id', 'song_title', 'allocated_at'}]
+                             （最早的 OVERDUE_TASK_LIMIT 条）,
+        }
+    """
+    from .models import Chart, PeerReviewAllocation
+
+    key = _cache_key(bidding_round.id)
+    if not refresh:
+        payload = cache.get(key)
+        if payload is not None:
+            return payload
+
+    deadline_hours = getattr(settings, 'PEER_REVIEW_TASK_DEADLINE_HOURS', 72)
+    now = timezone.now()
+    overdue_filter = Q(status='pending', allocated_at__lt=now - timedelta(hours=deadline_hours))
+    allocations = PeerReviewAllocation.objects.filter(bidding_round=bidding_round)
+
+    reviewers = [
+        {
+            'reviewer_id': row['reviewer_id'],
+            'username': row['reviewer__username'],
+            'tasks': row['tasks'],
+            'completed': row['completed'],
+            'overdue': row['overdue'],
+            'completion_rate': _rate(row['completed'], row['tasks']),
+        }
+        for row in allocations.values('reviewer_id', 'reviewer__username').annotate(
+            tasks=Count('id'),
+            completed=Count('id', filter=Q(status='completed')),
+            overdue=Count('id', filter=overdue_filter),
+        ).order_by()
+    ]
+    reviewers.sort(key=lambda row: (row['completion_rate'], -row['overdue'], row['reviewer_id']))
+
+    # 从 Chart 出发聚合，没有分配到评分者的谱面也会出现（assigned = 0）
+    charts = [
+        {
+            'chart_id': row['id'],
+            'username': row['user__username'],
+            'song_title': row['song__title'],
+            'assigned': row['assigned'],
+            'received': row['received'],
+            'completion_rate': _rate(row['received'], row['assigned']),
+        }
+        for row in Chart.objects.filter(bidding_round=bidding_round).values(
+            'id', 'user__username', 'song__title'
+        ).annotate(
+            assigned=Count('review_allocations'),
+            received=Count('review_allocations', filter=Q(review_allocations__status='completed')),
+        ).order_by()
+    ]
+    charts.sort(key=lambda row: (row['received'], row['completion_rate'], row['chart_id']))
+
+    overdue_tasks = [
+        {
+            'allocation_id': row['id'],
+            'reviewer_id': row['reviewer_id'],
+            'username': row['reviewer__username'],
+            'chart_id': row['chart_id'],
+            'song_title': row['chart__song__title'],
+            'allocated_at': row['allocated_at'].isoformat(),
+        }
+        for row in allocations.filter(overdue_filter).order_by('allocated_at', 'id').values(
+            'id', 'reviewer_id', 'reviewer__username', 'chart_id', 'chart__song__title', 'allocated_at'
+        )[:OVERDUE_TASK_LIMIT]
+    ]
+
+    tasks = sum(row['tasks'] for row in reviewers)
+    completed = sum(row['completed'] for row in reviewers)
+    payload = {
+        'round_id': bidding_round.id,
+        'computed_at': now.isoformat(),
+        'deadline_hours': deadline_hours,
+        'summary': {
+            'tasks': tasks,
+            'completed': completed,
+            'pending': tasks - completed,
+            'overdue': sum(row['overdue'] for row in reviewers),
+            'completion_rate': _rate(completed, tasks),
+            'reviewers': len(reviewers),
+            'reviewers_done': sum(1 for row in reviewers if row['completed'] == row['tasks']),
+            'charts': len(charts),
+            'charts_done': sum(1 for row in charts if row['assigned'] and row['received'] == row['assigned']),
+        },
+        'reviewers': reviewers,
+        'charts': charts,
+        'overdue_tasks': overdue_tasks,
+    }
+    cache.set(key, payload, getattr(settings, 'REVIEW_PROGRESS_CACHE_TIMEOUT', 30))
+    return payload
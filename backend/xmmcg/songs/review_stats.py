@@ -0,0 +1,184 @@
+"""
+谱面评分统计（Chart.review_count / total_score / average_score 冗余字段）的维护
+
+- 增量：apply_review_deltas 用一条 UPDATE 以 F() 表达式累加评分数和总分，
+  并在同一条语句中由新值推导平均分，并发评分同一谱面时不会丢失更新
+- 全量：recompute_round_stats 用一条 GROUP BY 查询重算整轮的统计，
+  供 recompute_review_stats 命令修复历史数据或手工改动后的不一致
+- 真爱票（Chart.favorite_count）同样在 apply_review_deltas 的那条 UPDATE 中累加，
+  统计全部评分（包括额外评分，不受下述策略影响），recompute_favorite_counts 全量重算
+
+额外评分（用户自主选择、没有 allocation 的 PeerReview）按 settings.PEER_REVIEW_EXTRA_REVIEW_POLICY 处理：
+- 'exclude'（默认）：只保存评分记录，不计入统计
+- 'include'：与系统分配的评分同等计入统计（包括判断谱面是否已收到足够评分）；
+  重复提交额外评分只修改分数，不重复计数
+"""
+
+from django.conf import settings
+from django.db.models import F, Q, Case, When, Value, Count, Sum, FloatField, IntegerField
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from .models import Chart, PeerReview
+
+
+EXTRA_REVIEW_POLICIES = ('exclude', 'include')
+
+# 批量写回时每条 SQL 的最大行数
+BULK_UPDATE_BATCH_SIZE = 500
+
+
+def extra_review_policy():
+    """当前的额外评分计入策略"""
+    policy = getattr(settings, 'PEER_REVIEW_EXTRA_REVIEW_POLICY', 'exclude')
+    if policy not in EXTRA_REVIEW_POLICIES:
+        raise ValueError(f'未知的额外评分策略: {policy}')
+    return policy
+
+
+def counted_reviews_filter():
+    """计入统计的 PeerReview 过滤条件"""
+    if extra_review_policy() == 'include':
+        return Q()
+    return Q(allocation__isnull=False)
+
+
+def apply_review_deltas(deltas, favorite_deltas=None):
+    """
+    原子地累加谱面评分统计
+
+    对所有谱面只执行一条 UPDATE：review_count、total_score、favorite_count 以 F() 加上各自的增量，
+    average_score 由同一语句中的新值计算（SET 子句右侧引用的都是更新前的值）。
+
+    Args:
+        deltas: {chart_id: (评分数增量, 总分增量)}
+        favorite_deltas: 可选，{chart_id: 真爱票数增量}
+    """
+    deltas = {chart_id: delta for chart_id, delta in deltas.items() if delta != (0, 0)}
+    favorite_deltas = {chart_id: delta for chart_id, delta in (favorite_deltas or {}).items() if delta}
+    if not deltas and not favorite_deltas:
+        return
+
+    def delta_case(values):
+        return Case(
+            *[When(id=chart_id, then=Value(value)) for chart_id, value in values.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+
+    fields = {}
+    if deltas:
+        new_count = F('review_count') + delta_case({chart_id: count for chart_id, (count, _) in deltas.items()})
+        new_total = F('total_score') + delta_case({chart_id: total for chart_id, (_, total) in deltas.items()})
+        fields.update(
+            review_count=new_count,
+            total_score=new_total,
+            average_score=Coalesce(
+                Cast(new_total, FloatField()) / NullIf(Cast(new_count, FloatField()), Value(0.0)),
+                Value(0.0)
+            ),
+        )
+    if favorite_deltas:
+        fields['favorite_count'] = F('favorite_count') + delta_case(favorite_deltas)
+    Chart.objects.filter(id__in=deltas.keys() | favorite_deltas.keys()).update(**fields)
+
+
+def mark_review_completed(chart_ids):
+    """评分数达到 PEER_REVIEW_TASKS_PER_USER 的谱面标记为已评分完成（已完成的保持原完成时间）"""
+    expected_reviews = getattr(settings, 'PEER_REVIEW_TASKS_PER_USER', 8)
+    return Chart.objects.filter(
+        id__in=list(chart_ids),
+        review_count__gte=expected_reviews
+    ).exclude(status='reviewed').update(status='reviewed', review_completed_at=timezone.now())
+
+
+def record_extra_review(chart_id, score, previous_score=None, favorite_delta=0):
+    """
+    按额外评分策略更新统计（真爱票不受策略影响，总是计入）
+
+    Args:
+        previous_score: 修改已有额外评分时的原分数；新建时为 None
+        favorite_delta: 真爱票数变化（新建并勾选为 1，修改时取消/勾选为 -1/1）
+    """
+    deltas = {}
+    if extra_review_policy() == 'include':
+        deltas[chart_id] = (1, score) if previous_score is None else (0, score - previous_score)
+    apply_review_deltas(deltas, {chart_id: favorite_delta})
+    if deltas and previous_score is None:
+        mark_review_completed([chart_id])
+
+
+def recompute_round_stats(bidding_round, dry_run=False):
+    """
+    用一条 GROUP BY 查询重算某轮全部谱面的评分统计，并写回有差异的谱面
+
+    Returns:
+        dict: {'charts': 谱面数, 'changed': [{'chart_id', 'before', 'after'}]}，
+              before/after 为 (review_count, total_score, average_score)
+    """
+    aggregates = {
+        row['chart_id']: (row['review_count'], row['total_score'])
+        for row in PeerReview.objects.filter(
+            counted_reviews_filter(),
+            chart__bidding_round=bidding_round
+        ).values('chart_id').annotate(
+            review_count=Count('id'),
+            total_score=Sum('score')
+        ).order_by()
+    }
+
+    changed = []
+    to_update = []
+    num_charts = 0
+    for chart in Chart.objects.filter(bidding_round=bidding_round).only(
+        'id', 'review_count', 'total_score', 'average_score'
+    ):
+        num_charts += 1
+        review_count, total_score = aggregates.get(chart.id, (0, 0))
+        average_score = total_score / review_count if review_count else 0.0
+        before = (chart.review_count, chart.total_score, chart.average_score)
+        after = (review_count, total_score, average_score)
+        if before[:2] == after[:2] and abs(before[2] - after[2]) < 1e-9:
+            continue
+        changed.append({'chart_id': chart.id, 'before': before, 'after': after})
+        chart.review_count, chart.total_score, chart.average_score = after
+        to_update.append(chart)
+
+    if to_update and not dry_run:
+        Chart.objects.bulk_update(
+            to_update, ['review_count', 'total_score', 'average_score'], batch_size=BULK_UPDATE_BATCH_SIZE
+        )
+
+    return {'charts': num_charts, 'changed': changed}
+
+
+def recompute_favorite_counts(bidding_round, dry_run=False):
+    """
+    用一条 GROUP BY 查询重算某轮全部谱面的真爱票数（所有评分，包括额外评分），并写回有差异的谱面
+
+    Returns:
+        dict: {'charts': 谱面数, 'changed': [{'chart_id', 'before', 'after'}]}
+    """
+    counts = dict(
+        PeerReview.objects.filter(
+            chart__bidding_round=bidding_round,
+            favorite=True
+        ).values('chart_id').annotate(n=Count('id')).order_by().values_list('chart_id', 'n')
+    )
+
+    changed = []
+    to_update = []
+    num_charts = 0
+    for chart in Chart.objects.filter(bidding_round=bidding_round).only('id', 'favorite_count'):
+        num_charts += 1
+        after = counts.get(chart.id, 0)
+        if chart.favorite_count == after:
+            continue
+        changed.append({'chart_id': chart.id, 'before': chart.favorite_count, 'after': after})
+        chart.favorite_count = after
+        to_update.append(chart)
+
+    if to_update and not dry_run:
+        Chart.objects.bulk_update(to_update, ['favorite_count'], batch_size=BULK_UPDATE_BATCH_SIZE)
+
+    return {'charts': num_charts, 'changed': changed}
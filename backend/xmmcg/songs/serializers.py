@@ -67,7 +67,7 @@ class SongUploadSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         audio_file = validated_data['audio_file']
         
-        # 计算音频文件哈希
+        # 音频文件哈希（上传处理器接收时已计算，不会重新读取文件）
         audio_hash = calculate_file_hash(audio_file)
         
         song = Song.objects.create(
@@ -0,0 +1,77 @@
+"""
+上传文件处理器（settings.FILE_UPLOAD_HANDLERS）
+
+HashingFileUploadHandler 在接收 multipart 数据的同时完成原来分几步做的事情：
+- 数据块直接写入临时文件（TemporaryUploadedFile），不在 worker 内存中保留整个文件
+- 边写边计算 SHA-256，完成后挂在文件对象上（file.sha256），
+  calculate_file_hash 和内容寻址存储（songs/media_store.py）直接使用，不再重新读取文件
+- 有限制的字段（songs/utils.py 的 upload_rules）扩展名不允许时不接收该文件；
+  已接收的字节数超过大小限制时立即删除临时文件并丢弃剩余数据，不必等整个文件传完再由 validate_* 拒绝
+
+被拒绝的文件不会出现在 request.FILES 中，原因记录在 request.upload_errors，由 rejected_uploads 返回给接口。
+"""
+
+import hashlib
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+from .utils import upload_rules, upload_size_error, upload_extension_error
+
+
+class HashingFileUploadHandler(FileUploadHandler):
+    """流式写入临时文件、增量计算 SHA-256、超过字段限制时提前中止的上传处理器"""
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        # 上一个文件已交给 request.FILES，拒绝本文件时不能被 MultiPartParser._close_files 关闭
+        self.__dict__.pop('file', None)
+        super().new_file(field_name, file_name, *args, **kwargs)
+
+        self.rule = upload_rules().get(field_name)
+        if self.rule:
+            error = upload_extension_error(field_name, self.file_name)
+            if error:
+                self.reject(error)
+
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+        self.file = TemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.rule and self.received > self.rule['max_size']:
+            # SkipFile 后 MultiPartParser 关闭（删除）临时文件，剩余数据读出丢弃
+            self.reject(upload_size_error(self.field_name))
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.sha256.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()  # TemporaryUploadedFile 关闭时删除临时文件
+
+    def reject(self, message):
+        """记录拒绝原因并跳过当前文件"""
+        errors = getattr(self.request, 'upload_errors', None)
+        if errors is None:
+            errors = self.request.upload_errors = {}
+        errors.setdefault(self.field_name, []).append(message)
+        raise SkipFile(message)
+
+
+def rejected_uploads(request):
+    """
+    上传处理器在接收过程中拒绝的文件
+
+    Returns:
+        dict: {字段名: [错误信息]}，没有被拒绝的文件时为空
+    """
+    request.data  # 确保请求体已解析（DRF Request 延迟解析）
+    return getattr(request, 'upload_errors', None) or {}
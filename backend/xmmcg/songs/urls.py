@@ -30,6 +30,7 @@ urlpatterns = [
     path('bids/', views.user_bids_root, name='user-bids-root'),# 用户提交竞标，查看自己的竞标，也有匿名性。
     path('bids/<int:bid_id>/', views.delete_bid_view, name='delete-bid'),
     path('bids/target/', views.target_bids_list, name='target_bids_list'), #查看行情，返回的是哈希用户名。
+    path('bids/market/', views.target_market_stats, name='target-market-stats'), # 批量行情汇总（竞标数/最高价/第二高价）
     path('bids/allocate/', views.allocate_bids_view, name='allocate-bids'),
     
     # 竞标结果
@@ -46,10 +47,13 @@ urlpatterns = [
     path('peer-reviews/allocate/<int:round_id>/', views.allocate_peer_reviews, name='allocate-peer-reviews'),
     path('peer-reviews/tasks/', views.get_peer_review_tasks, name='get-peer-review-tasks'),
     path('peer-reviews/allocations/<int:allocation_id>/submit/', views.submit_peer_review, name='submit-peer-review'),
+    path('peer-reviews/submit-batch/', views.submit_peer_reviews_batch, name='submit-peer-reviews-batch'),
     path('peer-reviews/extra/', views.submit_extra_peer_review, name='submit-extra-peer-review'),
+    path('peer-reviews/progress/<int:round_id>/', views.get_peer_review_progress, name='get-peer-review-progress'),
     
     # ==================== 排名相关路由 ====================
     path('rankings/<int:round_id>/', views.get_round_rankings, name='get-round-rankings'),
+    path('rankings/<int:round_id>/favorites/', views.get_favorite_leaderboard, name='get-favorite-leaderboard'),
     
     
     # ==================== 第二轮竞标相关路由（已废弃，使用统一的竞标系统） ====================
@@ -7,7 +7,13 @@ def calculate_file_hash(file: File) -> str:
     """
     计算文件的 SHA256 哈希值
     用于识别相同的音频文件
+    
+    上传的文件已由 HashingFileUploadHandler 在接收时计算过哈希（file.sha256），直接返回，不再读取文件
     """
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    
     file.seek(0)  # 重置文件指针到开头
     hash_sha256 = hashlib.sha256()
     
@@ -19,6 +25,57 @@ def calculate_file_hash(file: File) -> str:
     return hash_sha256.hexdigest()
 
 
+def upload_rules() -> dict:
+    """
+    各上传字段的限制：{字段名: {'label', 'format_label', 'max_size'（字节）, 'extensions'}}
+    validate_* 与 songs/upload_handlers.py（接收过程中提前拒绝）共用，保证两处限制一致
+    """
+    return {
+        'audio_file': {
+            'label': '音频文件',
+            'format_label': '音频格式',
+            'max_size': 10 * 1024 * 1024,  # 10MB
+            'extensions': getattr(settings, 'ALLOWED_AUDIO_EXTENSIONS',
+                                  ['mp3', 'wav', 'flac', 'm4a', 'aac', 'ogg', 'wma']),
+        },
+        'cover_image': {
+            'label': '封面图片',
+            'format_label': '图片格式',
+            'max_size': 2 * 1024 * 1024,  # 2MB
+            'extensions': getattr(settings, 'ALLOWED_IMAGE_EXTENSIONS',
+                                  ['jpg', 'jpeg', 'png', 'gif', 'webp']),
+        },
+        'background_video': {
+            'label': '背景视频',
+            'format_label': '视频格式',
+            'max_size': getattr(settings, 'MAX_VIDEO_SIZE_BYTES', 20 * 1024 * 1024),  # 20MB
+            'extensions': getattr(settings, 'ALLOWED_VIDEO_EXTENSIONS', ['mp4']),
+        },
+        'chart_file': {
+            'label': '谱面文件',
+            'format_label': '谱面格式',
+            'max_size': 1 * 1024 * 1024,  # 1MB
+            'extensions': ['txt'],
+        },
+    }
+
+
+def upload_size_error(field_name: str) -> str:
+    """文件超过字段大小限制时的错误信息"""
+    rule = upload_rules()[field_name]
+    size_mb = rule['max_size'] / (1024 * 1024)
+    return f'{rule["label"]}过大，最大允许 {int(size_mb)}MB'
+
+
+def upload_extension_error(field_name: str, filename: str) -> str:
+    """文件扩展名不在字段允许范围内时返回错误信息，否则返回空字符串"""
+    rule = upload_rules()[field_name]
+    ext = filename.split('.')[-1].lower()
+    if ext not in rule['extensions']:
+        return f'不支持的{rule["format_label"]}: {ext}，允许的格式: {", ".join(rule["extensions"])}'
+    return ''
+
+
 def validate_audio_file(file: File) -> tuple[bool, str]:
     """
     验证音频文件
@@ -30,17 +87,13 @@ def validate_audio_file(file: File) -> tuple[bool, str]:
         return False, '音频文件不能为空'
     
     # 检查文件大小（10MB）
-    max_size = 10 * 1024 * 1024  # 10MB
-    if file.size > max_size:
-        size_mb = max_size / (1024 * 1024)
-        return False, f'音频文件过大，最大允许 {int(size_mb)}MB'
+    if file.size > upload_rules()['audio_file']['max_size']:
+        return False, upload_size_error('audio_file')
     
     # 检查文件扩展名
-    allowed_extensions = getattr(settings, 'ALLOWED_AUDIO_EXTENSIONS', 
-                                 ['mp3', 'wav', 'flac', 'm4a', 'aac', 'ogg', 'wma'])
-    ext = file.name.split('.')[-1].lower()
-    if ext not in allowed_extensions:
-        return False, f'不支持的音频格式: {ext}，允许的格式: {", ".join(allowed_extensions)}'
+    error = upload_extension_error('audio_file', file.name)
+    if error:
+        return False, error
     
     return True, ''
 
@@ -56,17 +109,13 @@ def validate_cover_image(file: File) -> tuple[bool, str]:
         return True, ''  # 封面是可选的
     
     # 检查文件大小（2MB）
-    max_size = 2 * 1024 * 1024  # 2MB
-    if file.size > max_size:
-        size_mb = max_size / (1024 * 1024)
-        return False, f'封面图片过大，最大允许 {int(size_mb)}MB'
+    if file.size > upload_rules()['cover_image']['max_size']:
+        return False, upload_size_error('cover_image')
     
     # 检查文件扩展名
-    allowed_extensions = getattr(settings, 'ALLOWED_IMAGE_EXTENSIONS',
-                                 ['jpg', 'jpeg', 'png', 'gif', 'webp'])
-    ext = file.name.split('.')[-1].lower()
-    if ext not in allowed_extensions:
-        return False, f'不支持的图片格式: {ext}，允许的格式: {", ".join(allowed_extensions)}'
+    error = upload_extension_error('cover_image', file.name)
+    if error:
+        return False, error
     
     return True, ''
 
@@ -98,16 +147,13 @@ def validate_background_video(file: File) -> tuple[bool, str]:
         return True, ''  # 视频是可选的
     
     # 检查文件大小（最大20MB）
-    max_size = getattr(settings, 'MAX_VIDEO_SIZE_BYTES', 20 * 1024 * 1024)  # 20MB
-    if file.size > max_size:
-        size_mb = max_size / (1024 * 1024)
-        return False, f'背景视频过大，最大允许 {int(size_mb)}MB'
+    if file.size > upload_rules()['background_video']['max_size']:
+        return False, upload_size_error('background_video')
     
     # 检查文件扩展名
-    allowed_extensions = getattr(settings, 'ALLOWED_VIDEO_EXTENSIONS', ['mp4'])
-    ext = file.name.split('.')[-1].lower()
-    if ext not in allowed_extensions:
-        return False, f'不支持的视频格式: {ext}，允许的格式: {", ".join(allowed_extensions)}'
+    error = upload_extension_error('background_video', file.name)
+    if error:
+        return False, error
     
     # 检查文件名是否为 bg.mp4 或 pv.mp4
     filename = file.name.lower()
@@ -5,10 +5,9 @@ from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
 from django.conf import settings
-import io
-import zipfile
 import logging
 import hashlib
 
@@ -30,6 +29,7 @@ from .serializers import (
     BidSerializer,
 )
 from .bidding_service import BiddingService
+from .upload_handlers import rejected_uploads
 
 
 # ==================== 权限检查辅助函数 ====================
@@ -336,6 +336,14 @@ def songs_root(request):
                 'limit': MAX_SONGS_PER_USER
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        # 接收时已被拒绝的文件（超过大小限制或格式不支持）
+        upload_errors = rejected_uploads(request)
+        if upload_errors:
+            return Response({
+                'success': False,
+                'errors': upload_errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
         # 序列化并验证数据
         serializer = SongUploadSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
@@ -882,6 +890,69 @@ def target_bids_list(request):
     }, status=status.HTTP_200_OK)
 
 
+def _parse_id_list(raw):
+    """解析逗号分隔的ID列表，None 表示未提供"""
+    if raw is None:
+        return None
+    return [int(item) for item in raw.split(',') if item.strip()]
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def target_market_stats(request):
+    """
+    批量获取目标行情（竞标数量、最高价、第二高价）
+    GET /api/songs/bids/market/?round_id=5&song_ids=1,2,3
+    GET /api/songs/bids/market/?round_id=5&chart_ids=4,5
+    
+    不传 song_ids / chart_ids 时返回该轮次全部目标的行情。
+    轮次未开放公开查看时，非管理员只能看到竞标数量，价格为 null。
+    """
+    round_id = request.query_params.get('round_id')
+    if not round_id:
+        return Response({'success': False, 'message': '必须提供 round_id'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        song_ids = _parse_id_list(request.query_params.get('song_ids'))
+        chart_ids = _parse_id_list(request.query_params.get('chart_ids'))
+    except ValueError:
+        return Response({'success': False, 'message': 'song_ids / chart_ids 必须是逗号分隔的整数'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if song_ids is not None and chart_ids is not None:
+        return Response({'success': False, 'message': '无法同时查询歌曲和谱面'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        round_obj = BiddingRound.objects.get(id=round_id)
+    except (BiddingRound.DoesNotExist, ValueError):
+        return Response({'success': False, 'message': '轮次不存在'}, status=status.HTTP_404_NOT_FOUND)
+    
+    show_amounts = round_obj.allow_public_view or request.user.is_staff
+    results = [
+        {
+            'target_id': row['song_id'] or row['chart_id'],
+            'type': row['bid_type'],
+            'bid_count': row['bid_count'],
+            'max_amount': row['max_amount'] if show_amounts else None,
+            'second_amount': row['second_amount'] if show_amounts else None,
+            'updated_at': row['updated_at'],
+        }
+        for row in BiddingService.get_market_stats(round_obj, song_ids=song_ids, chart_ids=chart_ids).values(
+            'bid_type', 'song_id', 'chart_id', 'bid_count', 'max_amount', 'second_amount', 'updated_at'
+        )
+    ]
+    
+    return Response({
+        'success': True,
+        'round': {
+            'id': round_obj.id,
+            'name': round_obj.name,
+            'status': round_obj.status
+        },
+        'count': len(results),
+        'results': results
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_bid_view(request, bid_id):
@@ -916,8 +987,8 @@ def delete_bid_view(request, bid_id):
             'message': '竞标轮次已完成，无法撤回'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # 删除竞标
-    bid.delete()
+    # 删除竞标（同时释放承诺额度）
+    BiddingService.delete_bid(bid)
     
     return Response({
         'success': True,
@@ -932,13 +1003,20 @@ def allocate_bids_view(request):
     执行竞标分配（Admin only）
     POST /api/bids/allocate/
     
-    参数: round_id（可选，不提供则分配最新的活跃轮次）
+    参数:
+    - round_id（可选，不提供则分配最新的活跃轮次）
+    - strategy（可选）: 'greedy'（默认）或 'optimal'
+    - seed（可选）: 随机种子；与预览使用相同的种子可得到与预览一致的结果
+    - dry_run（可选）: 为 true 时只返回分配预览（中标、保底、代币变化），不写入数据库
     
-    算法：
+    算法（greedy）：
     1. 按竞标金额从高到低排序
     2. 依次为每个竞标分配歌曲
     3. 同一歌曲的其他竞标标记为 drop
     4. 对于未获得歌曲的用户，从未被分配的歌曲中随机分配
+    
+    optimal 策略将第1-3步替换为最优匹配（每人至多中标一个目标，中标出价总和最大），
+    第4步不变。
     """
     
     # 验证 admin 权限
@@ -949,6 +1027,19 @@ def allocate_bids_view(request):
         }, status=status.HTTP_403_FORBIDDEN)
     
     round_id = request.data.get('round_id')
+    strategy = request.data.get('strategy', 'greedy')
+    dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+    seed = request.data.get('seed')
+    if seed not in (None, ''):
+        try:
+            seed = int(seed)
+        except (ValueError, TypeError):
+            return Response({
+                'success': False,
+                'message': 'seed 必须是整数'
+            }, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        seed = None
     
     try:
         if round_id:
@@ -967,7 +1058,24 @@ def allocate_bids_view(request):
                     'message': '当前没有活跃的竞标轮次'
                 }, status=status.HTTP_404_NOT_FOUND)
         
-        result = BiddingService.allocate_bids(round_obj.id, priority_self=True)
+        if dry_run:
+            result = BiddingService.dry_run_allocation(
+                round_obj.id, priority_self=True, seed=seed, strategy=strategy
+            )
+            return Response({
+                'success': True,
+                'message': '竞标分配预览（未写入数据库）',
+                'round': {
+                    'id': round_obj.id,
+                    'name': round_obj.name,
+                    'status': round_obj.status,
+                },
+                'statistics': result
+            }, status=status.HTTP_200_OK)
+        
+        result = BiddingService.allocate_bids(
+            round_obj.id, priority_self=True, seed=seed, strategy=strategy
+        )
         
         return Response({
             'success': True,
@@ -1328,6 +1436,14 @@ def submit_chart(request, result_id):
             }, status=status.HTTP_400_BAD_REQUEST)
         chart = None
     
+    # 接收时已被拒绝的文件（超过大小限制或格式不支持）
+    upload_errors = rejected_uploads(request)
+    if upload_errors:
+        return Response({
+            'success': False,
+            'errors': upload_errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
     # 处理请求数据
     serializer = ChartCreateSerializer(data=request.data)
     if not serializer.is_valid():
@@ -1392,6 +1508,13 @@ def submit_chart(request, result_id):
             completion_bid_result=bid_result
         )
 
+    # 预先生成资源包缓存（失败不影响提交，下载时会按需重新生成）
+    from .bundle import build_chart_bundle
+    try:
+        build_chart_bundle(chart)
+    except Exception as e:
+        logger.warning(f"谱面资源包缓存生成失败: Chart ID={chart.id}: {e}")
+
     if  ENABLE_CHART_FORWARD_TO_MAJDATA:
         # 上传谱面到 Majdata.net
         from .majdata_service import MajdataService
@@ -1469,57 +1592,51 @@ def download_chart_bundle(request, chart_id):
     """
     服务器端打包并下载谱面资源（音频、封面、视频、maidata.txt）。
     GET /api/songs/charts/{chart_id}/bundle/
-    """
-    chart = get_object_or_404(Chart.objects.select_related('song', 'user'), id=chart_id)
 
-    buffer = io.BytesIO()
-    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # 谱面文件
-        if chart.chart_file and chart.chart_file.storage.exists(chart.chart_file.name):
-            with chart.chart_file.open('rb') as f:
-                zf.writestr('maidata.txt', f.read())
-
-        # 音频
-        if chart.audio_file and chart.audio_file.storage.exists(chart.audio_file.name):
-            audio_ext = os.path.splitext(chart.audio_file.name)[1].lower() or '.mp3'
-            with chart.audio_file.open('rb') as f:
-                zf.writestr(f'track{audio_ext}', f.read())
-
-        # 封面
-        if chart.cover_image and chart.cover_image.storage.exists(chart.cover_image.name):
-            cover_ext = os.path.splitext(chart.cover_image.name)[1].lower() or '.jpg'
-            with chart.cover_image.open('rb') as f:
-                zf.writestr(f'bg{cover_ext}', f.read())
-
-        # 视频（可选）
-        if chart.background_video and chart.background_video.storage.exists(chart.background_video.name):
-            # 文件名包含 bg/pv 时按名称命名，否则默认 bg.mp4
-            basename = os.path.basename(chart.background_video.name).lower()
-            target_name = 'bg.mp4'
-            if basename.startswith('pv') or 'pv.' in basename:
-                target_name = 'pv.mp4'
-            elif basename.endswith('.mp4'):
-                target_name = 'bg.mp4'
-            else:
-                # 保留原扩展名
-                target_name = 'bg' + os.path.splitext(basename)[1].lower()
-            with chart.background_video.open('rb') as f:
-                zf.writestr(target_name, f.read())
-
-    buffer.seek(0)
+    资源包只生成一次并缓存在 MEDIA_ROOT/bundles/ 下（见 songs/bundle.py，源文件变化时自动重新生成）：
+    - ETag 为资源包的输入摘要，If-None-Match 命中时直接返回 304（不生成、不发送文件）
+    - CHART_BUNDLE_X_ACCEL=True（生产环境）：只返回 X-Accel-Redirect，由 nginx 发送文件并处理 Range
+    - 否则（开发服务器）：由 Django 发送缓存文件，支持 Range / If-Range（见 songs/downloads.py）
+    缓存无法生成时（如存储不是本地文件系统）退回到边读边流式输出 zip（不支持 Range）。
+    """
+    from .bundle import (
+        chart_bundle_name, bundle_etag, build_chart_bundle, bundle_cache_path, iter_chart_bundle, bundle_filename,
+    )
+    from .downloads import conditional_headers, serve_file
 
-    # 安全文件名
-    def sanitize_filename(name: str) -> str:
-        return (name or 'chart').replace('\\', '_').replace('/', '_').replace(':', '_').replace('*', '_') \
-            .replace('?', '_').replace('"', '_').replace('<', '_').replace('>', '_').replace('|', '_').strip() or 'chart'
+    chart = get_object_or_404(Chart.objects.select_related('song', 'user'), id=chart_id)
+    filename = bundle_filename(chart)
 
-    filename = f"{sanitize_filename(chart.song.title)}_chart.zip"
-    response = HttpResponse(buffer.getvalue(), content_type='application/zip')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    # 提供范围与长度信息（有助于某些下载器）
-    response['Accept-Ranges'] = 'bytes'
-    response['Content-Length'] = str(len(buffer.getvalue()))
-    return response
+    try:
+        etag = bundle_etag(chart_bundle_name(chart))
+        not_modified, headers = conditional_headers(request, etag)
+        if not_modified is not None:
+            return not_modified
+        name = build_chart_bundle(chart)
+    except (OSError, NotImplementedError) as e:
+        logger.warning(f"谱面资源包缓存生成失败，改为流式输出: Chart ID={chart.id}: {e}")
+        response = StreamingHttpResponse(iter_chart_bundle(chart), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+    if getattr(settings, 'CHART_BUNDLE_X_ACCEL', False):
+        response = HttpResponse(content_type='application/zip')
+        response['X-Accel-Redirect'] = settings.CHART_BUNDLE_X_ACCEL_PREFIX.rstrip('/') + '/' + name
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        for header, value in headers.items():
+            response[header] = value
+        # 以实际生成的文件为准（判断条件请求后源文件可能刚刚发生变化）
+        response['ETag'] = bundle_etag(name)
+        return response
+
+    return serve_file(
+        request,
+        bundle_cache_path(name),
+        bundle_etag(name),
+        content_type='application/zip',
+        filename=filename,
+        as_attachment=True,
+    )
 
 
 @api_view(['GET'])
@@ -1561,7 +1678,10 @@ def allocate_peer_reviews(request, round_id):
     POST /api/peer-reviews/allocate/{round_id}/
     
     参数:
-    - reviews_per_user: 每个用户的评分任务数（默认8）
+    - min_reviews_per_chart: 每张谱面至少收到的评分数（默认8）
+    - method: 分配方式，greedy（默认）或 flow（最大流，保证可行时每张谱面都达到目标且最大任务数最小）
+    - incremental（可选）: 为 true 时保留已完成和仍有效的待评分任务，只为未达标的谱面补充分配，
+      返回结果中包含新增/撤销的任务明细
     """
     from .bidding_service import PeerReviewService
     
@@ -1573,9 +1693,13 @@ def allocate_peer_reviews(request, round_id):
     #     }, status=status.HTTP_403_FORBIDDEN)
     
     min_reviews_per_chart = int(request.data.get('min_reviews_per_chart', 8))
+    method = request.data.get('method', 'greedy')
+    incremental = str(request.data.get('incremental', '')).lower() in ('1', 'true', 'yes')
 
     try:
-        result = PeerReviewService.allocate_peer_reviews(round_id, min_reviews_per_chart)
+        result = PeerReviewService.allocate_peer_reviews(
+            round_id, min_reviews_per_chart, method=method, incremental=incremental
+        )
         return Response({
             'success': True,
             'message': '互评任务分配成功',
@@ -1674,6 +1798,74 @@ def submit_peer_review(request, allocation_id):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def submit_peer_reviews_batch(request):
+    """
+    批量提交互评打分（全部成功或全部失败）
+    POST /api/peer-reviews/submit-batch/
+    
+    参数:
+    - reviews: [{allocation_id, score, comment（可选）, favorite（可选）}]
+    """
+    from .bidding_service import PeerReviewService
+    from .serializers import PeerReviewSerializer
+    
+    raw_items = request.data.get('reviews')
+    if not isinstance(raw_items, list) or not raw_items:
+        return Response({
+            'success': False,
+            'message': 'reviews 必须为非空列表'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    items = []
+    for index, raw in enumerate(raw_items, start=1):
+        if not isinstance(raw, dict):
+            return Response({
+                'success': False,
+                'message': f'第{index}项格式错误'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if raw.get('score') is None:
+            return Response({
+                'success': False,
+                'message': f'第{index}项：评分不能为空'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            allocation_id = int(raw.get('allocation_id'))
+            score = int(raw.get('score'))
+        except (ValueError, TypeError):
+            return Response({
+                'success': False,
+                'message': f'第{index}项：allocation_id 和评分必须为整数'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        items.append({
+            'allocation_id': allocation_id,
+            'score': score,
+            'comment': raw.get('comment', ''),
+            'favorite': raw.get('favorite', False),
+        })
+    
+    try:
+        reviews = PeerReviewService.submit_peer_reviews(request.user, items)
+        serializer = PeerReviewSerializer(reviews, many=True)
+        return Response({
+            'success': True,
+            'message': f'已提交 {len(reviews)} 个评分',
+            'count': len(reviews),
+            'reviews': serializer.data
+        }, status=status.HTTP_201_CREATED)
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'message': str(e.message) if hasattr(e, 'message') else str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            'success': False,
+            'message': f'提交失败: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_chart_reviews(request, chart_id):
@@ -1756,38 +1948,18 @@ def submit_extra_peer_review(request): # TODO 这里comment、comments参数命
             'message': '不能给自己参与制作的谱面评分'
         }, status=status.HTTP_400_BAD_REQUEST)
 
-    # 检查是否已经提交过额外评分（防止重复）
-    existing_extra_review = PeerReview.objects.filter(
-        reviewer=user,
-        chart=chart,
-        allocation__isnull=True  # 额外评分没有allocation
-    ).first()
+    # 创建额外评分，或更新已有的额外评分（防止重复）；是否计入谱面统计见 review_stats
+    from .bidding_service import PeerReviewService
+    review, created = PeerReviewService.submit_extra_peer_review(user, chart, score, comments, favorite)
     
-    if existing_extra_review:
-        # 更新已有的额外评分
-        existing_extra_review.score = score
-        existing_extra_review.comment = comments
-        existing_extra_review.favorite = favorite
-        existing_extra_review.save()
-        
-        serializer = PeerReviewSerializer(existing_extra_review)
+    serializer = PeerReviewSerializer(review)
+    if not created:
         return Response({
             'success': True,
             'message': '额外评分已更新',
             'review': serializer.data
         }, status=status.HTTP_200_OK)
     
-    # 创建新的额外评分（不需要allocation）
-    review = PeerReview.objects.create(
-        chart=chart,
-        reviewer=user,
-        allocation=None,  # 额外评分没有allocation
-        score=score,
-        comment=comments,
-        favorite=favorite
-    )
-    
-    serializer = PeerReviewSerializer(review)
     return Response({
         'success': True,
         'message': '额外评分提交成功',
@@ -1800,14 +1972,60 @@ def submit_extra_peer_review(request): # TODO 这里comment、comments参数命
     }, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_peer_review_progress(request, round_id):
+    """
+    获取某轮互评进度（管理员）：每个评分者的完成率、每张谱面收到的评分数、超期任务
+    GET /api/peer-reviews/progress/{round_id}/
+    
+    由少量 GROUP BY 查询聚合并短时缓存（见 songs/review_progress.py）。
+    
+    参数:
+    - refresh（可选）: 为 true 时忽略缓存重新聚合
+    """
+    from . import review_progress
+    
+    if not request.user.is_staff:
+        return Response({
+            'success': False,
+            'message': '需要管理员权限'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        bidding_round = BiddingRound.objects.get(id=round_id)
+    except BiddingRound.DoesNotExist:
+        return Response({
+            'success': False,
+            'message': '竞标轮次不存在'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    refresh = str(request.query_params.get('refresh', '')).lower() in ('1', 'true', 'yes')
+    progress = review_progress.get_round_progress(bidding_round, refresh=refresh)
+    return Response({
+        'success': True,
+        'round': {
+            'id': bidding_round.id,
+            'name': bidding_round.name,
+        },
+        **progress
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_round_rankings(request, round_id):
     """
-    获取某轮次的最终排名（基于平均分）
+    获取某轮次的最终排名（读取排名快照，见 songs/ranking.py）
     GET /api/rankings/{round_id}/
+    
+    参数:
+    - method（可选）: 计分方式 zscore（默认，按评分者标准化）/ mean（原始平均分）/ trimmed（截尾平均）/ favorites（喜欢数）
+    - page（可选）: 页码，默认 1
+    - page_size（可选）: 每页条数，默认 50，最大 200
+    - refresh（可选，仅管理员）: 为 true 时重新生成该轮的排名快照
     """
-    from .models import Chart
+    from . import ranking
     
     try:
         bidding_round = BiddingRound.objects.get(id=round_id)
@@ -1817,22 +2035,78 @@ def get_round_rankings(request, round_id):
             'message': '竞标轮次不存在'
         }, status=status.HTTP_404_NOT_FOUND)
     
-    # 获取该轮所有已评分的谱面，按平均分排序
-    charts = Chart.objects.filter(
-        bidding_round=bidding_round,
-        status__in=['reviewed']
-    ).select_related('user', 'song').order_by('-average_score', '-total_score')
-    
-    rankings = []
-    for idx, chart in enumerate(charts, 1):
-        rankings.append({
-            'rank': idx,
-            'username': chart.user.username,
-            'song_title': chart.song.title,
-            'average_score': chart.average_score,
-            'review_count': chart.review_count,
-            'total_score': chart.total_score,
-        })
+    method = request.query_params.get('method') or ranking.default_method()
+    if method not in ranking.RANKING_METHODS:
+        return Response({
+            'success': False,
+            'message': f'计分方式必须为: {", ".join(ranking.RANKING_METHODS)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+        page_size = min(max(int(request.query_params.get('page_size', 50)), 1), 200)
+    except (ValueError, TypeError):
+        return Response({
+            'success': False,
+            'message': 'page 和 page_size 必须为整数'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if request.user.is_staff and str(request.query_params.get('refresh', '')).lower() in ('1', 'true', 'yes'):
+        ranking.compute_round_rankings(bidding_round)
+    
+    payload = ranking.get_ranking(bidding_round, method)
+    entries = payload['entries']
+    start = (page - 1) * page_size
+    
+    return Response({
+        'success': True,
+        'round': {
+            'id': bidding_round.id,
+            'name': bidding_round.name,
+        },
+        'method': method,
+        'computed_at': payload['computed_at'],
+        'total': len(entries),
+        'page': page,
+        'page_size': page_size,
+        'num_pages': (len(entries) + page_size - 1) // page_size,
+        'rankings': entries[start:start + page_size]
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_favorite_leaderboard(request, round_id):
+    """
+    获取某轮次的真爱票排行榜（读取增量维护的 Chart.favorite_count，结果带缓存，见 songs/favorites.py）
+    GET /api/rankings/{round_id}/favorites/
+    
+    参数:
+    - page（可选）: 页码，默认 1
+    - page_size（可选）: 每页条数，默认 50，最大 200
+    """
+    from . import favorites
+    
+    try:
+        bidding_round = BiddingRound.objects.get(id=round_id)
+    except BiddingRound.DoesNotExist:
+        return Response({
+            'success': False,
+            'message': '竞标轮次不存在'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+        page_size = min(max(int(request.query_params.get('page_size', 50)), 1), 200)
+    except (ValueError, TypeError):
+        return Response({
+            'success': False,
+            'message': 'page 和 page_size 必须为整数'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    payload = favorites.get_leaderboard(bidding_round)
+    entries = payload['entries']
+    start = (page - 1) * page_size
     
     return Response({
         'success': True,
@@ -1840,8 +2114,13 @@ def get_round_rankings(request, round_id):
             'id': bidding_round.id,
             'name': bidding_round.name,
         },
-        'total': len(rankings),
-        'rankings': rankings
+        'computed_at': payload['computed_at'],
+        'total': len(entries),
+        'total_favorites': payload['total_favorites'],
+        'page': page,
+        'page_size': page_size,
+        'num_pages': (len(entries) + page_size - 1) // page_size,
+        'leaderboard': entries[start:start + page_size]
     }, status=status.HTTP_200_OK)
 
 # ==================== 第二轮竞标API端点 ====================
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+竞标分配引擎测试脚本
+
+检查 BiddingService.allocate_bids 的两种分配引擎（bulk / legacy）：
+1. legacy 引擎同样写入 AllocationLog，完成的轮次可以用 replay_allocation 重放核对
+   （歌曲竞标；谱面竞标 + priority_self）
+2. 同一份数据、同一随机种子下，两种引擎分配后的数据库状态相同：分配结果、竞标的 drop 标记
+   和 updated_at（被 drop 的竞标更新时间戳，中标竞标不改写）、其他类型的竞标、代币余额、分配日志
+
+脚本在临时创建的测试数据库上运行，不会读写开发数据库。
+
+使用方法：
+    python test_allocation_engines.py
+"""
+
+import os
+import random
+
+import django
+
+# 设置 Django 环境
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'xmmcg.settings')
+django.setup()
+
+from django.db import connection, transaction
+from django.test import override_settings
+
+SEED = 20240601
+
+
+def make_users(prefix, count):
+    from django.contrib.auth.models import User
+    from users.models import UserProfile
+
+    users = [User.objects.create(username=f'{prefix}{i}') for i in range(count)]
+    for user in users:
+        UserProfile.objects.update_or_create(user=user, defaults={'token': 1000})
+    return users
+
+
+def make_song_round(name):
+    """8 个用户竞标 6 首歌，出价只有两档（大量同价竞标），部分用户需要保底分配"""
+    from songs.models import BiddingRound, Song, Bid
+
+    users = make_users(f'{name}_user', 8)
+    songs = [
+        Song.objects.create(user=users[i], title=f'{name} song {i}', audio_file=f'songs/{name}_{i}.mp3',
+                            audio_hash=f'{i:064d}', file_size=1)
+        for i in range(6)
+    ]
+    bidding_round = BiddingRound.objects.create(name=name, bidding_type='song', status='active')
+    rng = random.Random(SEED)
+    for user in users:
+        for song in rng.sample(songs[:4], 2):
+            Bid.objects.create(bidding_round=bidding_round, user=user, bid_type='song',
+                               song=song, amount=rng.choice([10, 20]))
+    return bidding_round
+
+
+def make_chart_round(name):
+    """谱面竞标：每个用户有一张半成品谱面，都只竞标前两张"""
+    from songs.models import BiddingRound, Song, Chart, Bid
+
+    users = make_users(f'{name}_user', 5)
+    first_round = BiddingRound.objects.create(name=f'{name} songs', bidding_type='song', status='completed')
+    charts = []
+    for i, user in enumerate(users):
+        song = Song.objects.create(user=user, title=f'{name} song {i}', audio_file=f'songs/{name}_{i}.mp3',
+                                   audio_hash=f'{i:064d}', file_size=1)
+        charts.append(Chart.objects.create(bidding_round=first_round, user=user, song=song, status='submitted'))
+    bidding_round = BiddingRound.objects.create(name=name, bidding_type='chart', status='active')
+    for i, user in enumerate(users):
+        Bid.objects.create(bidding_round=bidding_round, user=user, bid_type='chart',
+                           chart=charts[i % 2], amount=10 + i)
+    return bidding_round
+
+
+def test_legacy_replay():
+    print('\n[1] legacy 引擎写入分配日志，可以重放核对')
+    from songs.bidding_service import BiddingService
+
+    bidding_round = make_song_round('legacy_song')
+    result = BiddingService.allocate_bids(bidding_round.id, engine='legacy', seed=SEED)
+    log = bidding_round.allocation_logs.get()
+    assert log.seed == SEED and log.backend == 'python'
+    assert log.fallbacks, '测试数据应包含保底分配'
+    report = BiddingService.replay_allocation(bidding_round.id)
+    assert report['consistent'], report
+    assert report['winners'] == result['winners']
+    print(f"    歌曲竞标：{report['winners']} 个中标，{report['fallbacks']} 个保底 ✓")
+
+    bidding_round = make_chart_round('legacy_chart')
+    BiddingService.allocate_bids(bidding_round.id, priority_self=True, engine='legacy', seed=SEED)
+    log = bidding_round.allocation_logs.get()
+    assert log.priority_self and log.target_owners
+    report = BiddingService.replay_allocation(bidding_round.id)
+    assert report['consistent'], report
+    print(f"    谱面竞标 + priority_self：{report['winners']} 个中标，{report['fallbacks']} 个保底 ✓")
+
+
+def db_state(bidding_round, bids_before):
+    """分配后与引擎无关的数据库状态（不含自增ID和时间戳本身）"""
+    from songs.models import Bid, BidResult
+    from users.models import UserProfile
+
+    bidding_round.refresh_from_db()
+    log = bidding_round.allocation_logs.get()
+    return {
+        'status': bidding_round.status,
+        'results': sorted(BidResult.objects.filter(bidding_round=bidding_round).values_list(
+            'user_id', 'bid_type', 'song_id', 'chart_id', 'bid_amount', 'allocation_type'
+        )),
+        # (竞标ID, 是否drop, updated_at 是否被改写)
+        'bids': sorted(
+            (bid_id, is_dropped, updated_at != bids_before[bid_id])
+            for bid_id, is_dropped, updated_at in Bid.objects.filter(bidding_round=bidding_round).values_list(
+                'id', 'is_dropped', 'updated_at'
+            )
+        ),
+        'tokens': sorted(UserProfile.objects.values_list('user_id', 'token')),
+        'log': (log.seed, log.bids, log.order, log.winners, log.fallbacks, log.targets),
+    }
+
+
+def run_engine(bidding_round, engine):
+    """在回滚的事务中执行分配，返回分配后的数据库状态"""
+    from songs.bidding_service import BiddingService
+    from songs.models import Bid
+
+    bids_before = dict(Bid.objects.filter(bidding_round=bidding_round).values_list('id', 'updated_at'))
+    with transaction.atomic():
+        BiddingService.allocate_bids(bidding_round.id, engine=engine, seed=SEED)
+        state = db_state(bidding_round, bids_before)
+        transaction.set_rollback(True)
+    return state
+
+
+def test_engines_match():
+    print('\n[2] 两种引擎分配后的数据库状态相同')
+    from songs.models import Song, Chart, Bid
+
+    bidding_round = make_song_round('compare_song')
+    # 轮次中混入的其他类型竞标不参与分配，两种引擎都不改写
+    song = Song.objects.filter(title__startswith='compare_song').first()
+    chart = Chart.objects.create(bidding_round=bidding_round, user=song.user, song=song, status='submitted')
+    users = set(Bid.objects.filter(bidding_round=bidding_round).values_list('user_id', flat=True))
+    chart_bid_ids = set(
+        Bid.objects.create(bidding_round=bidding_round, user_id=user_id, bid_type='chart', chart=chart, amount=5).id
+        for user_id in users
+    )
+
+    bulk = run_engine(bidding_round, 'bulk')
+    legacy = run_engine(bidding_round, 'legacy')
+    for key in bulk:
+        assert bulk[key] == legacy[key], (key, bulk[key], legacy[key])
+    dropped = [row for row in bulk['bids'] if row[1]]
+    kept = [row for row in bulk['bids'] if not row[1]]
+    assert dropped and all(changed for _, _, changed in dropped)
+    assert all(not changed for _, _, changed in kept)
+    assert chart_bid_ids <= set(row[0] for row in kept)
+    print(f"    {len(bulk['results'])} 条分配结果，{len(dropped)} 条竞标被 drop 并更新时间戳，"
+          f"{len(kept)} 条竞标未改写 ✓")
+
+
+def main():
+    print('=' * 60)
+    print('竞标分配引擎测试')
+    print('=' * 60)
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        # numpy 后端的同价排序使用不同的随机键，固定 python 后端
+        with override_settings(BIDDING_ALLOCATION_BACKEND='python'):
+            test_legacy_replay()
+            test_engines_match()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print('\n' + '=' * 60)
+    print('✓ 全部通过')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+谱面资源包缓存测试脚本
+
+检查 songs/bundle.py 的 build_chart_bundle 与 download_chart_bundle 接口：
+1. 第一次生成缓存文件，之后的请求直接复用（不重新打包）
+2. 任一源文件变化后摘要改变，重新生成并删除旧缓存
+3. CHART_BUNDLE_X_ACCEL=True 时只返回 X-Accel-Redirect，响应体为空
+4. CHART_BUNDLE_X_ACCEL=False（开发服务器）时直接返回缓存文件，内容与流式生成的 zip 逐字节相同
+5. 缓存无法生成时退回流式输出
+6. 删除谱面时删除其缓存目录
+
+脚本在临时目录中生成测试文件，在临时创建的测试数据库上运行，不会读写开发数据库和 media 目录。
+
+使用方法：
+    python test_chart_bundle_cache.py
+"""
+
+import os
+import shutil
+import zipfile
+import tempfile
+from unittest import mock
+
+import django
+
+# 设置 Django 环境
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'xmmcg.settings')
+django.setup()
+
+from django.db import connection
+from django.test import Client, override_settings
+
+from songs import bundle
+
+
+def make_chart(root):
+    """在 root 下生成谱面文件并创建谱面"""
+    from django.contrib.auth.models import User
+    from songs.models import Song, BiddingRound, Chart
+
+    files = {
+        'charts/c/maidata.txt': b'&title=Cache\n&inote_5=(120){4}1,2,3,4,\n',
+        'charts/audio_c.mp3': os.urandom(300 * 1024),
+        'charts/cover_c.png': os.urandom(20 * 1024),
+    }
+    for rel, data in files.items():
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    user = User.objects.create(username='cache_tester')
+    song = Song.objects.create(user=user, title='缓存测试', audio_file='songs/x.mp3', audio_hash='1' * 64, file_size=1)
+    bidding_round = BiddingRound.objects.create(name='bundle cache', bidding_type='song')
+    chart = Chart.objects.create(bidding_round=bidding_round, user=user, song=song, status='final_submitted')
+    Chart.objects.filter(id=chart.id).update(
+        chart_file='charts/c/maidata.txt',
+        audio_file='charts/audio_c.mp3',
+        cover_image='charts/cover_c.png',
+    )
+    return Chart.objects.select_related('song').get(id=chart.id)
+
+
+def url(chart):
+    return f'/api/songs/charts/{chart.id}/bundle/'
+
+
+def test_build_and_reuse(chart):
+    print('\n[1] 生成与复用')
+    name = bundle.build_chart_bundle(chart)
+    path = bundle.bundle_cache_path(name)
+    assert name.startswith(f'{chart.id}/') and name.endswith('.zip'), name
+    stat = os.stat(path)
+    assert oct(stat.st_mode & 0o777) == oct(0o644), '缓存文件应对 nginx 可读'
+
+    with mock.patch.object(bundle, 'iter_zip', side_effect=AssertionError('命中缓存时不应重新打包')):
+        assert bundle.build_chart_bundle(chart) == name
+        with override_settings(CHART_BUNDLE_X_ACCEL=True):
+            assert Client().get(url(chart)).status_code == 200
+    assert os.stat(path).st_mtime_ns == stat.st_mtime_ns
+
+    with open(path, 'rb') as f:
+        cached = f.read()
+    assert cached == b''.join(bundle.iter_chart_bundle(chart)), '缓存文件与流式生成的 zip 不同'
+    with zipfile.ZipFile(path) as zf:
+        assert sorted(zf.namelist()) == ['bg.png', 'maidata.txt', 'track.mp3'], zf.namelist()
+    print(f'    {name} ✓')
+    return name
+
+
+def test_invalidation(chart, old_name, root):
+    print('\n[2] 源文件变化后重新生成')
+    audio = os.path.join(root, 'charts/audio_c.mp3')
+    with open(audio, 'wb') as f:
+        f.write(os.urandom(310 * 1024))
+    name = bundle.build_chart_bundle(chart)
+    assert name != old_name, '源文件变化后摘要未改变'
+    assert not os.path.exists(bundle.bundle_cache_path(old_name)), '旧缓存未删除'
+    with zipfile.ZipFile(bundle.bundle_cache_path(name)) as zf:
+        assert zf.getinfo('track.mp3').file_size == 310 * 1024
+    print(f'    {old_name} → {name} ✓')
+    return name
+
+
+def test_x_accel(chart, name):
+    print('\n[3] X-Accel-Redirect')
+    with override_settings(CHART_BUNDLE_X_ACCEL=True, CHART_BUNDLE_X_ACCEL_PREFIX='/internal/chart-bundles/'):
+        response = Client().get(url(chart))
+    assert response.status_code == 200
+    assert response['X-Accel-Redirect'] == f'/internal/chart-bundles/{name}', response['X-Accel-Redirect']
+    assert response['Content-Type'] == 'application/zip'
+    assert "filename*=utf-8''" in response['Content-Disposition'], response['Content-Disposition']
+    assert response.content == b''
+    print(f'    {response["X-Accel-Redirect"]} ✓')
+
+
+def test_dev_fallback(chart, name):
+    print('\n[4] 开发服务器直接返回文件')
+    with override_settings(CHART_BUNDLE_X_ACCEL=False):
+        response = Client().get(url(chart))
+        body = b''.join(response.streaming_content)
+    assert response.status_code == 200
+    assert 'X-Accel-Redirect' not in response
+    assert int(response['Content-Length']) == len(body)
+    with open(bundle.bundle_cache_path(name), 'rb') as f:
+        assert body == f.read()
+    print(f'    {len(body)} 字节 ✓')
+
+
+def test_stream_fallback(chart):
+    print('\n[5] 缓存生成失败时流式输出')
+    with mock.patch.object(bundle, 'build_chart_bundle', side_effect=OSError('disk full')), \
+            override_settings(CHART_BUNDLE_X_ACCEL=True):
+        response = Client().get(url(chart))
+        body = b''.join(response.streaming_content)
+    assert response.status_code == 200
+    assert 'X-Accel-Redirect' not in response
+    assert body == b''.join(bundle.iter_chart_bundle(chart))
+    print('    ✓')
+
+
+def test_delete(chart):
+    print('\n[6] 删除谱面时删除缓存')
+    directory = os.path.join(bundle.bundle_cache_root(), str(chart.id))
+    assert os.path.isdir(directory)
+    chart.delete()
+    assert not os.path.exists(directory), '缓存目录未删除'
+    print('    ✓')
+
+
+def main():
+    print('=' * 60)
+    print('谱面资源包缓存测试')
+    print('=' * 60)
+    root = tempfile.mkdtemp(prefix='xmmcg_bundle_cache_')
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(MEDIA_ROOT=root):
+            chart = make_chart(root)
+            name = test_build_and_reuse(chart)
+            name = test_invalidation(chart, name, root)
+            test_x_accel(chart, name)
+            test_dev_fallback(chart, name)
+            test_stream_fallback(chart)
+            test_delete(chart)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(root, ignore_errors=True)
+
+    print('\n' + '=' * 60)
+    print('✓ 全部通过')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+谱面资源包流式生成测试脚本
+
+检查 songs/bundle.py 与 download_chart_bundle 接口：
+1. 生成的 zip 可以正常解压，内容和 CRC 正确；媒体文件为 ZIP_STORED，只有 maidata.txt 为 ZIP_DEFLATED
+2. 读取第一个数据块后就产出第一批字节（不会先读完全部文件）
+3. 用 tracemalloc 统计生成过程的内存峰值，断言其不超过 MEMORY_BOUND（与文件总大小无关）
+4. 通过接口下载时（第一次下载时生成缓存文件再返回）同样满足内存上限
+
+脚本在临时目录中生成测试文件，在临时创建的测试数据库上运行，不会读写开发数据库和 media 目录。
+
+使用方法：
+    python test_chart_bundle_stream.py
+    python test_chart_bundle_stream.py --size-mb 100
+"""
+
+import os
+import zlib
+import random
+import shutil
+import zipfile
+import argparse
+import tempfile
+import tracemalloc
+
+import django
+
+# 设置 Django 环境
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'xmmcg.settings')
+django.setup()
+
+from django.db import connection
+from django.test import Client, override_settings
+
+from songs import bundle
+
+
+# 生成过程允许的内存峰值（字节）
+MEMORY_BOUND = 2 * 1024 * 1024
+
+
+def write_file(path, size, seed):
+    """分块写入 size 字节的伪随机（不可压缩）数据，不在内存中生成整个文件"""
+    block = random.Random(seed).randbytes(64 * 1024)
+    crc = 0
+    with open(path, 'wb') as f:
+        written = 0
+        while written < size:
+            piece = block[:min(len(block), size - written)]
+            f.write(piece)
+            crc = zlib.crc32(piece, crc)
+            written += len(piece)
+    return crc
+
+
+def make_media(root, size_mb):
+    """生成测试文件：maidata.txt（文本）、音频、封面、视频；返回 {相对路径: (大小, CRC)}"""
+    files = {
+        'charts/test/maidata.txt': None,
+        'charts/audio_test.mp3': size_mb * 1024 * 1024 // 2,
+        'charts/cover_test.jpg': 512 * 1024,
+        'charts/video_test.mp4': size_mb * 1024 * 1024 // 2,
+    }
+    info = {}
+    for seed, (rel, size) in enumerate(files.items()):
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if size is None:
+            text = ''.join(f'&inote_{i}=(120){{4}}1,2,3,4,\n' for i in range(5000)).encode()
+            with open(path, 'wb') as f:
+                f.write(text)
+            info[rel] = (len(text), zlib.crc32(text))
+        else:
+            info[rel] = (size, write_file(path, size, seed))
+    return info
+
+
+class CountingFile:
+    """记录已读取字节数的文件包装"""
+
+    def __init__(self, path, counter):
+        self._f = open(path, 'rb')
+        self._counter = counter
+
+    def read(self, n=-1):
+        data = self._f.read(n)
+        self._counter[0] += len(data)
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+def consume(get_chunks, out_path):
+    """开始统计内存后调用 get_chunks() 取得数据块并写到磁盘，返回 (内存峰值, 第一块数据)"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    first = None
+    with open(out_path, 'wb') as out:
+        for chunk in get_chunks():
+            if first is None:
+                first = chunk
+            out.write(chunk)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, first
+
+
+def check_zip(path, info, arcnames):
+    """校验 zip 内容、CRC 和压缩方式"""
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None, 'CRC 校验失败'
+        members = {zi.filename: zi for zi in zf.infolist()}
+        assert set(members) == set(arcnames.values()), f'包内文件不符: {sorted(members)}'
+        for rel, arcname in arcnames.items():
+            zi = members[arcname]
+            size, crc = info[rel]
+            assert (zi.file_size, zi.CRC) == (size, crc), f'{arcname} 内容不符'
+            expected = zipfile.ZIP_DEFLATED if arcname.endswith('.txt') else zipfile.ZIP_STORED
+            assert zi.compress_type == expected, f'{arcname} 压缩方式不符'
+
+
+def test_iter_zip(root, info, out_path):
+    print('\n[1] songs.bundle.iter_zip')
+    counter = [0]
+    arcnames = {
+        'charts/test/maidata.txt': 'maidata.txt',
+        'charts/audio_test.mp3': 'track.mp3',
+        'charts/cover_test.jpg': 'bg.jpg',
+        'charts/video_test.mp4': 'bg.mp4',
+    }
+    entries = [
+        (arcname, lambda p=os.path.join(root, rel): CountingFile(p, counter), info[rel][0])
+        for rel, arcname in arcnames.items()
+    ]
+    chunks = bundle.iter_zip(entries)
+    first = next(chunks)
+    read_before_first = counter[0]
+    assert read_before_first <= bundle.BUNDLE_CHUNK_SIZE, f'产出第一块前读取了 {read_before_first} 字节'
+    print(f'    产出第一块前读取 {read_before_first} 字节 ✓')
+
+    peak, _ = consume(lambda: chunks, out_path + '.rest')
+    with open(out_path, 'wb') as out, open(out_path + '.rest', 'rb') as rest:
+        out.write(first)
+        shutil.copyfileobj(rest, out)
+    check_zip(out_path, info, arcnames)
+    total = sum(size for size, _ in info.values())
+    print(f'    源文件 {total / 1024 / 1024:.1f} MB，zip {os.path.getsize(out_path) / 1024 / 1024:.1f} MB，'
+          f'内存峰值 {peak / 1024:.0f} KB')
+    assert peak <= MEMORY_BOUND, f'内存峰值 {peak} 超过上限 {MEMORY_BOUND}'
+    print('    内容 / 压缩方式 / 内存上限 ✓')
+
+
+def test_view(root, info, out_path):
+    print('\n[2] GET /api/songs/charts/{id}/bundle/')
+    from django.contrib.auth.models import User
+    from songs.models import Song, BiddingRound, Chart
+
+    user = User.objects.create(username='bundle_tester')
+    song = Song.objects.create(user=user, title='Bundle/Test', audio_file='songs/x.mp3', audio_hash='0' * 64, file_size=1)
+    bidding_round = BiddingRound.objects.create(name='bundle', bidding_type='song')
+    chart = Chart.objects.create(bidding_round=bidding_round, user=user, song=song, status='final_submitted')
+    Chart.objects.filter(id=chart.id).update(
+        chart_file='charts/test/maidata.txt',
+        audio_file='charts/audio_test.mp3',
+        cover_image='charts/cover_test.jpg',
+        background_video='charts/video_test.mp4',
+    )
+
+    def request():
+        # 统计范围包含第一次下载时生成资源包缓存
+        response = Client().get(f'/api/songs/charts/{chart.id}/bundle/')
+        assert response.status_code == 200, response.status_code
+        assert response.streaming, '响应不是流式的'
+        assert 'Bundle_Test_chart.zip' in response['Content-Disposition']
+        return response.streaming_content
+
+    with override_settings(MEDIA_ROOT=root, CHART_BUNDLE_X_ACCEL=False):
+        # 预热：先请求一次不存在的谱面，排除首次请求时导入模块的内存
+        Client().get('/api/songs/charts/0/bundle/')
+        peak, _ = consume(request, out_path)
+    check_zip(out_path, info, {
+        'charts/test/maidata.txt': 'maidata.txt',
+        'charts/audio_test.mp3': 'track.mp3',
+        'charts/cover_test.jpg': 'bg.jpg',
+        'charts/video_test.mp4': 'bg.mp4',
+    })
+    print(f'    内存峰值 {peak / 1024:.0f} KB')
+    assert peak <= MEMORY_BOUND, f'内存峰值 {peak} 超过上限 {MEMORY_BOUND}'
+    print('    流式响应 / 内容 / 内存上限 ✓')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='谱面资源包流式生成测试')
+    parser.add_argument('--size-mb', type=int, default=60, help='音频 + 视频的总大小（MB）')
+    args = parser.parse_args()
+
+    print('=' * 60)
+    print('谱面资源包流式生成测试')
+    print('=' * 60)
+    root = tempfile.mkdtemp(prefix='xmmcg_bundle_')
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        info = make_media(root, args.size_mb)
+        out_path = os.path.join(root, 'out.zip')
+        test_iter_zip(root, info, out_path)
+        test_view(root, info, out_path)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(root, ignore_errors=True)
+
+    print('\n' + '=' * 60)
+    print('✓ 全部通过')
+
+
+if __name__ == '__main__':
+    main()
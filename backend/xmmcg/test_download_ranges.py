@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+下载接口的条件请求与断点续传测试脚本
+
+检查 songs/downloads.py 与 download_chart_bundle / 开发服务器 /media/：
+1. 完整下载返回 ETag、Accept-Ranges、Content-Length
+2. If-None-Match 命中返回 304（资源包不会被重新生成）
+3. Range（a-b、a-、-n）返回 206 和对应字节，超出范围返回 416，多段 Range 返回完整文件
+4. If-Range 与 ETag 相同时返回 206，不同时返回完整文件
+5. X-Accel 模式下同样返回 ETag 并处理 If-None-Match
+6. /media/ 的 ETag 为文件内容哈希，文件变化后 ETag 改变；路径越界返回 404
+
+脚本在临时目录中生成测试文件，在临时创建的测试数据库上运行，不会读写开发数据库和 media 目录。
+
+使用方法：
+    python test_download_ranges.py
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+from unittest import mock
+
+import django
+
+# 设置 Django 环境
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'xmmcg.settings')
+django.setup()
+
+from django.db import connection
+from django.http import Http404
+from django.test import Client, RequestFactory, override_settings
+
+from songs import bundle, downloads
+
+
+def make_chart(root):
+    """在 root 下生成谱面文件并创建谱面"""
+    from django.contrib.auth.models import User
+    from songs.models import Song, BiddingRound, Chart
+
+    files = {
+        'charts/r/maidata.txt': b'&title=Range\n',
+        'charts/audio_r.mp3': os.urandom(200 * 1024),
+    }
+    for rel, data in files.items():
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    user = User.objects.create(username='range_tester')
+    song = Song.objects.create(user=user, title='Range', audio_file='songs/x.mp3', audio_hash='2' * 64, file_size=1)
+    bidding_round = BiddingRound.objects.create(name='range', bidding_type='song')
+    chart = Chart.objects.create(bidding_round=bidding_round, user=user, song=song, status='final_submitted')
+    Chart.objects.filter(id=chart.id).update(chart_file='charts/r/maidata.txt', audio_file='charts/audio_r.mp3')
+    return Chart.objects.select_related('song').get(id=chart.id)
+
+
+def body(response):
+    return b''.join(response.streaming_content) if response.streaming else response.content
+
+
+def test_bundle(chart):
+    print('\n[1] 资源包：完整下载 / 304 / Range / If-Range')
+    url = f'/api/songs/charts/{chart.id}/bundle/'
+    client = Client()
+
+    response = client.get(url)
+    full = body(response)
+    etag = response['ETag']
+    assert response.status_code == 200
+    assert response['Accept-Ranges'] == 'bytes'
+    assert int(response['Content-Length']) == len(full)
+    assert etag == bundle.bundle_etag(bundle.chart_bundle_name(chart))
+    print(f'    200 {len(full)} 字节，ETag {etag} ✓')
+
+    with mock.patch.object(bundle, 'build_chart_bundle', side_effect=AssertionError('304 时不应生成资源包')):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304, response.status_code
+    assert response['ETag'] == etag and response.content == b''
+    assert client.get(url, HTTP_IF_NONE_MATCH='"other"').status_code == 200
+    print('    If-None-Match → 304 ✓')
+
+    size = len(full)
+    cases = [
+        ('bytes=0-99', 0, 99),
+        ('bytes=1000-', 1000, size - 1),
+        ('bytes=-500', size - 500, size - 1),
+        (f'bytes=100-{size * 2}', 100, size - 1),
+    ]
+    for header, start, end in cases:
+        response = client.get(url, HTTP_RANGE=header)
+        data = body(response)
+        assert response.status_code == 206, (header, response.status_code)
+        assert response['Content-Range'] == f'bytes {start}-{end}/{size}', response['Content-Range']
+        assert int(response['Content-Length']) == end - start + 1
+        assert data == full[start:end + 1], header
+    print('    Range a-b / a- / -n / 越界截断 → 206 ✓')
+
+    response = client.get(url, HTTP_RANGE=f'bytes={size}-')
+    assert response.status_code == 416 and response['Content-Range'] == f'bytes */{size}'
+    response = client.get(url, HTTP_RANGE='bytes=0-1,5-9')
+    assert response.status_code == 200 and body(response) == full
+    print('    416 / 多段 Range → 完整文件 ✓')
+
+    response = client.get(url, HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE=etag)
+    assert response.status_code == 206 and body(response) == full[1000:]
+    response = client.get(url, HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE='"stale"')
+    assert response.status_code == 200 and body(response) == full
+    response = client.get(url, HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE='W/' + etag)
+    assert response.status_code == 200
+    print('    If-Range 相同 → 206，不同 / 弱 ETag → 200 ✓')
+    return etag
+
+
+def test_bundle_x_accel(chart, etag):
+    print('\n[2] 资源包（X-Accel 模式）')
+    url = f'/api/songs/charts/{chart.id}/bundle/'
+    with override_settings(CHART_BUNDLE_X_ACCEL=True):
+        response = Client().get(url)
+        assert response.status_code == 200 and response['ETag'] == etag
+        assert response['X-Accel-Redirect'].endswith(bundle.chart_bundle_name(chart))
+        response = Client().get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304 and 'X-Accel-Redirect' not in response
+    print('    ETag / 304 ✓')
+
+
+def test_media(root):
+    print('\n[3] /media/')
+    factory = RequestFactory()
+    rel = 'charts/audio_r.mp3'
+    path = os.path.join(root, rel)
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    response = downloads.serve_media(factory.get('/media/' + rel), rel)
+    etag = response['ETag']
+    assert response.status_code == 200 and body(response) == data
+    assert etag == '"' + hashlib.sha256(data).hexdigest()[:32] + '"', etag
+    assert response['Content-Type'] == 'audio/mpeg'
+
+    response = downloads.serve_media(factory.get('/media/' + rel, HTTP_IF_NONE_MATCH=etag), rel)
+    assert response.status_code == 304
+    response = downloads.serve_media(factory.get('/media/' + rel, HTTP_RANGE='bytes=10-19'), rel)
+    assert response.status_code == 206 and body(response) == data[10:20]
+    print('    ETag = 内容哈希 / 304 / 206 ✓')
+
+    with open(path, 'ab') as f:
+        f.write(b'more')
+    response = downloads.serve_media(factory.get('/media/' + rel, HTTP_IF_NONE_MATCH=etag), rel)
+    assert response.status_code == 200 and response['ETag'] != etag
+    print('    文件变化后 ETag 改变 ✓')
+
+    for bad in ('../secret.txt', 'charts', 'missing.mp3'):
+        try:
+            downloads.serve_media(factory.get('/media/' + bad), bad)
+        except Http404:
+            continue
+        raise AssertionError(f'{bad} 应返回 404')
+    print('    越界 / 目录 / 不存在 → 404 ✓')
+
+
+def main():
+    print('=' * 60)
+    print('下载接口条件请求与断点续传测试')
+    print('=' * 60)
+    root = tempfile.mkdtemp(prefix='xmmcg_ranges_')
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(MEDIA_ROOT=root, CHART_BUNDLE_X_ACCEL=False):
+            chart = make_chart(root)
+            etag = test_bundle(chart)
+            test_bundle_x_accel(chart, etag)
+            test_media(root)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(root, ignore_errors=True)
+
+    print('\n' + '=' * 60)
+    print('✓ 全部通过')
+
+
+if __name__ == '__main__':
+    main()
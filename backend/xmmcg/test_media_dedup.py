@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+"""
+内容寻址媒体存储测试脚本
+
+检查 songs/media_store.py 与 Song / Chart 的引用计数：
+1. 上传的音频 / 封面保存为 blobs/<前两位>/<sha256>.<扩展名>，与 audio_hash 一致
+2. 相同内容的歌曲、谱面共用同一个文件，MediaBlob.ref_count 正确
+3. 替换文件字段时释放旧文件的引用
+4. 删除歌曲 / 谱面时只在最后一个引用删除时删除文件；事务回滚时引用数和文件不变
+5. dedupe_media：旧的 uuid 文件迁移为 blob（相同内容合并），重算引用数修复批量删除造成的偏差
+6. 引用数归零后、删除前又被复用的文件不会被删除；--prune 清理归零未删的记录，不删除刚上传尚无记录的文件；
+   重算时报告仍被引用但文件缺失的 blob
+7. 删除歌曲时一并释放级联删除的谱面的文件引用，删除谱面文件和资源包缓存
+
+脚本在临时目录中生成测试文件，在临时创建的测试数据库上运行，不会读写开发数据库和 media 目录。
+
+使用方法：
+    python test_media_dedup.py
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+import django
+
+# 设置 Django 环境
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'xmmcg.settings')
+django.setup()
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+
+from songs import media_store
+from songs.utils import calculate_file_hash
+
+
+AUDIO = os.urandom(256 * 1024)
+COVER = os.urandom(16 * 1024)
+
+
+def ref_count(name):
+    from songs.models import MediaBlob
+    return MediaBlob.objects.filter(name=name).values_list('ref_count', flat=True).first() or 0
+
+
+def exists(name):
+    return media_store.media_storage.exists(name)
+
+
+def create_song(user, title, audio=AUDIO, cover=COVER):
+    from songs.models import Song
+    audio_file = SimpleUploadedFile('song.MP3', audio)
+    return Song.objects.create(
+        user=user,
+        title=title,
+        audio_file=audio_file,
+        cover_image=SimpleUploadedFile('cover.jpg', cover) if cover else None,
+        audio_hash=calculate_file_hash(audio_file),
+        file_size=len(audio),
+    )
+
+
+def create_chart(user, song, bidding_round, audio=AUDIO):
+    from songs.models import Chart
+    return Chart.objects.create(
+        bidding_round=bidding_round, user=user, song=song, status='part_submitted',
+        audio_file=SimpleUploadedFile('track.mp3', audio),
+        cover_image=SimpleUploadedFile('bg.jpg', COVER),
+    )
+
+
+def test_dedup(user, bidding_round):
+    print('\n[1] 相同内容只保存一次')
+    song_a = create_song(user, 'A')
+    audio_name = song_a.audio_file.name
+    digest = hashlib.sha256(AUDIO).hexdigest()
+    assert audio_name == f'blobs/{digest[:2]}/{digest}.mp3', audio_name
+    assert song_a.audio_hash == digest
+    assert ref_count(audio_name) == 1
+
+    song_b = create_song(user, 'B')
+    chart = create_chart(user, song_a, bidding_round)
+    assert song_b.audio_file.name == chart.audio_file.name == audio_name
+    assert chart.cover_image.name == song_a.cover_image.name
+    assert ref_count(audio_name) == 3 and ref_count(song_a.cover_image.name) == 3
+    blob_files = [f for _, _, files in os.walk(media_store.media_storage.path('blobs/' + digest[:2])) for f in files]
+    assert blob_files == [f'{digest}.mp3'], blob_files
+    print(f'    3 个引用共用 {audio_name} ✓')
+    return song_a, song_b, chart
+
+
+def test_replace(user):
+    print('\n[2] 替换文件时释放旧引用')
+    from songs.models import Song
+    song = create_song(user, 'C', audio=os.urandom(1024), cover=None)
+    old_name = song.audio_file.name
+    song = Song.objects.get(id=song.id)
+    song.audio_file = SimpleUploadedFile('new.ogg', os.urandom(2048))
+    song.save()
+    assert song.audio_file.name.endswith('.ogg') and ref_count(song.audio_file.name) == 1
+    assert ref_count(old_name) == 0 and not exists(old_name), '旧文件应被删除'
+
+    # 只更新其他字段不影响引用
+    song.title = 'C2'
+    song.save(update_fields=['title'])
+    Song.objects.only('id', 'title').get(id=song.id).save()
+    assert ref_count(song.audio_file.name) == 1
+    print('    ✓')
+    song.delete()
+    assert not exists(song.audio_file.name)
+
+
+def test_delete(song_a, song_b, chart):
+    print('\n[3] 删除时只在最后一个引用删除文件')
+    from songs.models import Chart
+    audio_name = song_a.audio_file.name
+    cover_name = song_a.cover_image.name
+
+    chart_id = chart.id
+    try:
+        with transaction.atomic():
+            chart.delete()
+            raise RuntimeError('rollback')
+    except RuntimeError:
+        pass
+    assert ref_count(audio_name) == 3 and exists(audio_name), '回滚后引用数和文件应不变'
+    chart = Chart.objects.get(id=chart_id)
+
+    chart.delete()
+    assert ref_count(audio_name) == 2 and exists(audio_name)
+    song_b.delete()
+    assert ref_count(audio_name) == 1 and exists(audio_name)
+    assert ref_count(cover_name) == 1 and exists(cover_name)
+    song_a.delete()
+    assert ref_count(audio_name) == 0 and not exists(audio_name)
+    assert not exists(cover_name)
+    print('    3 → 2 → 1 → 0（文件删除）✓')
+
+
+def test_legacy_migration(user, bidding_round, root):
+    print('\n[4] dedupe_media 迁移旧文件并重算引用数')
+    from songs.models import Song, Chart
+
+    song = create_song(user, 'Legacy', cover=None)
+    chart = create_chart(user, song, bidding_round)
+    legacy = {'songs/audio_user1_aaaa.mp3': AUDIO, 'charts/audio_user1_song1_bbbb.mp3': AUDIO}
+    for rel, data in legacy.items():
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+    Song.objects.filter(id=song.id).update(audio_file='songs/audio_user1_aaaa.mp3')
+    Chart.objects.filter(id=chart.id).update(audio_file='charts/audio_user1_song1_bbbb.mp3')
+
+    call_command('dedupe_media', '--dry-run', stdout=open(os.devnull, 'w'))
+    assert Song.objects.get(id=song.id).audio_file.name == 'songs/audio_user1_aaaa.mp3'
+
+    call_command('dedupe_media', '--prune', stdout=open(os.devnull, 'w'))
+    song = Song.objects.get(id=song.id)
+    chart = Chart.objects.get(id=chart.id)
+    assert media_store.is_blob_name(song.audio_file.name)
+    assert song.audio_file.name == chart.audio_file.name
+    assert ref_count(song.audio_file.name) == 2
+    assert not any(os.path.exists(os.path.join(root, rel)) for rel in legacy), '旧文件应被删除'
+    print(f'    2 个旧文件 → {song.audio_file.name}（引用 2）✓')
+
+    # 批量删除绕过 Chart.delete()，重算后修正
+    Chart.objects.filter(id=chart.id).delete()
+    assert ref_count(song.audio_file.name) == 2
+    call_command('dedupe_media', '--recount-only', stdout=open(os.devnull, 'w'))
+    assert ref_count(song.audio_file.name) == 1
+    Song.objects.filter(id=song.id).delete()
+    call_command('dedupe_media', '--recount-only', stdout=open(os.devnull, 'w'))
+    assert ref_count(song.audio_file.name) == 0 and not exists(song.audio_file.name)
+    print('    批量删除后重算引用数 2 → 1 → 0 ✓')
+
+
+def test_release_races(user):
+    print('\n[5] 引用数归零与复用、清理')
+    from songs.models import Song, MediaBlob
+    audio = os.urandom(4096)
+
+    # 同一事务中引用数归零后又被复用：提交后的删除在行锁下重新确认，文件保留
+    song = create_song(user, 'Race', audio=audio, cover=None)
+    name = song.audio_file.name
+    with transaction.atomic():
+        song.delete()
+        assert MediaBlob.objects.get(name=name).ref_count == 0, '归零后记录保留到提交后删除'
+        again = create_song(user, 'Race2', audio=audio, cover=None)
+    assert again.audio_file.name == name and ref_count(name) == 1 and exists(name)
+    print('    归零后复用 → 文件保留 ✓')
+
+    # 归零但未删除的记录（删除前进程退出）由 --prune 清理；刚写入、尚无记录的 blob 不删除
+    MediaBlob.objects.filter(name=name).update(ref_count=0)
+    Song.objects.filter(id=again.id).update(audio_file='')
+    fresh = media_store.media_storage.save('x.bin', SimpleUploadedFile('x.bin', os.urandom(100)))
+    assert not MediaBlob.objects.filter(name=fresh).exists()
+    call_command('dedupe_media', '--recount-only', '--prune', stdout=open(os.devnull, 'w'))
+    assert not MediaBlob.objects.filter(name=name).exists() and not exists(name)
+    assert exists(fresh), '刚写入的 blob 不应被当作孤儿删除'
+    print('    --prune 清理归零记录，保留新文件 ✓')
+
+    # 仍被引用但文件缺失：重算时报告
+    song = create_song(user, 'Missing', audio=os.urandom(2048), cover=None)
+    os.remove(media_store.media_storage.path(song.audio_file.name))
+    result = media_store.recount_references()
+    assert result['missing'] == [song.audio_file.name], result['missing']
+    print('    文件缺失 → 报告 ✓')
+
+
+def test_song_cascade(user, bidding_round):
+    print('\n[6] 删除歌曲时释放级联删除的谱面的引用')
+    from songs.bundle import bundle_cache_root
+    from songs.models import Song, Chart
+    audio = os.urandom(3072)
+    song = create_song(user, 'Cascade', audio=audio)
+    chart = create_chart(user, song, bidding_round, audio=audio)
+    chart.chart_file = SimpleUploadedFile('maidata.txt', b'&title=Cascade')
+    chart.save()
+    audio_name, cover_name, chart_file = song.audio_file.name, song.cover_image.name, chart.chart_file.name
+    bundle_dir = os.path.join(bundle_cache_root(), str(chart.id))
+    os.makedirs(bundle_dir, exist_ok=True)
+    open(os.path.join(bundle_dir, 'bundle.zip'), 'wb').close()
+    assert ref_count(audio_name) == 2
+
+    try:
+        with transaction.atomic():
+            song.delete()
+            raise RuntimeError('rollback')
+    except RuntimeError:
+        pass
+    assert ref_count(audio_name) == 2 and exists(audio_name), '回滚后引用数和文件应不变'
+    assert exists(chart_file) and os.path.exists(bundle_dir)
+
+    song = Song.objects.get(id=chart.song_id)
+    song.delete()
+    assert not Chart.objects.filter(id=chart.id).exists()
+    assert ref_count(audio_name) == 0 and not exists(audio_name)
+    assert not exists(cover_name) and not exists(chart_file)
+    assert not os.path.exists(bundle_dir)
+    print('    歌曲 + 谱面 2 → 0（文件、谱面文件、资源包缓存删除）✓')
+
+
+def main():
+    print('=' * 60)
+    print('内容寻址媒体存储测试')
+    print('=' * 60)
+    root = tempfile.mkdtemp(prefix='xmmcg_media_')
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(MEDIA_ROOT=root):
+            from django.contrib.auth.models import User
+            from songs.models import BiddingRound
+            user = User.objects.create(username='media_tester')
+            bidding_round = BiddingRound.objects.create(name='media', bidding_type='song')
+            song_a, song_b, chart = test_dedup(user, bidding_round)
+            test_replace(user)
+            test_delete(song_a, song_b, chart)
+            test_legacy_migration(user, bidding_round, root)
+            test_release_races(user)
+            test_song_cascade(user, bidding_round)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(root, ignore_errors=True)
+
+    print('\n' + '=' * 60)
+    print('✓ 全部通过')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+热点查询执行计划测试脚本
+对竞标、分配结果、谱面、互评任务的热点查询执行 EXPLAIN（SQLite 为 EXPLAIN QUERY PLAN），
+输出执行计划报告，并检查每条查询都通过索引访问主表，而不是全表扫描。
+
+脚本在临时创建的测试数据库上运行（迁移全部应用后为空表），不会读写开发数据库。
+
+使用方法：
+    python test_query_plans.py
+"""
+
+import os
+import re
+import sys
+import django
+
+# 设置 Django 环境
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'xmmcg.settings')
+django.setup()
+
+from django.db import connection
+from django.db.models import OuterRef, Exists
+
+
+def hot_queries():
+    """热点查询：(名称, 主表, QuerySet)"""
+    from songs.models import Bid, BidResult, Chart, PeerReviewAllocation
+
+    round_id, user_id, song_id, chart_id = 1, 1, 1, 1
+    part_two_exists = Chart.objects.filter(part_one_chart=OuterRef('pk'), is_part_one=False)
+    return [
+        ('用户在某轮的未撤回竞标', 'songs_bid',
+         Bid.objects.filter(bidding_round_id=round_id, user_id=user_id, is_dropped=False)),
+        ('用户在某轮的全部竞标', 'songs_bid',
+         Bid.objects.filter(bidding_round_id=round_id, user_id=user_id)),
+        ('歌曲在某轮收到的有效竞标', 'songs_bid',
+         Bid.objects.filter(bidding_round_id=round_id, song_id=song_id, is_dropped=False)),
+        ('谱面在某轮收到的有效竞标', 'songs_bid',
+         Bid.objects.filter(bidding_round_id=round_id, chart_id=chart_id, is_dropped=False)),
+        ('重复竞标检查', 'songs_bid',
+         Bid.objects.filter(bidding_round_id=round_id, user_id=user_id, song_id=song_id, is_dropped=False)),
+        ('某轮全部有效竞标（分配快照）', 'songs_bid',
+         Bid.objects.filter(bidding_round_id=round_id, is_dropped=False, bid_type='song')),
+        ('用户在某轮的分配结果', 'songs_bidresult',
+         BidResult.objects.filter(bidding_round_id=round_id, user_id=user_id)),
+        ('半成品谱面', 'songs_chart',
+         Chart.objects.filter(status='part_submitted')),
+        ('可竞标的第一部分谱面', 'songs_chart',
+         Chart.objects.filter(
+             is_part_one=True,
+             status__in=['submitted', 'reviewed', 'part_submitted']
+         ).exclude(Exists(part_two_exists))),
+        ('某轮可评分谱面', 'songs_chart',
+         Chart.objects.filter(
+             bidding_round_id=round_id,
+             status__in=['final_submitted', 'submitted', 'under_review', 'reviewed']
+         )),
+        ('评分者的待评分任务', 'songs_peerreviewallocation',
+         PeerReviewAllocation.objects.filter(reviewer_id=user_id, status='pending')),
+    ]
+
+
+def full_scans(plan, table):
+    """执行计划中对主表的全表扫描（SQLite 的 'SCAN <table>' 且未使用索引）"""
+    return [
+        line for line in plan.splitlines()
+        if re.search(rf'\bSCAN {table}\b', line) and 'INDEX' not in line
+    ]
+
+
+def main():
+    print('=' * 70)
+    print('热点查询执行计划')
+    print('=' * 70)
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    failures = []
+    try:
+        for name, table, queryset in hot_queries():
+            plan = queryset.explain()
+            print(f'\n[{name}]')
+            for line in plan.splitlines():
+                print(f'    {line}')
+            if connection.vendor == 'sqlite' and full_scans(plan, table):
+                failures.append(name)
+                print('    ✗ 全表扫描')
+            else:
+                print('    ✓ 使用索引')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print('\n' + '=' * 70)
+    if failures:
+        print(f'✗ {len(failures)} 条查询未使用索引: {", ".join(failures)}')
+        sys.exit(1)
+    print('✓ 所有热点查询均使用索引')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+轮次排名快照测试脚本
+
+检查 songs/ranking.py 与 GET /api/songs/rankings/<round_id>/：
+1. 第一次请求生成 RoundRanking 快照，之后的请求读取快照 / 缓存
+2. 第一次请求之后再提交评分（单条、批量、修改额外评分），排名随之更新，不会一直返回最初的快照
+3. 事务回滚的评分提交不删除快照
+4. 评分者偏差分析（songs/review_analysis.py）的缓存在修改额外评分后失效
+5. 缓存后端为各进程共用（settings.CACHES），删除缓存对所有 worker 生效
+6. 真爱票排行榜（songs/favorites.py）在真爱票变化的事务提交后更新，回滚时保留缓存
+
+脚本在临时创建的测试数据库上运行，不会读写开发数据库。
+
+使用方法：
+    python test_round_ranking.py
+"""
+
+import os
+
+import django
+
+# 设置 Django 环境
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'xmmcg.settings')
+django.setup()
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client, override_settings
+
+
+def make_round():
+    """创建一轮互评：2 张已评分完成的谱面，3 个评分者，每人对每张谱面各一个分配任务"""
+    from django.contrib.auth.models import User
+    from songs.models import BiddingRound, Song, Chart, PeerReviewAllocation
+
+    bidding_round = BiddingRound.objects.create(name='ranking', bidding_type='song')
+    charts = []
+    for i in range(2):
+        author = User.objects.create(username=f'author{i}')
+        song = Song.objects.create(user=author, title=f'Song{i}', audio_file='songs/x.mp3',
+                                   audio_hash=str(i) * 64, file_size=1)
+        charts.append(Chart.objects.create(bidding_round=bidding_round, user=author, song=song, status='reviewed'))
+    reviewers = [User.objects.create(username=f'reviewer{i}') for i in range(3)]
+    allocations = {
+        (reviewer.id, chart.id): PeerReviewAllocation.objects.create(
+            bidding_round=bidding_round, reviewer=reviewer, chart=chart
+        )
+        for reviewer in reviewers for chart in charts
+    }
+    return bidding_round, charts, reviewers, allocations
+
+
+def get_ranking(client, bidding_round):
+    response = client.get(f'/api/songs/rankings/{bidding_round.id}/', {'method': 'mean'})
+    assert response.status_code == 200, response.status_code
+    return [(entry['chart_id'], entry['score']) for entry in response.json()['rankings']]
+
+
+def main():
+    print('=' * 60)
+    print('轮次排名快照测试')
+    print('=' * 60)
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    cache.clear()
+    try:
+        with override_settings(PEER_REVIEW_EXTRA_REVIEW_POLICY='include', ROUND_RANKING_EXCLUDE_FLAGS=()):
+            from songs.bidding_service import PeerReviewService
+            from songs.models import RoundRanking
+
+            bidding_round, (c1, c2), (r1, r2, r3), allocations = make_round()
+            client = Client()
+            client.force_login(r3)
+
+            print('\n[1] 第一次请求生成快照')
+            PeerReviewService.submit_peer_review(allocations[(r1.id, c1.id)].id, 40)
+            PeerReviewService.submit_peer_review(allocations[(r1.id, c2.id)].id, 20)
+            assert get_ranking(client, bidding_round) == [(c1.id, 40.0), (c2.id, 20.0)]
+            assert RoundRanking.objects.filter(bidding_round=bidding_round).exists()
+            print('    ✓')
+
+            print('\n[2] 之后提交的评分更新排名')
+            PeerReviewService.submit_peer_review(allocations[(r2.id, c1.id)].id, 0)
+            # 平均分相同时评分数多的在前
+            assert get_ranking(client, bidding_round) == [(c1.id, 20.0), (c2.id, 20.0)]
+            PeerReviewService.submit_peer_reviews(r2, [{'allocation_id': allocations[(r2.id, c2.id)].id, 'score': 50}])
+            assert get_ranking(client, bidding_round) == [(c2.id, 35.0), (c1.id, 20.0)]
+            print('    单条 / 批量提交 ✓')
+
+            PeerReviewService.submit_extra_peer_review(r3, c1, 50)
+            assert get_ranking(client, bidding_round) == [(c2.id, 35.0), (c1.id, 30.0)]
+            PeerReviewService.submit_extra_peer_review(r3, c1, 5)
+            assert get_ranking(client, bidding_round) == [(c2.id, 35.0), (c1.id, 15.0)]
+            print('    额外评分新建 / 修改 ✓')
+
+            print('\n[3] 回滚的提交不删除快照')
+            computed_at = client.get(f'/api/songs/rankings/{bidding_round.id}/').json()['computed_at']
+            try:
+                with transaction.atomic():
+                    PeerReviewService.submit_peer_review(allocations[(r3.id, c2.id)].id, 0)
+                    raise RuntimeError('rollback')
+            except RuntimeError:
+                pass
+            assert client.get(f'/api/songs/rankings/{bidding_round.id}/').json()['computed_at'] == computed_at
+            assert get_ranking(client, bidding_round) == [(c2.id, 35.0), (c1.id, 15.0)]
+            print('    ✓')
+
+            print('\n[4] 修改额外评分后评分者分析不再返回旧结果')
+            from songs.review_analysis import get_round_analysis
+
+            def extra_mean():
+                rows = get_round_analysis(bidding_round)['reviewers']
+                return next(row['mean'] for row in rows if row['reviewer_id'] == r3.id)
+
+            assert extra_mean() == 5
+            PeerReviewService.submit_extra_peer_review(r3, c1, 45)
+            assert extra_mean() == 45
+            print('    ✓')
+
+            print('\n[5] 缓存后端为各进程共用')
+            from django.core.cache import caches
+            from django.core.cache.backends.locmem import LocMemCache
+            backend = caches['default']
+            assert not isinstance(backend, LocMemCache), '进程内缓存无法让其他 worker 看到失效'
+            print(f'    {type(backend).__name__} ✓')
+
+            print('\n[6] 真爱票变化后排行榜更新')
+
+            def leaderboard():
+                response = client.get(f'/api/songs/rankings/{bidding_round.id}/favorites/')
+                assert response.status_code == 200, response.status_code
+                body = response.json()
+                return body['computed_at'], [(e['chart_id'], e['favorite_count']) for e in body['leaderboard']]
+
+            computed_at, entries = leaderboard()
+            assert entries == []
+            try:
+                with transaction.atomic():
+                    PeerReviewService.submit_peer_review(allocations[(r3.id, c2.id)].id, 30, favorite=True)
+                    raise RuntimeError('rollback')
+            except RuntimeError:
+                pass
+            assert leaderboard() == (computed_at, []), '回滚的提交不应清除缓存'
+            PeerReviewService.submit_peer_review(allocations[(r3.id, c2.id)].id, 30, favorite=True)
+            assert leaderboard()[1] == [(c2.id, 1)]
+            PeerReviewService.submit_extra_peer_review(r3, c1, 45, favorite=True)
+            # 同票按平均分降序：c2 (20+50+30)/3 > c1 (40+0+45)/3
+            assert leaderboard()[1] == [(c2.id, 1), (c1.id, 1)]
+            print('    ✓')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print('\n' + '=' * 60)
+    print('✓ 全部通过')
+
+
+if __name__ == '__main__':
+    main()
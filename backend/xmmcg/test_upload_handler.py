@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+上传处理器测试脚本
+
+检查 songs/upload_handlers.py（settings.FILE_UPLOAD_HANDLERS）：
+1. 上传文件写入临时文件（TemporaryUploadedFile），file.sha256 与内容的 SHA-256 一致
+2. 超过字段大小限制时在接收过程中停止写入并删除临时文件，其他字段正常解析
+3. 扩展名不允许的文件不接收；拒绝后面的文件不影响前面已接收的文件
+4. 上传歌曲接口：被拒绝的文件返回 400 和原因；正常上传时 audio_hash 直接使用上传时计算的哈希，
+   保存为 blob 时不再读取文件内容
+
+脚本在临时目录中保存上传文件，在临时创建的测试数据库上运行，不会读写开发数据库和 media 目录。
+
+使用方法：
+    python test_upload_handler.py
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+from unittest import mock
+
+import django
+
+# 设置 Django 环境
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'xmmcg.settings')
+django.setup()
+
+from django.core.files.base import File
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.db import connection
+from django.test import Client, RequestFactory, override_settings
+
+from songs import media_store
+from songs.upload_handlers import HashingFileUploadHandler
+
+
+AUDIO = os.urandom(300 * 1024)
+
+
+def parse(data):
+    """用 RequestFactory 构造 multipart 请求并解析，返回 (request, handler)"""
+    request = RequestFactory().post('/api/songs/', data)
+    request.FILES  # 触发解析
+    handler = request.upload_handlers[0]
+    assert isinstance(handler, HashingFileUploadHandler), type(handler)
+    return request, handler
+
+
+def test_hash_and_temp_file():
+    print('\n[1] 写入临时文件并计算哈希')
+    request, _ = parse({'title': 'T', 'audio_file': SimpleUploadedFile('song.mp3', AUDIO)})
+    uploaded = request.FILES['audio_file']
+    assert isinstance(uploaded, TemporaryUploadedFile), type(uploaded)
+    assert os.path.exists(uploaded.temporary_file_path())
+    assert uploaded.size == len(AUDIO)
+    assert uploaded.sha256 == hashlib.sha256(AUDIO).hexdigest()
+    assert uploaded.read() == AUDIO
+    assert request.POST['title'] == 'T'
+    assert not getattr(request, 'upload_errors', None)
+    uploaded.close()
+    print(f'    {uploaded.size} 字节 → {uploaded.temporary_file_path()} ✓')
+
+
+def test_size_limit():
+    print('\n[2] 超过大小限制时提前停止')
+    limit = 1024 * 1024
+    written = []
+
+    def spy_write(self, data):
+        written.append(len(data))
+        return self.file.write(data)
+
+    with override_settings(MAX_VIDEO_SIZE_BYTES=limit), \
+            mock.patch.object(TemporaryUploadedFile, 'write', spy_write, create=True):
+        request, handler = parse({
+            'background_video': SimpleUploadedFile('bg.mp4', os.urandom(3 * 1024 * 1024)),
+            'title': 'after',
+            'cover_image': SimpleUploadedFile('cover.jpg', b'x' * 100),
+        })
+    assert 'background_video' not in request.FILES
+    assert request.upload_errors == {'background_video': ['背景视频过大，最大允许 1MB']}, request.upload_errors
+    assert sum(written) <= limit, sum(written)
+    assert request.POST['title'] == 'after'
+    assert request.FILES['cover_image'].read() == b'x' * 100
+    print(f'    3MB 视频只写入 {sum(written)} 字节即被拒绝，后面的字段正常解析 ✓')
+
+    # 被拒绝文件的临时文件已删除
+    request, handler = parse({'audio_file': SimpleUploadedFile('song.mp3', os.urandom(11 * 1024 * 1024))})
+    assert 'audio_file' not in request.FILES
+    assert request.upload_errors['audio_file'] == ['音频文件过大，最大允许 10MB']
+    assert not os.path.exists(handler.file.temporary_file_path())
+    print('    临时文件已删除 ✓')
+
+
+def test_extension():
+    print('\n[3] 不允许的扩展名')
+    request, _ = parse({
+        'audio_file': SimpleUploadedFile('song.mp3', AUDIO),
+        'cover_image': SimpleUploadedFile('cover.exe', b'MZ'),
+        'other': SimpleUploadedFile('notes.exe', b'free field'),
+    })
+    assert 'cover_image' not in request.FILES
+    assert request.upload_errors == {
+        'cover_image': ['不支持的图片格式: exe，允许的格式: jpg, jpeg, png, gif, webp'],
+    }, request.upload_errors
+    # 拒绝后面的文件不会关闭前面已接收的文件；没有限制的字段不检查
+    assert request.FILES['audio_file'].read() == AUDIO
+    assert request.FILES['other'].read() == b'free field'
+    print('    ✓')
+
+
+def test_upload_view():
+    print('\n[4] 上传歌曲接口')
+    from django.contrib.auth.models import User
+    from songs.models import Song
+
+    client = Client()
+    client.force_login(User.objects.create(username='upload_tester'))
+
+    response = client.post('/api/songs/', {
+        'title': 'Too big',
+        'audio_file': SimpleUploadedFile('song.mp3', os.urandom(11 * 1024 * 1024)),
+    })
+    assert response.status_code == 400, response.status_code
+    assert response.json()['errors'] == {'audio_file': ['音频文件过大，最大允许 10MB']}, response.json()
+    response = client.post('/api/songs/', {
+        'title': 'Bad', 'audio_file': SimpleUploadedFile('song.exe', AUDIO),
+    })
+    assert response.status_code == 400 and 'audio_file' in response.json()['errors']
+    assert not Song.objects.exists()
+    print('    超过限制 / 格式不支持 → 400 ✓')
+
+    # 上传后不再读取文件内容计算哈希（File.chunks / read 均不应被调用）
+    with mock.patch.object(File, 'chunks', side_effect=AssertionError('不应重新读取上传文件')), \
+            mock.patch.object(TemporaryUploadedFile, 'read', side_effect=AssertionError('不应重新读取上传文件'),
+                              create=True):
+        response = client.post('/api/songs/', {
+            'title': 'Ok', 'audio_file': SimpleUploadedFile('song.mp3', AUDIO),
+        })
+    assert response.status_code == 201, response.content
+    song = Song.objects.get(title='Ok')
+    digest = hashlib.sha256(AUDIO).hexdigest()
+    assert song.audio_hash == digest and song.file_size == len(AUDIO)
+    assert song.audio_file.name == media_store.blob_name(digest, '.mp3'), song.audio_file.name
+    with song.audio_file.open('rb') as f:
+        assert f.read() == AUDIO
+    print('    201，audio_hash 与 blob 路径使用上传时计算的哈希 ✓')
+
+    # 相同内容再次上传：blob 已存在，直接复用
+    response = client.post('/api/songs/', {
+        'title': 'Again', 'audio_file': SimpleUploadedFile('again.MP3', AUDIO),
+    })
+    assert response.status_code == 201
+    assert Song.objects.get(title='Again').audio_file.name == song.audio_file.name
+    assert not os.listdir(media_store.media_storage.path(media_store.BLOB_TMP_DIR))
+    print('    相同内容复用已有 blob，没有残留临时文件 ✓')
+
+
+def main():
+    print('=' * 60)
+    print('上传处理器测试')
+    print('=' * 60)
+    root = tempfile.mkdtemp(prefix='xmmcg_upload_')
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(MEDIA_ROOT=root):
+            test_hash_and_temp_file()
+            test_size_limit()
+            test_extension()
+            test_upload_view()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(root, ignore_errors=True)
+
+    print('\n' + '=' * 60)
+    print('✓ 全部通过')
+
+
+if __name__ == '__main__':
+    main()
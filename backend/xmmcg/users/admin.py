@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import UserProfile
+from .models import UserProfile, TokenTransaction
+from .token_service import TokenService
 
 
 @admin.register(UserProfile)
@@ -29,6 +30,45 @@ class UserProfileAdmin(admin.ModelAdmin):
     def reset_tokens(self, request, queryset):
         from django.conf import settings
         default_tokens = getattr(settings, 'DEFAULT_USER_TOKENS', 1000)
-        updated_count = queryset.update(token=default_tokens)
+        # 按差额批量调整并记入代币流水
+        deltas = {
+            user_id: default_tokens - token
+            for user_id, token in queryset.values_list('user_id', 'token')
+        }
+        TokenService.apply_deltas(deltas, reason='admin_adjust', memo='重置为默认值')
+        updated_count = len(deltas)
         self.message_user(request, f'已将 {updated_count} 个用户的token数量重置为默认值 {default_tokens}。')
+    
+    def save_model(self, request, obj, form, change):
+        """
+        后台新增资料时记一条期初流水；直接修改余额时，改为按差额原子更新并记入代币流水
+        （changeform_view 在事务中调用本方法，资料和流水一起提交）
+        """
+        if not change:
+            super().save_model(request, obj, form, change)
+            TokenService.record_opening(obj, memo=f'后台新增（{request.user.username}）')
+            return
+        if 'token' in form.changed_data:
+            new_token = obj.token
+            obj.token = form.initial['token']
+            super().save_model(request, obj, form, change)
+            TokenService.set_balance(obj.user, new_token, reason='admin_adjust', memo=f'后台修改（{request.user.username}）')
+            obj.token = new_token
+            return
+        super().save_model(request, obj, form, change)
+
 
+@admin.register(TokenTransaction)
+class TokenTransactionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'delta', 'balance_after', 'reason', 'memo', 'created_at')
+    list_filter = ('reason', 'created_at')
+    search_fields = ('user__username', 'memo')
+    readonly_fields = ('user', 'delta', 'balance_after', 'reason', 'memo', 'created_at')
+    ordering = ('-created_at', '-id')
+    
+    def has_add_permission(self, request):
+        # 流水只追加，只能由代币服务写入
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
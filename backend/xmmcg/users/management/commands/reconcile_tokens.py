@@ -0,0 +1,46 @@
+"""
+Django management command to reconcile cached token balances with the token ledger.
+
+Usage:
+    python manage.py reconcile_tokens          # 只报告不一致的用户
+    python manage.py reconcile_tokens --fix    # 用流水合计重建不一致的余额
+
+UserProfile.token 是 TokenTransaction 流水合计的缓存。本命令用一次聚合查询找出
+两者不一致的用户（例如绕过代币服务直接改库），--fix 时用一条 UPDATE 重建余额。
+"""
+
+from django.core.management.base import BaseCommand
+from users.token_service import TokenService
+
+
+class Command(BaseCommand):
+    help = '核对用户代币余额与代币流水，并可从流水重建余额'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='把不一致的余额重建为流水合计（默认只报告）',
+        )
+
+    def handle(self, *args, **options):
+        fix = options['fix']
+        report = TokenService.reconcile(fix=fix)
+
+        if not report:
+            self.stdout.write(self.style.SUCCESS('✓ 所有用户余额与代币流水一致'))
+            return
+
+        for row in report:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{row['username']} (id={row['user_id']}): "
+                    f"余额 {row['token']}，流水合计 {row['ledger_balance']}，"
+                    f"差额 {row['token'] - row['ledger_balance']:+d}"
+                )
+            )
+
+        if fix:
+            self.stdout.write(self.style.SUCCESS(f'✓ 已从流水重建 {len(report)} 个用户的余额'))
+        else:
+            self.stdout.write(self.style.WARNING(f'共 {len(report)} 个用户不一致，使用 --fix 从流水重建余额'))
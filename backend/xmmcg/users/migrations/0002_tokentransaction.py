@@ -0,0 +1,48 @@
+# Generated by Django 6.0.1 on 2026-10-17 19:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_opening_entries(apps, schema_editor):
+    """为已有用户写入期初流水，使流水合计与当前余额一致"""
+    UserProfile = apps.get_model('users', 'UserProfile')
+    TokenTransaction = apps.get_model('users', 'TokenTransaction')
+    TokenTransaction.objects.bulk_create(
+        [
+            TokenTransaction(user_id=user_id, delta=token, balance_after=token, reason='opening')
+            for user_id, token in UserProfile.objects.exclude(token=0).values_list('user_id', 'token')
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField(help_text='余额变化量（正数为增加，负数为扣除）')),
+                ('balance_after', models.IntegerField(help_text='本条流水之后的余额（运行余额）')),
+                ('reason', models.CharField(choices=[('opening', '期初余额'), ('add', '增加'), ('deduct', '扣除'), ('set', '余额修改'), ('bid_settlement', '竞标结算'), ('author_reward', '歌曲作者奖励'), ('admin_adjust', '管理员调整')], help_text='变动原因', max_length=30)),
+                ('memo', models.CharField(blank=True, default='', help_text='备注（如竞标轮次）', max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '代币流水',
+                'verbose_name_plural': '代币流水',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['user', 'id'], name='users_token_user_id_e2f0d6_idx')],
+            },
+        ),
+        migrations.RunPython(create_opening_entries, migrations.RunPython.noop),
+    ]
@@ -18,3 +18,40 @@ class UserProfile(models.Model):
 
     def __str__(self):
         return f"{self.user.username}'s profile"
+
+
+class TokenTransaction(models.Model):
+    """
+    代币流水（只追加）
+
+    每次余额变动追加一条记录；UserProfile.token 是流水累加结果的缓存，
+    可由 reconcile_tokens 命令从流水重建。
+    """
+
+    REASON_CHOICES = [
+        ('opening', '期初余额'),
+        ('add', '增加'),
+        ('deduct', '扣除'),
+        ('set', '余额修改'),
+        ('bid_settlement', '竞标结算'),
+        ('author_reward', '歌曲作者奖励'),
+        ('admin_adjust', '管理员调整'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='token_transactions')
+    delta = models.IntegerField(help_text='余额变化量（正数为增加，负数为扣除）')
+    balance_after = models.IntegerField(help_text='本条流水之后的余额（运行余额）')
+    reason = models.CharField(max_length=30, choices=REASON_CHOICES, help_text='变动原因')
+    memo = models.CharField(max_length=200, blank=True, default='', help_text='备注（如竞标轮次）')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = '代币流水'
+        verbose_name_plural = '代币流水'
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['user', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.delta:+d} -> {self.balance_after} ({self.get_reason_display()})"
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from .models import UserProfile
+from .token_service import TokenService
 
 USER_DEFAULT_TOKEN = 1000
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -62,7 +63,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         user.set_password(password)
         user.save()
         # 创建用户资料（包含 token）
-        UserProfile.objects.create(user=user, qqid=qqid, token=USER_DEFAULT_TOKEN) # 已经获得了QQID。
+        TokenService.create_profile(user, qqid=qqid, token=USER_DEFAULT_TOKEN) # 已经获得了QQID。
         return user
 
 
@@ -92,9 +93,7 @@ class UserDetailSerializer(serializers.ModelSerializer):
             return obj.profile.token
         except:
             # 如果没有 profile，创建一个
-            from .models import UserProfile
-            profile, created = UserProfile.objects.get_or_create(user=obj)
-            return profile.token
+            return TokenService.ensure_profile(obj).token
     
     def get_songsCount(self, obj):
         """获取用户上传的歌曲数量"""
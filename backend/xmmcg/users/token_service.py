@@ -0,0 +1,264 @@
+"""
+代币服务
+所有代币余额变动的唯一入口：
+
+- UserProfile.token 是缓存的当前余额，只在数据库端用 F() 表达式增减，不做 Python 端的读-改-写，
+  并发请求不会丢失更新
+- 扣除使用条件 UPDATE（WHERE token >= amount），余额不足时不产生任何写入
+- 每次变动追加一条 TokenTransaction 流水（变化量 + 变动后的运行余额），
+  余额可随时由流水重建（见 reconcile_tokens 命令）
+"""
+
+from itertools import islice
+from django.db import transaction, connection
+from django.db.models import F, Sum, Case, When, Value, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.core.exceptions import ValidationError
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .models import UserProfile, TokenTransaction
+
+
+# 批量写入时每条 SQL 的最大行数（SQLite 默认参数上限为 999）
+BULK_BATCH_SIZE = 500
+
+
+def _chunked(iterable, size):
+    """将可迭代对象按 size 切分为若干列表"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class TokenService:
+    """代币服务类"""
+
+    @staticmethod
+    @transaction.atomic
+    def create_profile(user, **fields):
+        """
+        创建用户资料；初始余额非零时记一条期初流水
+
+        Args:
+            user: 用户
+            **fields: 传给 UserProfile 的其他字段（如 qqid、token）
+        """
+        profile = UserProfile.objects.create(user=user, **fields)
+        TokenService.record_opening(profile)
+        return profile
+
+    @staticmethod
+    def record_opening(profile, memo=''):
+        """
+        为刚创建的用户资料记一条期初流水（初始余额为零时不记）
+
+        用于不经过 create_profile 创建资料的入口（如后台新增用户资料），
+        保证余额与流水合计一致。
+        """
+        if profile.token:
+            TokenTransaction.objects.create(
+                user=profile.user,
+                delta=profile.token,
+                balance_after=profile.token,
+                reason='opening',
+                memo=memo
+            )
+
+    @staticmethod
+    def ensure_profile(user, token=None):
+        """
+        获取用户资料，不存在时创建
+
+        Args:
+            user: 用户
+            token: 新建资料时的初始余额（None 表示使用模型默认值）
+        """
+        try:
+            return UserProfile.objects.get(user=user)
+        except UserProfile.DoesNotExist:
+            fields = {} if token is None else {'token': token}
+            return TokenService.create_profile(user, **fields)
+
+    @staticmethod
+    @transaction.atomic
+    def ensure_profiles(user_ids):
+        """
+        为缺少资料的用户批量补建资料（使用模型默认余额），并批量写入期初流水
+
+        Args:
+            user_ids: 用户ID集合或返回用户ID的子查询
+        """
+        missing = list(User.objects.filter(id__in=user_ids, profile__isnull=True).values_list('id', flat=True))
+        if not missing:
+            return 0
+        UserProfile.objects.bulk_create(
+            [UserProfile(user_id=user_id) for user_id in missing],
+            batch_size=BULK_BATCH_SIZE
+        )
+        opening = UserProfile._meta.get_field('token').get_default()
+        if opening:
+            TokenTransaction.objects.bulk_create(
+                [TokenTransaction(user_id=user_id, delta=opening, balance_after=opening, reason='opening')
+                 for user_id in missing],
+                batch_size=BULK_BATCH_SIZE
+            )
+        return len(missing)
+
+    @staticmethod
+    def _current_balance(user):
+        return UserProfile.objects.filter(user=user).values_list('token', flat=True).get()
+
+    @staticmethod
+    @transaction.atomic
+    def credit(user, amount, reason='add', memo=''):
+        """
+        增加余额：UPDATE ... SET token = token + amount，并追加流水
+
+        Returns:
+            int: 变动后的余额
+
+        Raises:
+            ValidationError: 用户资料不存在
+        """
+        updated = UserProfile.objects.filter(user=user).update(
+            token=F('token') + amount,
+            updated_at=timezone.now()
+        )
+        if not updated:
+            raise ValidationError('用户资料不存在')
+        # 同一事务内读取：该行已被本事务写锁定，读到的就是本次变动后的余额
+        balance = TokenService._current_balance(user)
+        TokenTransaction.objects.create(user=user, delta=amount, balance_after=balance, reason=reason, memo=memo)
+        return balance
+
+    @staticmethod
+    @transaction.atomic
+    def debit(user, amount, reason='deduct', memo=''):
+        """
+        扣除余额：UPDATE ... SET token = token - amount WHERE token >= amount，并追加流水
+
+        Returns:
+            int: 变动后的余额
+
+        Raises:
+            ValidationError: 用户资料不存在或余额不足（此时不做任何修改）
+        """
+        updated = UserProfile.objects.filter(user=user, token__gte=amount).update(
+            token=F('token') - amount,
+            updated_at=timezone.now()
+        )
+        if not updated:
+            try:
+                balance = TokenService._current_balance(user)
+            except UserProfile.DoesNotExist:
+                raise ValidationError('用户资料不存在')
+            raise ValidationError(f'Token 余额不足。当前余额: {balance}，无法扣除 {amount}')
+        balance = TokenService._current_balance(user)
+        TokenTransaction.objects.create(user=user, delta=-amount, balance_after=balance, reason=reason, memo=memo)
+        return balance
+
+    @staticmethod
+    @transaction.atomic
+    def set_balance(user, balance, reason='set', memo=''):
+        """
+        把余额设为指定值（锁定当前行后按差额更新并追加流水）
+
+        Returns:
+            tuple: (旧余额, 新余额)
+        """
+        old_balance = UserProfile.objects.select_for_update().filter(user=user).values_list(
+            'token', flat=True
+        ).get()
+        delta = balance - old_balance
+        if delta:
+            UserProfile.objects.filter(user=user).update(token=F('token') + delta, updated_at=timezone.now())
+            TokenTransaction.objects.create(user=user, delta=delta, balance_after=balance, reason=reason, memo=memo)
+        return old_balance, balance
+
+    @staticmethod
+    @transaction.atomic
+    def apply_deltas(deltas, reason, memo=''):
+        """
+        批量变动余额，并批量追加流水
+
+        每批生成一条
+            UPDATE ... SET token = token + CASE WHEN user_id IN (...) THEN d1 WHEN ... END
+            WHERE user_id IN (...)
+        同一批内变化量相同的用户合并到同一个 WHEN 分支；每批用户数受数据库单条语句参数上限约束
+        （SQLite 为 999，即每批 333 个用户）。随后一次读取变动后的余额，bulk_create 流水。
+
+        Args:
+            deltas: {user_id: 变化量}，变化量为 0 的用户忽略
+            reason / memo: 流水原因和备注
+
+        Returns:
+            dict: {user_id: 变动后的余额}
+        """
+        deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+        if not deltas:
+            return {}
+        max_params = connection.features.max_query_params
+        # 每个用户最多占用 3 个参数：WHEN 列表、WHERE 列表、THEN 值
+        batch_size = max(1, max_params // 3) if max_params else len(deltas)
+        now = timezone.now()
+        balances = {}
+        for chunk in _chunked(sorted(deltas), batch_size):
+            users_by_delta = {}
+            for user_id in chunk:
+                users_by_delta.setdefault(deltas[user_id], []).append(user_id)
+            UserProfile.objects.filter(user_id__in=chunk).update(
+                token=F('token') + Case(
+                    *[When(user_id__in=user_ids, then=Value(delta)) for delta, user_ids in users_by_delta.items()],
+                    default=Value(0),
+                    output_field=IntegerField()
+                ),
+                updated_at=now
+            )
+            balances.update(UserProfile.objects.filter(user_id__in=chunk).values_list('user_id', 'token'))
+
+        TokenTransaction.objects.bulk_create(
+            [TokenTransaction(user_id=user_id, delta=deltas[user_id], balance_after=balance,
+                              reason=reason, memo=memo)
+             for user_id, balance in balances.items()],
+            batch_size=BULK_BATCH_SIZE
+        )
+        return balances
+
+    @staticmethod
+    def _ledger_balance():
+        """按用户汇总流水的子查询（无流水时为 0）"""
+        total = TokenTransaction.objects.filter(user_id=OuterRef('user_id')).values('user_id').annotate(
+            total=Sum('delta')
+        ).values('total')
+        return Coalesce(Subquery(total), 0)
+
+    @staticmethod
+    @transaction.atomic
+    def reconcile(fix=False):
+        """
+        核对缓存余额与流水：一次聚合查询找出 UserProfile.token 与流水合计不一致的用户
+
+        Args:
+            fix: 是否用一条 UPDATE 把不一致的余额重建为流水合计
+
+        Returns:
+            list[dict]: 不一致的用户 {'user_id', 'username', 'token', 'ledger_balance'}
+        """
+        def mismatched():
+            return UserProfile.objects.alias(
+                ledger_balance=TokenService._ledger_balance()
+            ).exclude(token=F('ledger_balance'))
+        
+        report = [
+            {'user_id': user_id, 'username': username, 'token': token, 'ledger_balance': ledger_balance}
+            for user_id, username, token, ledger_balance in mismatched().annotate(
+                ledger_balance=TokenService._ledger_balance()
+            ).values_list('user_id', 'user__username', 'token', 'ledger_balance')
+        ]
+        if fix and report:
+            mismatched().update(token=TokenService._ledger_balance(), updated_at=timezone.now())
+        return report
@@ -15,6 +15,8 @@ from .serializers import (
     UpdateTokenSerializer,
 )
 from .models import UserProfile
+from .token_service import TokenService
+from django.core.exceptions import ValidationError
 
 
 @api_view(['POST'])
@@ -275,10 +277,7 @@ def get_user_token(request):
     GET: 返回用户的 token 余额
     """
     user = request.user
-    try:
-        profile = user.profile
-    except UserProfile.DoesNotExist:
-        profile = UserProfile.objects.create(user=user, token=0)
+    profile = TokenService.ensure_profile(user, token=0)
     
     return Response({
         'success': True,
@@ -297,20 +296,14 @@ def update_user_token(request):
         token: 新的 token 值（必须是非负整数）
     
     注：此操作通常由网站内部逻辑调用，前端应谨慎调用此端点
+    余额按差额原子更新并记入代币流水
     """
     user = request.user
     serializer = UpdateTokenSerializer(data=request.data)
     
     if serializer.is_valid():
-        try:
-            profile = user.profile
-        except UserProfile.DoesNotExist:
-            profile = UserProfile.objects.create(user=user, token=0)
-        
-        new_token = serializer.validated_data['token']
-        old_token = profile.token
-        profile.token = new_token
-        profile.save()
+        TokenService.ensure_profile(user, token=0)
+        old_token, new_token = TokenService.set_balance(user, serializer.validated_data['token'])
         
         return Response({
             'success': True,
@@ -354,15 +347,9 @@ def add_user_token(request):
             'message': '增加数量必须为正数，如需扣除请使用 /token/deduct/ 端点'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    try:
-        profile = user.profile
-    except UserProfile.DoesNotExist:
-        profile = UserProfile.objects.create(user=user, token=0)
-    
-    old_token = profile.token
-    new_token = old_token + amount
-    profile.token = new_token
-    profile.save()
+    TokenService.ensure_profile(user, token=0)
+    new_token = TokenService.credit(user, amount, reason='add')
+    old_token = new_token - amount
     
     return Response({
         'success': True,
@@ -411,23 +398,17 @@ def deduct_user_token(request):
             'message': '扣除数量必须大于 0'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    try:
-        profile = user.profile
-    except UserProfile.DoesNotExist:
-        profile = UserProfile.objects.create(user=user, token=0)
-    
-    old_token = profile.token
-    new_token = old_token - amount
+    TokenService.ensure_profile(user, token=0)
     
-    # 防止 token 变成负数
-    if new_token < 0:
+    # 条件扣除（WHERE token >= amount），防止 token 变成负数
+    try:
+        new_token = TokenService.debit(user, amount, reason='deduct')
+    except ValidationError as e:
         return Response({
             'success': False,
-            'message': f'Token 余额不足。当前余额: {old_token}，无法扣除 {amount}'
+            'message': e.messages[0]
         }, status=status.HTTP_400_BAD_REQUEST)
-    
-    profile.token = new_token
-    profile.save()
+    old_token = new_token + amount
     
     return Response({
         'success': True,
@@ -113,6 +113,22 @@ DATABASES = {
     }
 }
 
+# Cache
+# 排名快照、真爱票排行榜、评分者分析等缓存在评分 / 真爱票变化时主动删除，
+# 必须所有进程（各 gunicorn worker、管理命令）共用同一个缓存，不能使用默认的进程内 LocMemCache。
+# 默认使用数据库缓存表（部署和更新时运行 python manage.py createcachetable），
+# 也可以通过 CACHE_BACKEND / CACHE_LOCATION 改为 Redis 等共享后端。
+
+CACHES = {
+    "default": {
+        "BACKEND": config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        "LOCATION": config('CACHE_LOCATION', default='xmmcg_cache'),
+        "OPTIONS": {
+            "MAX_ENTRIES": config('CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -160,8 +176,17 @@ if not DEBUG:
 else:
     MEDIA_ROOT = BASE_DIR / "media"
 
+# 谱面资源包下载（songs/bundle.py）：缓存文件保存在 MEDIA_ROOT/bundles/
+# 为 True 时下载接口只返回 X-Accel-Redirect，由 nginx 发送文件（需配置 nginx.conf 中的 internal location）；
+# 为 False 时由 Django 直接返回文件（开发服务器）
+CHART_BUNDLE_X_ACCEL = config('CHART_BUNDLE_X_ACCEL', default=not DEBUG, cast=bool)
+CHART_BUNDLE_X_ACCEL_PREFIX = config('CHART_BUNDLE_X_ACCEL_PREFIX', default='/internal/chart-bundles/')
+
 # File Upload Settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 25 * 1024 * 1024  # 25MB (支持20MB视频文件)
+# 上传文件直接写入临时文件并在接收时计算 SHA-256、检查各字段大小和格式（songs/upload_handlers.py），
+# 不会按 FILE_UPLOAD_MAX_MEMORY_SIZE 把文件保留在内存中
+FILE_UPLOAD_HANDLERS = ['songs.upload_handlers.HashingFileUploadHandler']
+FILE_UPLOAD_MAX_MEMORY_SIZE = 25 * 1024 * 1024  # 25MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 25 * 1024 * 1024  # 25MB
 
 # CORS Configuration
@@ -194,11 +219,14 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
     'range',  # 支持范围请求，用于大文件下载
+    'if-range',  # 断点续传时校验文件未变化
+    'if-none-match',  # 条件请求（304）
 ]
 CORS_EXPOSE_HEADERS = [
     'content-range',
     'content-length',
     'accept-ranges',
+    'etag',
 ]
 
 # CSRF Configuration for SPA
@@ -280,6 +308,31 @@ MAJDATA_PASSWD_HASHED = config('MAJDATA_PASSWD_HASHED', default='123')
 # 互评系统配置
 PEER_REVIEW_TASKS_PER_USER = config('PEER_REVIEW_TASKS_PER_USER', default=8, cast=int)  # 每个用户需要完成的评分任务数
 PEER_REVIEW_MAX_SCORE = config('PEER_REVIEW_MAX_SCORE', default=50, cast=int)  # 互评满分
+# 额外评分（用户自主选择的谱面）是否计入谱面评分统计：exclude（默认，不计入）/ include（与分配的评分同等计入）
+PEER_REVIEW_EXTRA_REVIEW_POLICY = config('PEER_REVIEW_EXTRA_REVIEW_POLICY', default='exclude')
+# 互评任务分配后超过该小时数仍未完成即视为超期（进度看板）
+PEER_REVIEW_TASK_DEADLINE_HOURS = config('PEER_REVIEW_TASK_DEADLINE_HOURS', default=72, cast=int)
+# 互评进度看板的缓存时间（秒）
+REVIEW_PROGRESS_CACHE_TIMEOUT = config('REVIEW_PROGRESS_CACHE_TIMEOUT', default=30, cast=int)
+# 排名接口的默认计分方式：zscore（按评分者标准化）/ mean / trimmed / favorites（见 songs/ranking.py）
+ROUND_RANKING_DEFAULT_METHOD = config('ROUND_RANKING_DEFAULT_METHOD', default='zscore')
+# 排名快照的缓存时间（秒）
+ROUND_RANKING_CACHE_TIMEOUT = config('ROUND_RANKING_CACHE_TIMEOUT', default=600, cast=int)
+# 排名时排除带有这些标记的评分者的评分（逗号分隔，可选 constant,extreme,contrarian,biased；默认不排除，见 songs/review_analysis.py）
+ROUND_RANKING_EXCLUDE_FLAGS = config('ROUND_RANKING_EXCLUDE_FLAGS', default='', cast=Csv())
+# 评分者分析报告的缓存时间（秒，评分有新增时自动失效）
+REVIEW_ANALYSIS_CACHE_TIMEOUT = config('REVIEW_ANALYSIS_CACHE_TIMEOUT', default=3600, cast=int)
+# 真爱票排行榜的缓存时间（秒，真爱票变化时自动清除）
+FAVORITE_LEADERBOARD_CACHE_TIMEOUT = config('FAVORITE_LEADERBOARD_CACHE_TIMEOUT', default=300, cast=int)
+
+# ========= Bidding Allocation Settings =========
+# 竞标分配核心（songs/allocation.py）的计算后端：
+#   auto   - 安装了 NumPy 且竞标数达到阈值时使用 NumPy，否则使用纯 Python
+#   python - 纯 Python（与历史实现的随机数消耗顺序一致）
+#   numpy  - 强制使用 NumPy（需安装 numpy）
+BIDDING_ALLOCATION_BACKEND = config('BIDDING_ALLOCATION_BACKEND', default='auto')
+# 分配公平性模拟（songs/allocation_simulation.py）的工作进程数，0 表示使用 CPU 核数
+ALLOCATION_SIMULATION_WORKERS = config('ALLOCATION_SIMULATION_WORKERS', default=0, cast=int)
 # ==================== 可配置常量 ====================
 # 新用户注册时获得的默认代币数量
 DEFAULT_USER_TOKENS = 1000
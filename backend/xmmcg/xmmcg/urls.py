@@ -16,9 +16,12 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path, include
+import re
+
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from songs.downloads import serve_media
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -26,7 +29,9 @@ urlpatterns = [
     path("api/songs/", include("songs.urls")),
 ]
 
-# 在开发环境中提供媒体文件
+# 在开发环境中提供媒体文件（支持 ETag 和 Range，生产环境由 nginx 提供）
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media),
+    ]
     
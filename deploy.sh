@@ -120,6 +120,7 @@ fi
 echo "🗄️ 步骤 7/10: 初始化数据库..."
 cd $BACKEND_DIR
 $VENV_DIR/bin/python manage.py migrate
+$VENV_DIR/bin/python manage.py createcachetable
 
 echo "🔧 修复数据库权限 (SQLite 需要目录和文件写权限)..."
 chown www-data:www-data db.sqlite3
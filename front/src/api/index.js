@@ -274,6 +274,19 @@ export const getTargetBids = async (params) => {
   }
 }
 
+/**
+ * 批量获取目标行情（竞标数量、最高价、第二高价）
+ * @param {Object} params - { round_id: number, song_ids: string, chart_ids: string }（ID 以逗号分隔）
+ */
+export const getTargetMarketStats = async (params) => {
+  try {
+    const response = await api.get('/songs/bids/market/', { params })
+    return response
+  } catch (error) {
+    throw error
+  }
+}
+
 /**
  * 获取当前用户的竞标列表
  * @param {number} roundId - 轮次ID（可选）
@@ -550,6 +563,28 @@ export const submitReview = async (allocationId, score, comments = '', favorite
   }
 }
 
+/**
+ * 批量提交互评分数（全部成功或全部失败）
+ * @param {Array} reviews - [{ allocationId, score, comments, favorite }]
+ */
+export const submitReviewsBatch = async (reviews) => {
+  try {
+    await ensureCsrfToken()
+    const response = await api.post('/songs/peer-reviews/submit-batch/', {
+      reviews: reviews.map(review => ({
+        allocation_id: review.allocationId,
+        score: review.score,
+        comment: review.comments || '',
+        favorite: review.favorite || false
+      }))
+    })
+    return response
+  } catch (error) {
+    console.error('批量提交互评失败:', error)
+    throw error
+  }
+}
+
 /**
  * 提交额外的互评分数（用户自主选择的谱面）
  */
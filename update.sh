@@ -34,6 +34,7 @@ pip install -r $BACKEND_DIR/requirements.txt
 echo "🗄️ 步骤 3/6: 应用数据库迁移..."
 cd $BACKEND_DIR
 python manage.py migrate
+python manage.py createcachetable
 
 echo "📦 步骤 4/6: 收集静态文件..."
 python manage.py collectstatic --noinput